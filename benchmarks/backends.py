@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pylock.backends import BACKENDS  # noqa: E402
+from pylock.locker import lock_file, unlock_file  # noqa: E402
+
+
+def write_input(path: Path, size: int):
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for offset in range(0, size, len(block)):
+            f.write(block[: size - offset])
+
+
+def best_of(repeat: int, func) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare encryption backends")
+    parser.add_argument("-s", "--size-mb", type=int, default=256)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    results = {"size": size, "backends": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        source = tmp / "input.bin"
+        write_input(source, size)
+
+        for name in BACKENDS:
+            out_dir = tmp / name
+            out_dir.mkdir()
+            tar_paths = []
+
+            def lock():
+                result = lock_file(
+                    source, "benchmark", out_dir, log=False, backend=name
+                )
+                tar_paths.append(Path(result["tar_path"]))
+
+            def unlock():
+                unlock_file(tar_paths[-1], "benchmark")
+                (out_dir / source.name).unlink()
+
+            lock_seconds = best_of(args.repeat, lock)
+            unlock_seconds = best_of(args.repeat, unlock)
+            results["backends"][name] = {
+                "lock_mb_s": size / lock_seconds / 1_000_000,
+                "unlock_mb_s": size / unlock_seconds / 1_000_000,
+                "overhead_bytes": tar_paths[-1].stat().st_size - size,
+            }
+
+    print(json.dumps(results, indent=4))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=4), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
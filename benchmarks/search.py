@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from pylock.search import RESULT_LIMIT, SearchIndex  # noqa: E402
+
+
+WORDS = [
+    "report", "holiday", "video", "img", "dsc", "backup", "invoice", "song",
+    "movie", "data", "final", "draft", "photo", "scan", "notes", "项目", "照片",
+]  # fmt: skip
+EXTENSIONS = [".mp4", ".jpg", ".pdf", ".docx", ".mp3", ".csv", ".log", ".zip"]
+QUERIES = [
+    "holiday_1234", "invoice", "inv", "xyz9", ".mp4", "照片_42", "qwe", "dsc_0",
+    "report_9", "a1b2", "项目",
+]  # fmt: skip
+
+
+def generate_records(count: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    chars = string.ascii_letters + string.digits
+    return [
+        {
+            "id": i + 1,
+            "original_name": f"{rng.choice(WORDS)}_{rng.randint(0, 99999)}"
+            f"{rng.choice(EXTENSIONS)}",
+            "encrypted_name": "".join(rng.choices(chars, k=20)),
+        }
+        for i in range(count)
+    ]
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark history search")
+    parser.add_argument("-n", "--records", type=int, default=1_000_000)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=10.0,
+        help="Allowed p99 per query and per keystroke (default: 10)",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=RESULT_LIMIT,
+        help=f"Result limit, as in the history window (default: {RESULT_LIMIT}; "
+        "0 for none)",
+    )
+    parser.add_argument("-o", "--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    records = generate_records(args.records)
+    limit = args.limit or None
+
+    started = time.perf_counter()
+    index = SearchIndex()
+    index.add_many(records)
+    build_seconds = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index.bin")
+        started = time.perf_counter()
+        index.save(path, {})
+        save_seconds = time.perf_counter() - started
+        index_mb = os.path.getsize(path) / 1_000_000
+        started = time.perf_counter()
+        SearchIndex.load(path)
+        load_seconds = time.perf_counter() - started
+
+    cold = []
+    typed = []
+    for query in QUERIES:
+        index.last_result = None
+        started = time.perf_counter()
+        index.search(query, limit)
+        cold.append((time.perf_counter() - started) * 1000)
+
+        # Keystroke by keystroke from the first character, as the debounced
+        # GUI search sees it when typing slower than the debounce delay.
+        index.last_result = None
+        for end in range(1, len(query) + 1):
+            started = time.perf_counter()
+            index.search(query[:end], limit)
+            typed.append((time.perf_counter() - started) * 1000)
+
+    result = {
+        "records": args.records,
+        "limit": limit,
+        "build_seconds": build_seconds,
+        "save_seconds": save_seconds,
+        "load_seconds": load_seconds,
+        "index_mb": index_mb,
+        "cold_ms": {"p50": percentile(cold, 50), "p99": percentile(cold, 99)},
+        "typed_ms": {"p50": percentile(typed, 50), "p99": percentile(typed, 99)},
+        "mean_ms": statistics.mean(cold + typed),
+    }
+    print(json.dumps(result, indent=4))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=4), encoding="utf-8")
+
+    failed = False
+    for name in ("cold_ms", "typed_ms"):
+        if result[name]["p99"] > args.budget_ms:
+            print(f"{name} p99 above the {args.budget_ms} ms budget", file=sys.stderr)
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+# Modules that must stay out of `import pylock` and `pylock --help`; they
+# are only needed once a command actually runs.
+HEAVY_MODULES = [
+    "pyzipper",
+    "Cryptodome",
+    "cryptography",
+    "tarfile",
+    "sqlite3",
+    "concurrent.futures",
+    "multiprocessing",
+    "customtkinter",
+    "tkinter",
+]
+
+# Checked the way users start pylock; -X importtime lists every module a
+# run imports on stderr.
+COMMANDS = {
+    "import pylock": ["-c", "import pylock"],
+    "python -m pylock --help": ["-m", "pylock", "--help"],
+}
+
+
+def run(args: list[str]) -> float:
+    env = {**os.environ, "PYTHONPATH": str(SRC)}
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, *args],
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - started
+
+
+def loaded_modules(args: list[str]) -> set[str]:
+    env = {**os.environ, "PYTHONPATH": str(SRC)}
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    return {
+        line.rpartition("|")[2].strip()
+        for line in output.splitlines()
+        if line.startswith("import time:")
+    }
+
+
+def heavy_modules(args: list[str]) -> list[str]:
+    loaded = loaded_modules(args)
+    return sorted(
+        name
+        for name in HEAVY_MODULES
+        if any(m == name or m.startswith(f"{name}.") for m in loaded)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check CLI cold start time")
+    parser.add_argument(
+        "-n", "--runs", type=int, help="Timed runs (default: 20, 5 with --check)"
+    )
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=50.0,
+        help="Allowed p50 start time on top of a bare interpreter (default: 50)",
+    )
+    parser.add_argument("-o", "--output", help="Write results as JSON")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Quick pass/fail run for CI, printing one line instead of JSON",
+    )
+    args = parser.parse_args()
+    if args.runs is None:
+        args.runs = 5 if args.check else 20
+
+    # Interleave the runs so both see the same machine state.
+    bare = []
+    cli = []
+    for _ in range(args.runs):
+        bare.append(run(["-c", "pass"]))
+        cli.append(run(["-m", "pylock", "--help"]))
+
+    heavy = {command: heavy_modules(argv) for command, argv in COMMANDS.items()}
+
+    result = {
+        "runs": args.runs,
+        "bare_ms": statistics.median(bare) * 1000,
+        "cli_ms": statistics.median(cli) * 1000,
+        "overhead_ms": (statistics.median(cli) - statistics.median(bare)) * 1000,
+        "budget_ms": args.budget_ms,
+        "heavy_modules": heavy,
+    }
+    if not args.check:
+        print(json.dumps(result, indent=4))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=4), encoding="utf-8")
+
+    failed = False
+    for command, names in heavy.items():
+        if names:
+            print(f"{command} imported {', '.join(names)}", file=sys.stderr)
+            failed = True
+    if result["overhead_ms"] > args.budget_ms:
+        print(
+            f"Start time {result['overhead_ms']:.1f} ms is above the "
+            f"{args.budget_ms} ms budget",
+            file=sys.stderr,
+        )
+        failed = True
+    if failed:
+        sys.exit(1)
+    if args.check:
+        print(
+            f"OK: start time {result['overhead_ms']:.1f} ms "
+            f"(budget {args.budget_ms} ms), no heavy imports"
+        )
+
+
+if __name__ == "__main__":
+    main()
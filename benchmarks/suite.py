@@ -0,0 +1,512 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC))
+
+from pylock.backends import BACKENDS, DEFAULT_BACKEND  # noqa: E402
+from pylock.compression import COMPRESSION_CHOICES  # noqa: E402
+
+PASSWORD = "benchmark"
+SIZE_UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3}
+BLOCK_SIZE = 1024 * 1024
+# Repeat small cases until roughly this many bytes went through, so their
+# latency percentiles are not based on two or three samples.
+TARGET_BYTES = 256 * 1024 * 1024
+MIN_REPEAT = 3
+MAX_REPEAT = 50
+
+# Locking and unlocking stream every byte through once, so their logical
+# reads and writes per input byte stay near 1 on any machine, and a second
+# pass over the data shows up as ~2. Smaller inputs are dominated by
+# imports and headers and are not checked.
+MAX_IO_PER_BYTE = 1.1
+IO_CHECK_MIN_SIZE = 64 * 1024**2
+# Throughput drop, in percent, that --compare fails on.
+DEFAULT_THRESHOLD = 10.0
+
+WORDS = ["GET", "POST", "/api/files", "/login", "200", "404", "user", "upload"]
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper()
+    if text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def format_size(size: int) -> str:
+    for unit in ("G", "M", "K"):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return str(size)
+
+
+def text_block(rng: random.Random) -> bytes:
+    lines = []
+    size = 0
+    while size < BLOCK_SIZE:
+        line = (
+            f"2024-01-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:"
+            f"{rng.randint(0, 59):02d} {rng.choice(WORDS)} {rng.choice(WORDS)} "
+            f"id={rng.randint(0, 10**6)}\n"
+        )
+        lines.append(line)
+        size += len(line)
+    return "".join(lines).encode()[:BLOCK_SIZE]
+
+
+def write_input(path: Path, size: int, kind: str, seed: int = 0):
+    rng = random.Random(seed)
+    blocks = [text_block(rng) for _ in range(4)] if kind == "text" else None
+    with open(path, "wb") as f:
+        for index, offset in enumerate(range(0, size, BLOCK_SIZE)):
+            length = min(BLOCK_SIZE, size - offset)
+            if kind == "text":
+                f.write(blocks[index % len(blocks)][:length])
+            else:
+                f.write(os.urandom(length))
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def logical_io() -> dict:
+    # Bytes passed to read()/write() by this process, page cache included.
+    try:
+        with open("/proc/self/io", encoding="ascii") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return {}
+    return {"rchar": int(fields["rchar"]), "wchar": int(fields["wchar"])}
+
+
+# Case runners execute in a fresh child process (see run_case) so peak RSS
+# and block I/O counters belong to that case alone.
+
+
+def case_lock(case: dict) -> dict:
+    from pylock.locker import lock_file
+
+    latencies = []
+    for i in range(case["repeat"]):
+        started = time.perf_counter()
+        result = lock_file(
+            case["input"],
+            PASSWORD,
+            case["output_dir"],
+            log=False,
+            compression=case["compression"],
+            backend=case["backend"],
+        )
+        latencies.append(time.perf_counter() - started)
+        if i < case["repeat"] - 1:
+            os.remove(result["tar_path"])
+    return {
+        "latencies": latencies,
+        "elapsed": sum(latencies),
+        "tar_path": result["tar_path"],
+    }
+
+
+def case_unlock(case: dict) -> dict:
+    from pylock.locker import unlock_file
+
+    latencies = []
+    for _ in range(case["repeat"]):
+        started = time.perf_counter()
+        result = unlock_file(case["tar_path"], PASSWORD)
+        latencies.append(time.perf_counter() - started)
+        os.remove(result["decrypted_path"])
+    return {"latencies": latencies, "elapsed": sum(latencies)}
+
+
+def case_lock_batch(case: dict) -> dict:
+    from pylock.batch import lock_files
+
+    started = time.perf_counter()
+    summary = lock_files(
+        [case["input"]],
+        PASSWORD,
+        case["output_dir"],
+        workers=case["workers"],
+        compression=case["compression"],
+        backend=case["backend"],
+        log_path=case["log_path"],
+    )
+    if summary["failed"]:
+        raise RuntimeError(f"{summary['failed']} files failed to lock")
+    elapsed = time.perf_counter() - started
+    return {"latencies": [elapsed], "elapsed": elapsed}
+
+
+def case_verify_batch(case: dict) -> dict:
+    from pylock.batch import verify_files
+
+    summary = verify_files([case["input"]], PASSWORD, workers=case["workers"])
+    if summary["failed"]:
+        raise RuntimeError(f"{summary['failed']} archives failed to verify")
+    return {
+        "latencies": [r["elapsed"] for r in summary["results"]],
+        "elapsed": summary["elapsed"],
+    }
+
+
+def case_log_append(case: dict) -> dict:
+    from pylock.locker import update_ciphertext_log
+
+    latencies = []
+    for i in range(case["repeat"]):
+        started = time.perf_counter()
+        update_ciphertext_log(f"file_{i}.bin", f"{i:020d}", case["log_path"])
+        latencies.append(time.perf_counter() - started)
+    return {"latencies": latencies, "elapsed": sum(latencies)}
+
+
+CASES = {
+    "lock": case_lock,
+    "unlock": case_unlock,
+    "lock_batch": case_lock_batch,
+    "verify_batch": case_verify_batch,
+    "log_append": case_log_append,
+}
+
+
+def child_main(case: dict):
+    io_before = logical_io()
+    result = CASES[case["op"]](case)
+    io_after = logical_io()
+    result["logical_io"] = {key: io_after[key] - io_before[key] for key in io_after}
+    print(json.dumps(result))
+
+
+def run_case(case: dict) -> dict:
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--child", json.dumps(case)],
+        stdout=subprocess.PIPE,
+    )
+    output = process.stdout.read()
+    if hasattr(os, "wait4"):
+        # wait4 reports the child's usage including its own worker processes.
+        _, status, usage = os.wait4(process.pid, 0)
+        returncode = process.returncode = os.waitstatus_to_exitcode(status)
+    else:
+        returncode = process.wait()
+        usage = None
+    if returncode:
+        raise RuntimeError(f"Benchmark case failed: {case['name']}")
+
+    result = json.loads(output)
+    latencies = result["latencies"]
+    input_bytes = case["bytes"]
+    elapsed = result["elapsed"]
+
+    summary = {
+        "name": case["name"],
+        "op": case["op"],
+        "size": case.get("size"),
+        "kind": case.get("kind"),
+        "backend": case.get("backend"),
+        "compression": case.get("compression"),
+        "repeat": len(latencies),
+        "input_bytes": input_bytes,
+        "ops_s": len(latencies) / elapsed if elapsed else 0.0,
+        "mb_s": input_bytes / elapsed / 1_000_000 if input_bytes else None,
+        "latency_s": {
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+        },
+        "tar_path": result.get("tar_path"),
+    }
+    if usage is not None:
+        # ru_maxrss is in KiB on Linux and bytes on macOS; blocks are 512 B.
+        scale = 1 if sys.platform == "darwin" else 1024
+        summary["peak_rss_bytes"] = usage.ru_maxrss * scale
+    per_byte = input_bytes or 1
+    if usage is not None:
+        summary["disk_read_per_byte"] = usage.ru_inblock * 512 / per_byte
+        summary["disk_written_per_byte"] = usage.ru_oublock * 512 / per_byte
+    if result["logical_io"]:
+        summary["logical_read_per_byte"] = result["logical_io"]["rchar"] / per_byte
+        summary["logical_written_per_byte"] = result["logical_io"]["wchar"] / per_byte
+    return summary
+
+
+def file_cases(args, workdir: Path):
+    for size in args.sizes:
+        repeat = args.repeat or max(MIN_REPEAT, min(MAX_REPEAT, TARGET_BYTES // size))
+        for kind in args.kinds:
+            source = workdir / f"input_{kind}_{format_size(size)}.bin"
+            write_input(source, size, kind)
+            for backend in args.backends:
+                name = f"{kind}/{format_size(size)}/{backend}"
+                out_dir = workdir / name.replace("/", "_")
+                out_dir.mkdir()
+                lock = {
+                    "name": f"lock {name}",
+                    "op": "lock",
+                    "input": str(source),
+                    "output_dir": str(out_dir),
+                    "size": size,
+                    "kind": kind,
+                    "backend": backend,
+                    "compression": args.compression,
+                    "repeat": repeat,
+                    "bytes": size * repeat,
+                }
+                lock_result = yield lock
+                yield {
+                    **lock,
+                    "name": f"unlock {name}",
+                    "op": "unlock",
+                    "tar_path": lock_result["tar_path"],
+                }
+                shutil.rmtree(out_dir)
+            source.unlink()
+
+
+def batch_cases(args, workdir: Path):
+    source_dir = workdir / "batch_input"
+    source_dir.mkdir()
+    for i in range(args.batch_files):
+        write_input(source_dir / f"file_{i}.bin", args.batch_size, "random", seed=i)
+    out_dir = workdir / "batch_output"
+    out_dir.mkdir()
+
+    total = args.batch_files * args.batch_size
+    common = {
+        "size": args.batch_size,
+        "kind": "random",
+        "backend": args.backends[0],
+        "compression": args.compression,
+        "workers": args.workers,
+        "bytes": total,
+    }
+    name = f"{args.batch_files}x{format_size(args.batch_size)}"
+    yield {
+        **common,
+        "name": f"lock_batch {name}",
+        "op": "lock_batch",
+        "input": str(source_dir),
+        "output_dir": str(out_dir),
+        "log_path": str(workdir / "batch.db"),
+    }
+    yield {
+        **common,
+        "name": f"verify_batch {name}",
+        "op": "verify_batch",
+        "input": str(out_dir),
+    }
+
+
+def log_cases(args, workdir: Path):
+    from pylock.store import CiphertextLog
+
+    log_path = workdir / "history.db"
+    with CiphertextLog(log_path) as log:
+        log.conn.execute("BEGIN")
+        log.conn.executemany(
+            "INSERT INTO records (original_name, encrypted_name) VALUES (?, ?)",
+            ((f"existing_{i}.bin", f"{i:020d}") for i in range(args.log_records)),
+        )
+        log.conn.execute("COMMIT")
+
+    yield {
+        "name": f"log_append {args.log_records} existing",
+        "op": "log_append",
+        "log_path": str(log_path),
+        "repeat": args.log_appends,
+        # Appends are measured per call; their I/O is reported per append.
+        "bytes": None,
+    }
+
+
+def run_suite(args) -> dict:
+    results = []
+    workdir = Path(tempfile.mkdtemp(prefix="pylock-bench-", dir=args.workdir))
+    try:
+        for generator in (file_cases, batch_cases, log_cases):
+            if generator.__name__.split("_")[0] not in args.only:
+                continue
+            cases = generator(args, workdir)
+            result = None
+            while True:
+                try:
+                    case = cases.send(result)
+                except StopIteration:
+                    break
+                result = run_case(case)
+                results.append(result)
+                rate = (
+                    f"{result['mb_s']:9.1f} MB/s"
+                    if result["mb_s"] is not None
+                    else f"{result['ops_s']:9.1f} op/s"
+                )
+                print(
+                    f"{result['name']:40s} {rate} "
+                    f"p50 {result['latency_s']['p50'] * 1000:9.2f} ms "
+                    f"p99 {result['latency_s']['p99'] * 1000:9.2f} ms "
+                    f"rss {result.get('peak_rss_bytes', 0) / 1_000_000:7.1f} MB",
+                    file=sys.stderr,
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for result in results:
+        result.pop("tar_path", None)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": {
+                key: value for key, value in vars(args).items() if key != "output"
+            },
+        },
+        "results": results,
+    }
+
+
+def check_io(results: list[dict]) -> list[str]:
+    failures = []
+    for result in results:
+        if result["op"] not in ("lock", "unlock"):
+            continue
+        if (result["size"] or 0) < IO_CHECK_MIN_SIZE:
+            continue
+        for key in ("logical_read_per_byte", "logical_written_per_byte"):
+            value = result.get(key)
+            if value is not None and value > MAX_IO_PER_BYTE:
+                failures.append(
+                    f"{result['name']}: {key} {value:.2f} above {MAX_IO_PER_BYTE}"
+                )
+    return failures
+
+
+def compare(
+    baseline_path: str, current_path: str, threshold: float = DEFAULT_THRESHOLD
+) -> list[str]:
+    # Prints every shared case and returns those whose throughput dropped by
+    # more than threshold percent.
+    regressions = []
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    current = json.loads(Path(current_path).read_text(encoding="utf-8"))
+    before = {r["name"]: r for r in baseline["results"]}
+    for result in current["results"]:
+        old = before.get(result["name"])
+        if old is None:
+            continue
+        key, unit = (
+            ("mb_s", "MB/s") if result["mb_s"] is not None else ("ops_s", "op/s")
+        )
+        if not old[key]:
+            continue
+        change = (result[key] / old[key] - 1) * 100
+        regressed = change < -threshold
+        if regressed:
+            regressions.append(result["name"])
+        print(
+            f"{result['name']:40s} {old[key]:9.1f} -> {result[key]:9.1f} {unit} "
+            f"({change:+.1f}%), p99 {old['latency_s']['p99'] * 1000:.2f} -> "
+            f"{result['latency_s']['p99'] * 1000:.2f} ms"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark lock/unlock throughput, memory and disk I/O"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda text: [parse_size(s) for s in text.split(",")],
+        default="1K,1M,64M,1G",
+        help="Comma separated input sizes (default: 1K,1M,64M,1G)",
+    )
+    parser.add_argument(
+        "--kinds",
+        type=lambda text: text.split(","),
+        default="random,text",
+        help="random (incompressible) and/or text (compressible)",
+    )
+    parser.add_argument(
+        "--backends",
+        type=lambda text: text.split(","),
+        default=DEFAULT_BACKEND,
+        help=f"Comma separated backends ({', '.join(BACKENDS)})",
+    )
+    parser.add_argument("--compression", choices=COMPRESSION_CHOICES, default="auto")
+    parser.add_argument("--repeat", type=int, help="Runs per file case")
+    parser.add_argument("--batch-files", type=int, default=200)
+    parser.add_argument("--batch-size", type=parse_size, default="256K")
+    parser.add_argument("-j", "--workers", type=int)
+    parser.add_argument("--log-records", type=int, default=1_000_000)
+    parser.add_argument("--log-appends", type=int, default=200)
+    parser.add_argument(
+        "--only",
+        type=lambda text: text.split(","),
+        default="file,batch,log",
+        help="Case groups to run: file, batch, log",
+    )
+    parser.add_argument("--workdir", help="Directory for scratch files")
+    parser.add_argument("-o", "--output", help="Write results as JSON")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BASELINE", "CURRENT"),
+        help="Compare two result files instead of running",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Throughput drop in percent that --compare fails on "
+        f"(default: {DEFAULT_THRESHOLD:g})",
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child_main(json.loads(args.child))
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        if regressions:
+            print(
+                f"{len(regressions)} cases slower by more than {args.threshold:g}%",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        return
+
+    for backend in args.backends:
+        if backend not in BACKENDS:
+            parser.error(f"unknown backend {backend!r}")
+
+    results = run_suite(args)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=4), encoding="utf-8")
+    else:
+        print(json.dumps(results, indent=4))
+
+    failures = check_io(results["results"])
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
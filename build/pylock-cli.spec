@@ -0,0 +1,34 @@
+# CLI-only build: no GUI stack, and a one-folder layout so each run starts
+# straight from disk instead of unpacking a one-file archive first.
+#
+#     python -m PyInstaller build/pylock-cli.spec --clean
+
+from pathlib import Path
+
+ROOT = Path(SPECPATH).parent
+
+a = Analysis(
+    [str(ROOT / "build" / "pylock_cli.py")],
+    pathex=[str(ROOT / "src")],
+    excludes=[
+        "pylock.gui",
+        "customtkinter",
+        "darkdetect",
+        "tkinter",
+        "_tkinter",
+        "PIL",
+    ],
+    noarchive=False,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name="pylock",
+    console=True,
+    upx=False,
+)
+coll = COLLECT(exe, a.binaries, a.datas, name="pylock-cli", upx=False)
@@ -1,4 +1,34 @@
-from .locker import lock_file, unlock_file
-from .config import load_password
+# The public names are loaded on first access, so `import pylock` (and
+# `python -m pylock --help`) does not pull in the crypto and tar modules.
+_EXPORTS = {
+    "lock_file": "locker",
+    "unlock_file": "locker",
+    "verify_file": "locker",
+    "inspect_file": "locker",
+    "lock_files": "batch",
+    "verify_files": "batch",
+    "inspect_files": "batch",
+    "load_password": "config",
+    "WrongPasswordError": "errors",
+    "RandomAccessError": "errors",
+    "open_locked": "random_access",
+    "AsyncLocker": "aio",
+    "alock_file": "aio",
+    "aunlock_file": "aio",
+}
 
-__all__ = ["lock_file", "unlock_file", "load_password"]
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+
+    value = getattr(import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted([*globals(), *_EXPORTS])
@@ -1,34 +1,662 @@
 import argparse
 import sys
+from contextlib import nullcontext
 from pathlib import Path
 
-from .locker import lock_file, unlock_file
+# Only light modules at import time: locker and batch (tar, sqlite, the
+# crypto libraries, process pools) are imported by the commands that use
+# them, which keeps --help and argument errors fast.
+from .backends import BACKENDS, DEFAULT_BACKEND
+from .compression import COMPRESSION_CHOICES
 from .config import load_password
+from .profiling import Profiler
+from .progress import format_duration
 
+# The only backend that can continue an interrupted lock.
+RESUME_BACKEND = "aes-gcm"
 
-def main():
-    parser = argparse.ArgumentParser(description="Lock/unlock a file with encryption")
-    parser.add_argument("target", help="Path to the target file to lock or unlock")
+
+def add_compression_arguments(parser):
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSION_CHOICES,
+        default="stored",
+        help="Payload compression; 'auto' samples each file (default: stored)",
+    )
+    parser.add_argument("--level", type=int, help="Compression level for deflate/bzip2")
+
+
+def add_backend_argument(parser):
+    parser.add_argument(
+        "--backend",
+        choices=list(BACKENDS),
+        default=DEFAULT_BACKEND,
+        help=f"Encryption engine for new archives (default: {DEFAULT_BACKEND}); "
+        "unlocking detects it automatically",
+    )
+
+
+def format_compression(result) -> str:
+    size = result["size"]
+    saved = result["saved_bytes"]
+    ratio = saved / size * 100 if size else 0.0
+    return (
+        f"{result['compression']}, saved {saved / 1_000_000:.1f} MB ({ratio:.1f}%) "
+        f"in {result['compress_seconds']:.2f}s"
+    )
+
+
+class ProgressLine:
+    # Progress callback that redraws one status line on stderr.
+
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.drawn = False
+
+    def __call__(self, info):
+        total = info["total"]
+        if total:
+            line = (
+                f"{info['stage']:<8} {info['done'] / total * 100:5.1f}%  "
+                f"{info['done'] / 1_000_000:.1f}/{total / 1_000_000:.1f} MB  "
+                f"{info['rate'] / 1_000_000:.1f} MB/s  "
+                f"ETA {format_duration(info['eta'])}"
+            )
+        else:
+            # Streams from a pipe have no known total.
+            line = (
+                f"{info['stage']:<8} {info['done'] / 1_000_000:.1f} MB  "
+                f"{info['rate'] / 1_000_000:.1f} MB/s"
+            )
+        self.stream.write(f"\r{line:<79}")
+        self.stream.flush()
+        self.drawn = True
+
+    def close(self):
+        if self.drawn:
+            self.stream.write("\n")
+            self.drawn = False
+
+
+def report_profile(profiler: Profiler, breakdown: bool, trace_path: str | None):
+    if breakdown:
+        print(profiler.format_breakdown(), file=sys.stderr)
+    if trace_path:
+        profiler.write_chrome_trace(trace_path)
+        print(f"Trace written to {trace_path}", file=sys.stderr)
+
+
+def pipe(parser, args):
+    # `pylock lock -` / `pylock unlock -`: stdin to stdout, no temporary
+    # files. stdout carries the data, so every message goes to stderr.
+    if args.unlock:
+        if args.member is not None:
+            parser.error("--member is not supported when unlocking from stdin")
+    else:
+        if not args.name:
+            parser.error("--name is required when locking from stdin")
+        if args.compression == "auto":
+            parser.error("--compression auto is not supported with stdin")
+    if args.resume or args.chunk_size is not None:
+        parser.error("--resume and --chunk-size are not supported with stdin")
+    if sys.stdout.isatty():
+        parser.error("refusing to write binary data to a terminal")
+
+    from .locker import lock_stream, unlock_stream
+
+    password = load_password(args.config)
+    progress = ProgressLine() if sys.stderr.isatty() else None
+    profiler = Profiler() if args.profile or args.profile_trace else None
+
+    try:
+        try:
+            with profiler or nullcontext():
+                if args.unlock:
+                    result = unlock_stream(
+                        sys.stdin.buffer, sys.stdout.buffer, password, progress
+                    )
+                else:
+                    # Always aes-gcm, the engine that can be written front
+                    # to back; --backend does not apply.
+                    result = lock_stream(
+                        sys.stdin.buffer,
+                        sys.stdout.buffer,
+                        password,
+                        args.name,
+                        compression=args.compression,
+                        compresslevel=args.level,
+                        progress=progress,
+                    )
+        finally:
+            if progress:
+                progress.close()
+            if profiler:
+                report_profile(profiler, args.profile, args.profile_trace)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    except BrokenPipeError:
+        # The reader went away. Point stdout at /dev/null so the final
+        # flush at exit does not raise again.
+        import os
+
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.unlock:
+        print(
+            f"Decrypted {result['original_name']} "
+            f"({result['size'] / 1_000_000:.1f} MB)",
+            file=sys.stderr,
+        )
+    else:
+        print(f"Original name: {result['original_name']}", file=sys.stderr)
+        print(f"Encrypted name: {result['encrypted_name']}", file=sys.stderr)
+        print(f"Compression: {format_compression(result)}", file=sys.stderr)
+
+
+def lock_many(argv):
+    parser = argparse.ArgumentParser(
+        prog="pylock lock-many",
+        description="Lock many files in parallel",
+    )
+    parser.add_argument(
+        "targets", nargs="+", help="Files, directories or glob patterns to lock"
+    )
+    parser.add_argument(
+        "-c", "--config", default="config.json", help="Path to config file"
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="Directory for the .tar files (default: next to each input)",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        help="Number of worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip files that are unchanged or already locked elsewhere",
+    )
+    parser.add_argument(
+        "--cache", help="Cache for --incremental (default: lockcache.db)"
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        help="Files the cache remembers before evicting the oldest (default: 1000000)",
+    )
+    parser.add_argument(
+        "--rehash",
+        action="store_true",
+        help="With --incremental, hash every file again instead of "
+        "trusting size and mtime",
+    )
+    add_compression_arguments(parser)
+    add_backend_argument(parser)
+    args = parser.parse_args(argv)
+
+    from .batch import lock_files
+
+    password = load_password(args.config)
+
+    def report(entry):
+        if not entry["ok"]:
+            print(f"FAILED {entry['path']}: {entry['error']}", file=sys.stderr)
+        elif entry.get("status") == "duplicate":
+            print(
+                f"SKIP {entry['path']} -> {entry['tar_path']} "
+                f"[duplicate of {entry['original_name']}]"
+            )
+        elif entry.get("status", "locked") != "locked":
+            print(f"SKIP {entry['path']} -> {entry['tar_path']} [{entry['status']}]")
+        else:
+            print(
+                f"OK {entry['path']} -> {entry['tar_path']} "
+                f"[{format_compression(entry)}]"
+            )
+
+    summary = lock_files(
+        args.targets,
+        password,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        callback=report,
+        compression=args.compression,
+        compresslevel=args.level,
+        backend=args.backend,
+        incremental=args.incremental or args.rehash,
+        cache_path=args.cache,
+        cache_size=args.cache_size,
+        rehash=args.rehash,
+    )
+    skipped = ""
+    if args.incremental or args.rehash:
+        statuses = [entry.get("status") for entry in summary["results"]]
+        skipped = (
+            f" ({statuses.count('unchanged')} unchanged, "
+            f"{statuses.count('duplicate')} duplicates)"
+        )
+    print(
+        f"Locked {summary['succeeded']}/{len(summary['results'])} files{skipped}, "
+        f"{summary['total_bytes'] / 1_000_000:.1f} MB in {summary['elapsed']:.1f}s "
+        f"({summary['throughput']:.1f} MB/s)"
+    )
+    if summary["failed"]:
+        sys.exit(1)
+
+
+def verify(argv):
+    parser = argparse.ArgumentParser(
+        prog="pylock verify",
+        description="Check archives and password without writing plaintext",
+    )
+    parser.add_argument(
+        "targets", nargs="+", help=".tar files, directories or glob patterns"
+    )
+    parser.add_argument(
+        "-c", "--config", default="config.json", help="Path to config file"
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        help="Number of worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "-r",
+        "--report",
+        help="Write the JSON lines report to this file (default: stdout)",
+    )
+    args = parser.parse_args(argv)
+
+    from .batch import verify_files
+
+    password = load_password(args.config)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as report:
+            summary = verify_files(
+                args.targets, password, workers=args.workers, report=report
+            )
+    else:
+        summary = verify_files(
+            args.targets, password, workers=args.workers, report=sys.stdout
+        )
+
+    print(
+        f"Verified {summary['succeeded']}/{len(summary['results'])} archives, "
+        f"{summary['total_bytes'] / 1_000_000:.1f} MB in {summary['elapsed']:.1f}s "
+        f"({summary['throughput']:.1f} MB/s)",
+        file=sys.stderr,
+    )
+    if summary["failed"]:
+        sys.exit(1)
+
+
+def inspect(argv):
+    parser = argparse.ArgumentParser(
+        prog="pylock inspect",
+        description="Show original name, size and format of archives without "
+        "decrypting their contents",
+    )
+    parser.add_argument(
+        "targets", nargs="+", help=".tar files, directories or glob patterns"
+    )
+    parser.add_argument(
+        "-c", "--config", default="config.json", help="Path to config file"
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        help="Number of worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "-r",
+        "--report",
+        help="Write the JSON lines report to this file (default: stdout)",
+    )
+    parser.add_argument(
+        "--update-log",
+        action="store_true",
+        help="Add archives missing from the ciphertext log to it",
+    )
+    parser.add_argument(
+        "--files",
+        action="store_true",
+        help="List the files stored in multi-file archives",
+    )
+    args = parser.parse_args(argv)
+
+    from .batch import inspect_files
+
+    password = load_password(args.config)
+
+    with (
+        open(args.report, "w", encoding="utf-8") if args.report else nullcontext()
+    ) as report:
+        summary = inspect_files(
+            args.targets,
+            password,
+            workers=args.workers,
+            report=report or sys.stdout,
+            update_log=args.update_log,
+            list_files=args.files,
+        )
+
+    count = len(summary["results"])
+    rate = count / summary["elapsed"] if summary["elapsed"] else 0.0
+    print(
+        f"Inspected {summary['succeeded']}/{count} archives in "
+        f"{summary['elapsed']:.2f}s ({rate:.0f} archives/s)",
+        file=sys.stderr,
+    )
+    if summary["failed"]:
+        sys.exit(1)
+
+
+def watch(argv):
+    parser = argparse.ArgumentParser(
+        prog="pylock watch",
+        description="Lock new files as they appear in a directory",
+    )
+    parser.add_argument("directory", help="Directory to watch (recursively)")
+    parser.add_argument(
+        "-c", "--config", default="config.json", help="Path to config file"
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="Directory for the .tar files (default: the watched directory)",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        help="Number of worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=2.0,
+        help="Seconds a file must stay unchanged before it is locked (default: 2)",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=5.0,
+        help="Seconds between scans when polling (default: 5)",
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="Scan periodically instead of using inotify",
+    )
+    parser.add_argument(
+        "--journal",
+        help="State database (default: .pylock-watch.db in the directory)",
+    )
+    parser.add_argument(
+        "--remove-source",
+        action="store_true",
+        help="Delete each file once its archive is complete",
+    )
+    add_compression_arguments(parser)
+    add_backend_argument(parser)
+    args = parser.parse_args(argv)
+
+    import signal
+
+    from .watch import Watcher
+
+    password = load_password(args.config)
+
+    def report(entry):
+        if "mode" in entry:
+            print(f"Watching {entry['watching']} ({entry['mode']})", file=sys.stderr)
+        elif entry["ok"]:
+            print(f"OK {entry['path']} -> {entry['tar_path']}", flush=True)
+        else:
+            print(f"FAILED {entry['path']}: {entry['error']}", file=sys.stderr)
+
+    watcher = Watcher(
+        args.directory,
+        password,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        settle=args.settle,
+        interval=args.interval,
+        poll=args.poll,
+        journal_path=args.journal,
+        compression=args.compression,
+        compresslevel=args.level,
+        backend=args.backend,
+        remove_source=args.remove_source,
+        callback=report,
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    print("Stopped", file=sys.stderr)
+
+
+def serve(argv):
+    parser = argparse.ArgumentParser(
+        prog="pylock serve",
+        description="Serve the decrypted content of archives over HTTP",
+    )
+    parser.add_argument("directory", help="Directory with the .tar files")
+    parser.add_argument(
+        "-c", "--config", default="config.json", help="Path to config file"
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="Address to bind (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "-p", "--port", type=int, default=8000, help="Port (default: 8000)"
+    )
+    parser.add_argument(
+        "--handles",
+        type=int,
+        default=16,
+        help="Open archives to keep cached between requests (default: 16)",
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, help="Decryption threads (default: automatic)"
+    )
+    parser.add_argument(
+        "--allow-unauthenticated",
+        action="store_true",
+        help="Serve Range requests for winzip-aes archives too; their data "
+        "cannot be authenticated when read at random offsets",
+    )
+    args = parser.parse_args(argv)
+
+    import asyncio
+
+    from .serve import LockServer
+
+    password = load_password(args.config)
+    server = LockServer(
+        args.directory,
+        password,
+        handles=args.handles,
+        workers=args.workers,
+        allow_unauthenticated=args.allow_unauthenticated,
+    )
+
+    def ready(listener):
+        for sock in listener.sockets:
+            host, port = sock.getsockname()[:2]
+            print(f"Serving {args.directory} on http://{host}:{port}/", file=sys.stderr)
+
+    try:
+        asyncio.run(server.serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+COMMANDS = {
+    "lock-many": lock_many,
+    "verify": verify,
+    "inspect": inspect,
+    "watch": watch,
+    "serve": serve,
+}
+
+
+def main(argv=None):
+    if getattr(sys, "frozen", False):
+        # Lets worker processes of a PyInstaller build start up.
+        import multiprocessing
+
+        multiprocessing.freeze_support()
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    # `pylock lock X` and `pylock unlock X` spell out the default command.
+    if argv and argv[0] == "lock":
+        argv = argv[1:]
+    elif argv and argv[0] == "unlock":
+        argv = ["-u", *argv[1:]]
+
+    parser = argparse.ArgumentParser(
+        description="Lock/unlock a file with encryption",
+        epilog=f"Other commands: {', '.join(COMMANDS)} (see 'pylock <command> -h')",
+    )
+    parser.add_argument(
+        "target",
+        help="File to lock (a directory is packed into one archive) or archive "
+        "to unlock; '-' reads stdin and writes to stdout",
+    )
+    parser.add_argument(
+        "--name",
+        help="Original file name to store when locking from stdin",
+    )
     parser.add_argument(
         "-c", "--config", default="config.json", help="Path to config file"
     )
     parser.add_argument(
         "-u", "--unlock", action="store_true", help="Decrypt mode (unlock)"
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        metavar="MIB",
+        help="Split the payload into chunks of this many MiB and encrypt them "
+        "in parallel",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        help="Worker processes for chunked archives (default: CPU count)",
+    )
+    parser.add_argument(
+        "--member",
+        metavar="PATH",
+        help="Unlock only this file from a multi-file archive",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Checkpoint while locking and continue an interrupted lock of the "
+        "same file (no compression; uses the aes-gcm backend, the only one "
+        "that can resume)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print wall/CPU time and bytes per stage to stderr",
+    )
+    parser.add_argument(
+        "--profile-trace",
+        metavar="FILE",
+        help="Write per-stage timings as a Chrome trace JSON file",
+    )
+    add_compression_arguments(parser)
+    add_backend_argument(parser)
+    # None tells an explicit --backend apart from the default below.
+    parser.set_defaults(backend=None)
+    args = parser.parse_args(argv)
+
+    if args.resume and args.backend not in (None, RESUME_BACKEND):
+        parser.error(f"--resume needs the {RESUME_BACKEND} backend")
+    if args.backend is None:
+        args.backend = RESUME_BACKEND if args.resume else DEFAULT_BACKEND
+
+    if args.target == "-":
+        return pipe(parser, args)
+
+    from .locker import lock_file, unlock_file
+
+    if args.chunk_size is not None and args.chunk_size <= 0:
+        parser.error("--chunk-size must be positive")
+    if args.resume and args.unlock:
+        parser.error("--resume only applies to locking")
+    if args.member is not None and not args.unlock:
+        parser.error("--member only applies to unlocking")
 
     password = load_password(args.config)
+    # Only draw progress for interactive use, not for scripts or pipes.
+    progress = ProgressLine() if sys.stderr.isatty() else None
+    profiler = Profiler() if args.profile or args.profile_trace else None
 
     try:
+        try:
+            with profiler or nullcontext():
+                if args.unlock:
+                    result = unlock_file(
+                        args.target,
+                        password,
+                        workers=args.workers,
+                        progress=progress,
+                        member=args.member,
+                    )
+                else:
+                    result = lock_file(
+                        args.target,
+                        password,
+                        compression=args.compression,
+                        compresslevel=args.level,
+                        chunk_size=args.chunk_size and args.chunk_size * 1024 * 1024,
+                        workers=args.workers,
+                        backend=args.backend,
+                        progress=progress,
+                        resume=args.resume,
+                    )
+        finally:
+            if progress:
+                progress.close()
+            if profiler:
+                report_profile(profiler, args.profile, args.profile_trace)
+
         if args.unlock:
-            result = unlock_file(args.target, password)
             print(f"Success! Decrypted: {result['decrypted_path']}")
             print(f"Original name: {result['original_name']}")
         else:
-            result = lock_file(args.target, password)
             print(f"Success! Output: {result['tar_path']}")
             print(f"Original name: {result['original_name']}")
             print(f"Encrypted name: {result['encrypted_name']}")
+            print(f"Compression: {format_compression(result)}")
+            if result["resumed_from"]:
+                print(f"Resumed after {result['resumed_from'] / 1_000_000:.1f} MB")
+    except KeyboardInterrupt:
+        if args.resume:
+            print("Interrupted, rerun with --resume to continue", file=sys.stderr)
+        sys.exit(130)
     except FileNotFoundError as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
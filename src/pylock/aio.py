@@ -0,0 +1,211 @@
+import asyncio
+import atexit
+from pathlib import Path
+
+from .backends import DEFAULT_BACKEND
+from .locker import lock_file, unlock_file
+from .pool import default_workers
+from .store import CiphertextLog
+
+
+# Set in each worker process: one flag per job slot; the parent raises a
+# slot's flag to ask the job running in it to stop.
+_cancel_flags = None
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _init_worker(flags):
+    global _cancel_flags
+    _cancel_flags = flags
+
+
+def _cancel_check(slot: int):
+    # Runs as the progress callback, so a cancelled job notices within
+    # PROGRESS_INTERVAL; raising unwinds lock_file/unlock_file, which remove
+    # their partial output.
+    def check(info):
+        if _cancel_flags[slot]:
+            raise _Cancelled()
+
+    return check
+
+
+def _lock(slot: int, target_path: str, password: str, options: dict) -> dict:
+    return lock_file(
+        target_path,
+        password,
+        log=False,
+        workers=1,
+        progress=_cancel_check(slot),
+        **options,
+    )
+
+
+def _unlock(slot: int, tar_path: str, password: str, member: str | None) -> dict:
+    return unlock_file(
+        tar_path, password, workers=1, progress=_cancel_check(slot), member=member
+    )
+
+
+class AsyncLocker:
+    # Asyncio front end for embedding pylock in a service:
+    #
+    #     async with AsyncLocker(workers=4) as locker:
+    #         result = await locker.lock_file(path, password)
+    #
+    # Each job runs lock_file/unlock_file in a worker process, and at most
+    # `workers` jobs run at once; further calls wait their turn without
+    # holding a process. Reading, encrypting and writing are one streaming
+    # pass, so the job's file I/O runs in the same process as its crypto
+    # rather than shipping every block through a thread. The history log is
+    # written from a single thread, so the event loop never waits on SQLite.
+    # Cancelling a call stops its job and returns once the partial output
+    # has been removed.
+
+    def __init__(self, workers: int | None = None, log_path: str | Path | None = None):
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        from multiprocessing.sharedctypes import RawArray
+
+        self.workers = workers or default_workers()
+        self.log_path = log_path
+        self._flags = RawArray("b", self.workers)
+        self._slots = list(range(self.workers))
+        self._semaphore = asyncio.Semaphore(self.workers)
+        self._processes = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self._flags,),
+        )
+        self._io = ThreadPoolExecutor(max_workers=1)
+        self._log = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def close(self):
+        # Waits for running jobs and pending log writes.
+        self._processes.shutdown()
+        self._io.shutdown()
+        self._close_log()
+
+    def _close_log(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def _append_log(self, original_name: str, encrypted_name: str):
+        if self._log is None:
+            self._log = CiphertextLog(self.log_path)
+        self._log.append(original_name, encrypted_name)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        await self._semaphore.acquire()
+        slot = self._slots.pop()
+        self._flags[slot] = 0
+
+        def release():
+            self._slots.append(slot)
+            self._semaphore.release()
+
+        try:
+            future = self._processes.submit(func, slot, *args)
+        except BaseException:
+            release()
+            raise
+        # The slot is only handed out again once the worker is really done,
+        # even if the awaiting task was cancelled long before.
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(release))
+
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if not future.cancel():
+                self._flags[slot] = 1
+                try:
+                    await asyncio.wrap_future(future)
+                except BaseException:
+                    pass
+            raise
+
+    async def lock_file(
+        self,
+        target_path: str | Path,
+        password: str,
+        output_dir: Path | str | None = None,
+        log: bool = True,
+        compression: str = "stored",
+        compresslevel: int | None = None,
+        chunk_size: int | None = None,
+        backend: str = DEFAULT_BACKEND,
+    ) -> dict:
+        options = {
+            "output_dir": str(output_dir) if output_dir is not None else None,
+            "compression": compression,
+            "compresslevel": compresslevel,
+            "chunk_size": chunk_size,
+            "backend": backend,
+        }
+        result = await self._run(_lock, str(target_path), password, options)
+        if log:
+            # Shielded: once the archive exists its log entry is written,
+            # even if the caller gives up in the meantime.
+            loop = asyncio.get_running_loop()
+            await asyncio.shield(
+                loop.run_in_executor(
+                    self._io,
+                    self._append_log,
+                    result["original_name"],
+                    result["encrypted_name"],
+                )
+            )
+        return result
+
+    async def unlock_file(
+        self, tar_path: str | Path, password: str, member: str | None = None
+    ) -> dict:
+        return await self._run(_unlock, str(tar_path), password, member)
+
+
+# One shared locker per event loop for the module-level helpers. Lockers
+# of loops that have been closed since are shut down on the next call, the
+# rest at exit.
+_default_lockers = {}
+
+
+def _close_default_lockers():
+    while _default_lockers:
+        _default_lockers.popitem()[1].close()
+
+
+atexit.register(_close_default_lockers)
+
+
+def _default_locker() -> AsyncLocker:
+    loop = asyncio.get_running_loop()
+    for other in [other for other in _default_lockers if other.is_closed()]:
+        loop.run_in_executor(None, _default_lockers.pop(other).close)
+
+    locker = _default_lockers.get(loop)
+    if locker is None:
+        locker = _default_lockers[loop] = AsyncLocker()
+    return locker
+
+
+async def alock_file(target_path: str | Path, password: str, **options) -> dict:
+    return await _default_locker().lock_file(target_path, password, **options)
+
+
+async def aunlock_file(
+    tar_path: str | Path, password: str, member: str | None = None
+) -> dict:
+    return await _default_locker().unlock_file(tar_path, password, member)
@@ -0,0 +1,1009 @@
+import hashlib
+import hmac
+import json
+import os
+import random
+import shutil
+import string
+import struct
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+
+from .compression import (
+    COMPRESSION_METHODS,
+    TimedCompressor,
+    stream_compressor,
+    stream_decompressor,
+)
+from .errors import WrongPasswordError
+from .pool import imap_ordered
+from .progress import ProgressReader
+
+
+# pyzipper, pycryptodomex and cryptography take tens of milliseconds to
+# import, so they are imported inside the functions that use them; the CLI
+# only pays for them once it actually encrypts or decrypts something.
+
+CHUNK_SIZE = 1024 * 1024
+# Multi-file archives split files larger than this into several members so
+# that a large file is spread over several workers.
+MULTI_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Chunked archives store a JSON manifest in the .ciper member instead of the
+# bare original name. The NUL bytes cannot appear in a file name, so legacy
+# .ciper contents can never be mistaken for a manifest.
+MANIFEST_MAGIC = b"\0pylock-manifest\0"
+MANIFEST_VERSION = 1
+
+
+def generate_random_string(length: int = 20) -> str:
+    chars = string.ascii_letters + string.digits
+    return "".join(random.choice(chars) for _ in range(length))
+
+
+def _encode_manifest(manifest: dict) -> bytes:
+    return MANIFEST_MAGIC + json.dumps(manifest).encode("utf-8")
+
+
+def _decode_manifest(data: bytes) -> dict:
+    if data.startswith(MANIFEST_MAGIC):
+        manifest = json.loads(data[len(MANIFEST_MAGIC) :].decode("utf-8"))
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version: {manifest.get('version')}")
+        return manifest
+    return {"layout": "single", "name": data.decode("utf-8")}
+
+
+def _find_member(members, suffix: str, exclude: bool = False):
+    for member in members:
+        if (Path(member.filename).suffix == suffix) != exclude:
+            return member
+    return None
+
+
+class Backend:
+    # A cipher/container engine for the encrypted tar member. The member's
+    # suffix is the format tag: unlock_file picks the backend by it, so
+    # archives written by any registered engine unlock automatically.
+    name = ""
+    member_suffix = ""
+    # Whether archives can be read front to back without seeking
+    # (unlock_stream); write_stream is the writing counterpart.
+    can_stream = False
+
+    def write(
+        self,
+        fp,
+        target_path: Path,
+        password: str,
+        original_name: str,
+        encrypted_name: str,
+        compression: str = "stored",
+        compresslevel: int | None = None,
+        chunk_size: int | None = None,
+        workers: int | None = None,
+        progress=None,
+    ) -> dict:
+        # Encrypts target_path into fp and returns size, compressed_size
+        # and compress_seconds. progress, if given, is a Progress that gets
+        # the plaintext bytes as they are read.
+        raise NotImplementedError
+
+    def write_files(
+        self,
+        fp,
+        files: list,
+        password: str,
+        name: str,
+        compression: str = "stored",
+        compresslevel: int | None = None,
+        chunk_size: int | None = None,
+        workers: int | None = None,
+        progress=None,
+    ) -> dict:
+        # Encrypts many (path, archive path) pairs into fp as one archive
+        # with a "multi" manifest, returning the same stats as write().
+        raise ValueError(f"The {self.name} backend cannot store multiple files")
+
+    def open(self, fp, password: str):
+        # Returns a reader with .manifest (at least "layout" and "name"),
+        # .chunked, .payload_size, .describe(), .iter_payload(),
+        # .check_layout() and .close().
+        raise NotImplementedError
+
+    def write_stream(
+        self,
+        fp,
+        src,
+        password: str,
+        original_name: str,
+        compression: str = "stored",
+        compresslevel: int | None = None,
+        progress=None,
+    ) -> dict:
+        # Like write(), but reads the plaintext from the file object src
+        # until EOF and only ever writes forward to fp, so both ends can be
+        # pipes. The size is not known up front and is stored as None.
+        raise ValueError(f"The {self.name} backend cannot lock a stream")
+
+    def write_resumable(
+        self,
+        fp,
+        target_path: Path,
+        password: str,
+        original_name: str,
+        state: dict | None,
+        checkpoint,
+        progress=None,
+    ) -> dict:
+        # Like write() for an uncompressed payload, but continues from a
+        # `state` saved earlier (None starts fresh) and calls
+        # checkpoint(state) whenever everything before fp.tell() is enough
+        # to pick up again from that state. The stats gain "resumed_from",
+        # the number of input bytes that were already done.
+        raise ValueError(f"The {self.name} backend cannot resume an interrupted lock")
+
+
+def _write_encrypted_zip(
+    fp,
+    target_path: Path,
+    password: str,
+    encrypted_name: str,
+    cipher_file_name: str,
+    original_name: str,
+    compression: str = "stored",
+    compresslevel: int | None = None,
+    progress=None,
+) -> dict:
+    import pyzipper
+
+    with pyzipper.AESZipFile(fp, "w") as zf:
+        zf.setpassword(password.encode("utf-8"))
+        zf.setencryption(pyzipper.WZ_AES)
+        zf.writestr(cipher_file_name, original_name.encode("utf-8"))
+
+        zinfo = zf.zipinfo_cls.from_file(target_path, encrypted_name)
+        zinfo.compress_type = COMPRESSION_METHODS[compression]
+        zinfo._compresslevel = compresslevel
+        with open(target_path, "rb") as src, zf.open(zinfo, "w") as dest:
+            compressor = None
+            if dest._compressor is not None:
+                compressor = dest._compressor = TimedCompressor(dest._compressor)
+            if progress is not None:
+                src = ProgressReader(src, progress)
+            shutil.copyfileobj(src, dest, CHUNK_SIZE)
+
+    return {
+        "size": zinfo.file_size,
+        "compressed_size": _data_size(zinfo),
+        "compress_seconds": compressor.seconds if compressor else 0.0,
+    }
+
+
+def _encrypt_chunk(
+    path: str,
+    offset: int,
+    length: int,
+    name: str,
+    password: str,
+    compression: str,
+    compresslevel: int | None,
+    date_time: tuple,
+    part_path: str,
+):
+    # Runs in a worker process: streams one slice of the input into a
+    # throwaway zip at part_path, cut down to the raw member bytes (local
+    # header and encrypted data) for the parent to splice into the real
+    # archive. Only CHUNK_SIZE bytes are held at a time, whatever the slice
+    # length.
+    import pyzipper
+
+    with open(path, "rb") as src, open(part_path, "w+b") as part:
+        src.seek(offset)
+        with pyzipper.AESZipFile(part, "w") as zf:
+            zf.setpassword(password.encode("utf-8"))
+            zf.setencryption(pyzipper.WZ_AES)
+
+            zinfo = zf.zipinfo_cls(name, date_time)
+            zinfo.external_attr = 0o600 << 16
+            zinfo.compress_type = COMPRESSION_METHODS[compression]
+            zinfo._compresslevel = compresslevel
+            # Lets the zip64 decision see slices larger than 2 GiB.
+            zinfo.file_size = length
+            with zf.open(zinfo, "w") as dest:
+                compressor = None
+                if dest._compressor is not None:
+                    compressor = dest._compressor = TimedCompressor(dest._compressor)
+                remaining = length
+                while remaining and (data := src.read(min(CHUNK_SIZE, remaining))):
+                    dest.write(data)
+                    remaining -= len(data)
+            member_end = zf.start_dir
+        part.truncate(member_end)
+
+    return part_path, zinfo, compressor.seconds if compressor else 0.0
+
+
+def _append_member(zf, part_path: str, zinfo):
+    # Members come back from _encrypt_chunk in order and are appended exactly
+    # the way ZipFile.write would lay them out, so the central directory
+    # written on close describes them like any other member.
+    zf.fp.seek(zf.start_dir)
+    zinfo.header_offset = zf.fp.tell()
+    with open(part_path, "rb") as part:
+        shutil.copyfileobj(part, zf.fp, CHUNK_SIZE)
+    os.remove(part_path)
+    zf.start_dir = zf.fp.tell()
+    zf.filelist.append(zinfo)
+    zf.NameToInfo[zinfo.filename] = zinfo
+    zf._didModify = True
+
+
+def _parts_dir(fp):
+    # Encrypted slices are staged next to the archive being written rather
+    # than in a /tmp that may be RAM-backed; up to 2 * workers of them
+    # exist at once. The prefix keeps batch and watch runs off them.
+    name = getattr(fp, "name", None)
+    parent = os.path.dirname(os.path.abspath(name)) if isinstance(name, str) else None
+    return tempfile.TemporaryDirectory(
+        prefix=".pylock-parts-", dir=parent, ignore_cleanup_errors=True
+    )
+
+
+def _write_chunked_zip(
+    fp,
+    target_path: Path,
+    password: str,
+    cipher_file_name: str,
+    original_name: str,
+    chunk_size: int,
+    workers: int | None = None,
+    compression: str = "stored",
+    compresslevel: int | None = None,
+    progress=None,
+) -> dict:
+    import pyzipper
+
+    size = target_path.stat().st_size
+    count = max(1, -(-size // chunk_size))
+    chunk_names = [generate_random_string(20) for _ in range(count)]
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "layout": "chunked",
+        "name": original_name,
+        "size": size,
+        "chunk_size": chunk_size,
+        "chunks": chunk_names,
+    }
+    date_time = time.localtime(time.time())[:6]
+
+    stats = {"size": 0, "compressed_size": 0, "compress_seconds": 0.0}
+    with _parts_dir(fp) as parts, pyzipper.AESZipFile(fp, "w") as zf:
+        zf.setpassword(password.encode("utf-8"))
+        zf.setencryption(pyzipper.WZ_AES)
+        zf.writestr(cipher_file_name, _encode_manifest(manifest))
+
+        jobs = (
+            (
+                str(target_path),
+                index * chunk_size,
+                chunk_size,
+                name,
+                password,
+                compression,
+                compresslevel,
+                date_time,
+                os.path.join(parts, name),
+            )
+            for index, name in enumerate(chunk_names)
+        )
+        # Closed before the parts directory goes, so no worker is still
+        # writing into it.
+        with closing(imap_ordered(_encrypt_chunk, jobs, workers)) as results:
+            for part_path, zinfo, seconds in results:
+                _append_member(zf, part_path, zinfo)
+                stats["size"] += zinfo.file_size
+                stats["compressed_size"] += _data_size(zinfo)
+                stats["compress_seconds"] += seconds
+                if progress is not None:
+                    progress.update(zinfo.file_size)
+
+    if stats["size"] != size:
+        raise ValueError(f"File changed while locking: {target_path}")
+    return stats
+
+
+# WinZip AES local header: signature, versions, flags, method, time, date,
+# CRC, sizes, name and extra field lengths.
+_ZIP_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+_WZ_AES_KEY_LENGTHS = {1: 16, 2: 24, 3: 32}
+_WZ_AES_SALT_LENGTHS = {1: 8, 2: 12, 3: 16}
+# HMAC-SHA1 tag after each WinZip AES member's data.
+_WZ_AES_MAC_SIZE = 10
+
+
+def _data_size(zinfo) -> int:
+    # compress_size of a WinZip AES member also counts its salt, password
+    # verifier and HMAC; compression stats only want the data itself.
+    strength = getattr(zinfo, "wz_aes_strength", None)
+    if strength not in _WZ_AES_SALT_LENGTHS:
+        return zinfo.compress_size
+    return zinfo.compress_size - _WZ_AES_SALT_LENGTHS[strength] - 2 - _WZ_AES_MAC_SIZE
+
+
+def _check_zip_password(fp, info, password: bytes):
+    # WinZip AES stores a 2-byte password verifier after each member's salt.
+    # Checking the .ciper member's one costs a single 1000-round PBKDF2
+    # whatever the archive size; its HMAC is checked when it is read next.
+    if getattr(info, "wz_aes_strength", None) not in _WZ_AES_KEY_LENGTHS:
+        return
+    fp.seek(info.header_offset)
+    header = fp.read(_ZIP_LOCAL_HEADER.size)
+    if len(header) != _ZIP_LOCAL_HEADER.size:
+        raise ValueError("Truncated ZIP member header")
+    fields = _ZIP_LOCAL_HEADER.unpack(header)
+    fp.seek(fields[-2] + fields[-1], os.SEEK_CUR)
+
+    key_length = _WZ_AES_KEY_LENGTHS[info.wz_aes_strength]
+    salt_length = _WZ_AES_SALT_LENGTHS[info.wz_aes_strength]
+    encryption_header = fp.read(salt_length + 2)
+    if len(encryption_header) != salt_length + 2:
+        raise ValueError("Truncated ZIP member header")
+    derived = hashlib.pbkdf2_hmac(
+        "sha1", password, encryption_header[:salt_length], 1000, 2 * key_length + 2
+    )
+    if not hmac.compare_digest(derived[-2:], encryption_header[salt_length:]):
+        raise WrongPasswordError("Wrong password")
+
+
+def _write_multi_zip(
+    fp,
+    files: list,
+    password: str,
+    cipher_file_name: str,
+    name: str,
+    chunk_size: int,
+    workers: int | None = None,
+    compression: str = "stored",
+    compresslevel: int | None = None,
+    progress=None,
+) -> dict:
+    import pyzipper
+
+    entries = []
+    jobs = []
+    owners = []
+    for path, archive_path in files:
+        st = os.stat(path)
+        chunk_names = [
+            generate_random_string(20)
+            for _ in range(max(1, -(-st.st_size // chunk_size)))
+        ]
+        # Zip timestamps cannot predate 1980.
+        date_time = max(time.localtime(st.st_mtime)[:6], (1980, 1, 1, 0, 0, 0))
+        for index, chunk_name in enumerate(chunk_names):
+            jobs.append(
+                (
+                    str(path),
+                    index * chunk_size,
+                    chunk_size,
+                    chunk_name,
+                    password,
+                    compression,
+                    compresslevel,
+                    date_time,
+                )
+            )
+            owners.append(len(entries))
+        entries.append(
+            {
+                "path": archive_path,
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "chunks": chunk_names,
+            }
+        )
+
+    stats = {"size": 0, "compressed_size": 0, "compress_seconds": 0.0}
+    written = [0] * len(entries)
+    with _parts_dir(fp) as parts, pyzipper.AESZipFile(fp, "w") as zf:
+        zf.setpassword(password.encode("utf-8"))
+        zf.setencryption(pyzipper.WZ_AES)
+
+        jobs = (job + (os.path.join(parts, job[3]),) for job in jobs)
+        with closing(imap_ordered(_encrypt_chunk, jobs, workers)) as results:
+            for owner, (part_path, zinfo, seconds) in zip(owners, results):
+                _append_member(zf, part_path, zinfo)
+                written[owner] += zinfo.file_size
+                stats["size"] += zinfo.file_size
+                stats["compressed_size"] += _data_size(zinfo)
+                stats["compress_seconds"] += seconds
+                if progress is not None:
+                    progress.update(zinfo.file_size)
+
+        for entry, size in zip(entries, written):
+            if size != entry["size"]:
+                raise ValueError(f"File changed while locking: {entry['path']}")
+
+        # Written last, once every file is known to be complete; large
+        # listings are deflated.
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "layout": "multi",
+            "name": name,
+            "size": stats["size"],
+            "chunk_size": chunk_size,
+            "files": entries,
+        }
+        zf.writestr(
+            cipher_file_name,
+            _encode_manifest(manifest),
+            compress_type=COMPRESSION_METHODS["deflate"],
+        )
+
+    return stats
+
+
+class _ZipReader:
+    def __init__(self, fp, password: str):
+        import pyzipper
+
+        self.zf = pyzipper.AESZipFile(fp, "r")
+        try:
+            self.zf.setpassword(password.encode("utf-8"))
+            self.members = self.zf.infolist()
+
+            self.cipher_info = _find_member(self.members, ".ciper")
+            if self.cipher_info is None:
+                raise FileNotFoundError(".ciper file not found in ZIP")
+            _check_zip_password(fp, self.cipher_info, password.encode("utf-8"))
+            try:
+                data = self.zf.read(self.cipher_info)
+            except pyzipper.BadZipFile as e:
+                # The verifier lets one in 65536 wrong passwords through; the
+                # HMAC over the tiny .ciper entry catches the rest.
+                if "HMAC" not in str(e):
+                    raise
+                raise WrongPasswordError("Wrong password") from None
+            self.manifest = _decode_manifest(data)
+        except BaseException:
+            self.zf.close()
+            raise
+
+    def close(self):
+        self.zf.close()
+
+    @property
+    def chunked(self) -> bool:
+        return self.manifest["layout"] == "chunked"
+
+    @property
+    def files(self) -> list:
+        # Entries of a multi-file archive: path, size, mtime, chunks.
+        return self.manifest.get("files", [])
+
+    def _chunk_members(self, names) -> list:
+        infos = []
+        for name in names:
+            try:
+                infos.append(self.zf.getinfo(name))
+            except KeyError:
+                raise FileNotFoundError(f"Chunk {name} not found in ZIP") from None
+        return infos
+
+    def payload_members(self) -> list:
+        if self.manifest["layout"] == "multi":
+            return self._chunk_members(
+                name for entry in self.files for name in entry["chunks"]
+            )
+        if not self.chunked:
+            payload_info = _find_member(self.members, ".ciper", exclude=True)
+            if payload_info is None:
+                raise FileNotFoundError("Encrypted file not found in ZIP")
+            return [payload_info]
+        return self._chunk_members(self.manifest["chunks"])
+
+    def iter_file(self, entry: dict):
+        # Decrypts a single file of a multi-file archive: only its own
+        # members are read, located through the zip's central directory.
+        size = 0
+        for info in self._chunk_members(entry["chunks"]):
+            with self.zf.open(info) as src:
+                while chunk := src.read(CHUNK_SIZE):
+                    size += len(chunk)
+                    yield chunk
+        if size != entry["size"]:
+            raise ValueError(
+                f"{entry['path']} is {size} bytes, manifest says {entry['size']}"
+            )
+
+    @property
+    def payload_size(self) -> int:
+        return sum(info.file_size for info in self.payload_members())
+
+    def open_member(self, name: str):
+        return self.zf.open(name)
+
+    def describe(self) -> dict:
+        # Format details from the zip directory; nothing is decrypted.
+        infos = self.payload_members()
+        names = {v: k for k, v in COMPRESSION_METHODS.items()}
+        methods = sorted(
+            {names.get(i.compress_type, str(i.compress_type)) for i in infos}
+        )
+        details = {
+            "layout": self.manifest["layout"],
+            "compression": ",".join(methods),
+            "chunks": len(infos),
+        }
+        if self.manifest["layout"] == "multi":
+            details["files"] = len(self.files)
+        return details
+
+    def check_layout(self):
+        if len(self.members) != len(self.payload_members()) + 1:
+            raise ValueError(
+                f"Unexpected ZIP layout: {[m.filename for m in self.members]}"
+            )
+
+    def iter_payload(self):
+        # Reading each member to EOF makes pyzipper check the HMAC (and the
+        # CRC when one is stored).
+        for info in self.payload_members():
+            with self.zf.open(info) as src:
+                while chunk := src.read(CHUNK_SIZE):
+                    yield chunk
+
+
+class WinZipAESBackend(Backend):
+    # The original format: a WinZip AES-256 zip holding the payload and a
+    # .ciper member with the original name (or a chunk manifest).
+    name = "winzip-aes"
+    member_suffix = ".zip"
+
+    def write(
+        self,
+        fp,
+        target_path,
+        password,
+        original_name,
+        encrypted_name,
+        compression="stored",
+        compresslevel=None,
+        chunk_size=None,
+        workers=None,
+        progress=None,
+    ):
+        cipher_file_name = f"{generate_random_string(20)}.ciper"
+        if chunk_size:
+            return _write_chunked_zip(
+                fp,
+                target_path,
+                password,
+                cipher_file_name,
+                original_name,
+                chunk_size,
+                workers,
+                compression,
+                compresslevel,
+                progress,
+            )
+        return _write_encrypted_zip(
+            fp,
+            target_path,
+            password,
+            encrypted_name,
+            cipher_file_name,
+            original_name,
+            compression,
+            compresslevel,
+            progress,
+        )
+
+    def write_files(
+        self,
+        fp,
+        files,
+        password,
+        name,
+        compression="stored",
+        compresslevel=None,
+        chunk_size=None,
+        workers=None,
+        progress=None,
+    ):
+        return _write_multi_zip(
+            fp,
+            files,
+            password,
+            f"{generate_random_string(20)}.ciper",
+            name,
+            chunk_size or MULTI_CHUNK_SIZE,
+            workers,
+            compression,
+            compresslevel,
+            progress,
+        )
+
+    def open(self, fp, password):
+        return _ZipReader(fp, password)
+
+
+GCM_MAGIC = b"PYLKGCM1"
+GCM_KDF_ITERATIONS = 200_000
+# magic, PBKDF2-SHA256 iterations, salt
+GCM_HEADER = struct.Struct(">8sI16s")
+# ciphertext length, final flag
+GCM_RECORD = struct.Struct(">IB")
+GCM_TAG_SIZE = 16
+GCM_RECORD_SIZE = 4 * 1024 * 1024
+
+
+def _gcm_nonce(index: int, final: bool) -> bytes:
+    # Record index plus final flag (the STREAM construction): reordered,
+    # dropped or truncated records fail authentication.
+    return struct.pack(">QxxxB", index, final)
+
+
+class _GcmCipher:
+    # AES-256-GCM through OpenSSL when the optional cryptography package is
+    # installed (several times faster), otherwise through pycryptodomex,
+    # which pyzipper already depends on. Both produce the same bytes.
+
+    def __init__(self, key: bytes):
+        self.key = key
+        try:
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        except ImportError:
+            self.aead = None
+        else:
+            self.aead = AESGCM(key)
+
+    def seal(self, nonce: bytes, data, aad: bytes) -> bytes:
+        if self.aead is not None:
+            return self.aead.encrypt(nonce, data, aad)
+        from Cryptodome.Cipher import AES
+
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(aad)
+        ciphertext, tag = cipher.encrypt_and_digest(data)
+        return ciphertext + tag
+
+    def open(self, nonce: bytes, data, aad: bytes) -> bytes:
+        if self.aead is not None:
+            from cryptography.exceptions import InvalidTag
+
+            try:
+                return self.aead.decrypt(nonce, data, aad)
+            except InvalidTag:
+                raise ValueError("MAC check failed") from None
+        from Cryptodome.Cipher import AES
+
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(aad)
+        return cipher.decrypt_and_verify(data[:-GCM_TAG_SIZE], data[-GCM_TAG_SIZE:])
+
+
+def _read_full(src, size: int) -> bytes:
+    # Pipes return short reads; keep going until size bytes or EOF.
+    data = src.read(size)
+    if len(data) == size or not data:
+        return data
+    parts = [data]
+    remaining = size - len(data)
+    while remaining and (data := src.read(remaining)):
+        parts.append(data)
+        remaining -= len(data)
+    return b"".join(parts)
+
+
+class _GcmRecordWriter:
+    def __init__(self, fp, key: bytes, header: bytes):
+        self.fp = fp
+        self.cipher = _GcmCipher(key)
+        self.header = header
+        self.index = 0
+
+    def write(self, data, final: bool = False):
+        sealed = self.cipher.seal(_gcm_nonce(self.index, final), data, self.header)
+        self.fp.write(GCM_RECORD.pack(len(sealed) - GCM_TAG_SIZE, final))
+        self.fp.write(sealed)
+        self.index += 1
+
+
+class _GcmReader:
+    def __init__(self, fp, password: str):
+        self.fp = fp
+        self.header = fp.read(GCM_HEADER.size)
+        if len(self.header) != GCM_HEADER.size:
+            raise ValueError("Truncated AES-GCM header")
+        magic, iterations, salt = GCM_HEADER.unpack(self.header)
+        if magic != GCM_MAGIC:
+            raise ValueError("Not a pylock AES-GCM stream")
+        self.cipher = _GcmCipher(
+            hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+        )
+        self.index = 0
+        self.finished = False
+
+        data, final = self._read_record()
+        if final:
+            raise ValueError("AES-GCM stream has no payload")
+        self.manifest = json.loads(data.decode("utf-8"))
+
+    def close(self):
+        pass
+
+    @property
+    def chunked(self) -> bool:
+        return False
+
+    @property
+    def payload_size(self) -> int:
+        return self.manifest["size"]
+
+    def _read_record(self) -> tuple[bytes, bool]:
+        raw = self.fp.read(GCM_RECORD.size)
+        if len(raw) != GCM_RECORD.size:
+            raise ValueError("Truncated AES-GCM stream")
+        length, final = GCM_RECORD.unpack(raw)
+        body = self.fp.read(length + GCM_TAG_SIZE)
+        if len(body) != length + GCM_TAG_SIZE:
+            raise ValueError("Truncated AES-GCM stream")
+
+        try:
+            data = self.cipher.open(_gcm_nonce(self.index, final), body, self.header)
+        except ValueError:
+            # Record 0 only holds the manifest, so a wrong password is caught
+            # there before any payload record is read.
+            if self.index == 0:
+                raise WrongPasswordError("Wrong password") from None
+            raise ValueError(f"Corrupted record {self.index}") from None
+        self.index += 1
+        return data, bool(final)
+
+    def describe(self) -> dict:
+        return {
+            "layout": self.manifest["layout"],
+            "compression": self.manifest.get("compression", "stored"),
+            "chunks": 1,
+        }
+
+    def check_layout(self):
+        pass
+
+    def iter_payload(self):
+        if self.finished:
+            raise ValueError("AES-GCM payload can only be read once")
+        decompressor = stream_decompressor(self.manifest.get("compression", "stored"))
+        size = 0
+        final = False
+        while not final:
+            data, final = self._read_record()
+            if decompressor is not None:
+                data = decompressor.decompress(data)
+            size += len(data)
+            if data:
+                yield data
+        self.finished = True
+
+        if self.fp.read(1):
+            raise ValueError("Unexpected data after the final AES-GCM record")
+        # Streams locked from a pipe have no size in the manifest; the final
+        # record flag still rules out truncation.
+        if self.manifest["size"] is not None and size != self.manifest["size"]:
+            raise ValueError(
+                f"Payload is {size} bytes, manifest says {self.manifest['size']}"
+            )
+
+
+class AESGCMBackend(Backend):
+    # AES-256-GCM over large records with a PBKDF2-SHA256 key: one
+    # authenticated pass per record instead of WinZip AES's CTR encryption
+    # followed by a separate HMAC-SHA1 pass over the same data.
+    name = "aes-gcm"
+    member_suffix = ".pylock"
+    can_stream = True
+
+    def write(
+        self,
+        fp,
+        target_path,
+        password,
+        original_name,
+        encrypted_name,
+        compression="stored",
+        compresslevel=None,
+        chunk_size=None,
+        workers=None,
+        progress=None,
+    ):
+        if chunk_size:
+            raise ValueError(f"chunk_size is not supported by the {self.name} backend")
+
+        size = target_path.stat().st_size
+        with open(target_path, "rb") as src:
+            stats = self._write_records(
+                fp,
+                src,
+                password,
+                original_name,
+                size,
+                compression,
+                compresslevel,
+                progress,
+            )
+        if stats["size"] != size:
+            raise ValueError(f"File changed while locking: {target_path}")
+        return stats
+
+    def write_stream(
+        self,
+        fp,
+        src,
+        password,
+        original_name,
+        compression="stored",
+        compresslevel=None,
+        progress=None,
+    ):
+        return self._write_records(
+            fp, src, password, original_name, None, compression, compresslevel, progress
+        )
+
+    def _write_records(
+        self,
+        fp,
+        src,
+        password,
+        original_name,
+        size,
+        compression,
+        compresslevel,
+        progress,
+    ) -> dict:
+        salt = os.urandom(16)
+        header = GCM_HEADER.pack(GCM_MAGIC, GCM_KDF_ITERATIONS, salt)
+        key = hashlib.pbkdf2_hmac(
+            "sha256", password.encode("utf-8"), salt, GCM_KDF_ITERATIONS
+        )
+        fp.write(header)
+        records = _GcmRecordWriter(fp, key, header)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "layout": "stream",
+            "name": original_name,
+            "size": size,
+            "compression": compression,
+        }
+        records.write(json.dumps(manifest).encode("utf-8"))
+
+        compressor = stream_compressor(compression, compresslevel)
+        if compressor is not None:
+            compressor = TimedCompressor(compressor)
+
+        # Records may have any length. Each one is held back until the next
+        # arrives, so the last is always the one written with the final flag.
+        read = compressed = 0
+        pending = b""
+        while block := _read_full(src, GCM_RECORD_SIZE):
+            read += len(block)
+            if progress is not None:
+                progress.update(len(block))
+            if compressor is not None:
+                block = compressor.compress(block)
+                if not block:
+                    continue
+            if pending:
+                records.write(pending)
+                compressed += len(pending)
+            pending = block
+
+        if compressor is not None:
+            pending += compressor.flush()
+        records.write(pending, final=True)
+        compressed += len(pending)
+
+        return {
+            "size": read,
+            "compressed_size": compressed,
+            "compress_seconds": compressor.seconds if compressor else 0.0,
+        }
+
+    def write_resumable(
+        self,
+        fp,
+        target_path,
+        password,
+        original_name,
+        state,
+        checkpoint,
+        progress=None,
+    ):
+        # Record nonces only depend on the record index, so a stream can be
+        # continued from any record boundary given the salt and the index.
+        size = target_path.stat().st_size
+        if state is None:
+            salt = os.urandom(16)
+            iterations = GCM_KDF_ITERATIONS
+        else:
+            salt = bytes.fromhex(state["salt"])
+            iterations = state["iterations"]
+        header = GCM_HEADER.pack(GCM_MAGIC, iterations, salt)
+        key = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+        # Lets a resumed run reject a different password before it appends
+        # records that could never be decrypted together with the old ones.
+        verifier = hmac.new(key, b"pylock-resume", "sha256").hexdigest()
+        records = _GcmRecordWriter(fp, key, header)
+
+        if state is None:
+            fp.write(header)
+            manifest = {
+                "version": MANIFEST_VERSION,
+                "layout": "stream",
+                "name": original_name,
+                "size": size,
+                "compression": "stored",
+            }
+            records.write(json.dumps(manifest).encode("utf-8"))
+            state = {
+                "salt": salt.hex(),
+                "iterations": iterations,
+                "verifier": verifier,
+                "read": 0,
+                "records": records.index,
+            }
+        elif not hmac.compare_digest(verifier, state["verifier"]):
+            raise WrongPasswordError("Password does not match the interrupted lock")
+        else:
+            records.index = state["records"]
+
+        resumed_from = read = state["read"]
+        pending = b""
+        with open(target_path, "rb") as src:
+            src.seek(read)
+            while block := src.read(GCM_RECORD_SIZE):
+                if pending:
+                    records.write(pending)
+                    # Everything up to `read` is now covered by records.
+                    checkpoint(dict(state, read=read, records=records.index))
+                read += len(block)
+                if progress is not None:
+                    progress.update(len(block))
+                pending = block
+        records.write(pending, final=True)
+
+        if read != size:
+            raise ValueError(f"File changed while locking: {target_path}")
+        return {
+            "size": size,
+            "compressed_size": size,
+            "compress_seconds": 0.0,
+            "resumed_from": resumed_from,
+        }
+
+    def open(self, fp, password):
+        return _GcmReader(fp, password)
+
+
+BACKENDS = {backend.name: backend for backend in (WinZipAESBackend(), AESGCMBackend())}
+DEFAULT_BACKEND = WinZipAESBackend.name
+
+
+def get_backend(name: str) -> Backend:
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown backend {name!r}, expected one of {', '.join(BACKENDS)}"
+        ) from None
+
+
+def backend_for_member(name: str) -> Backend | None:
+    suffix = Path(name).suffix
+    for backend in BACKENDS.values():
+        if backend.member_suffix == suffix:
+            return backend
+    return None
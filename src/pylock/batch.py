@@ -0,0 +1,403 @@
+import glob
+import json
+import os
+import time
+from pathlib import Path
+
+from .backends import DEFAULT_BACKEND
+from .locker import inspect_file, lock_file, verify_file
+from .pool import imap_unordered
+from .store import CiphertextLog
+
+
+def is_pylock_output(name: str) -> bool:
+    # Archives, partial archives and the .pylock* state files pylock writes
+    # itself; locking these again would nest archives on every run.
+    return name.startswith(".pylock") or name.endswith(
+        (".tar", ".part", ".pylock-part", ".pylock-checkpoint")
+    )
+
+
+def expand_targets(
+    targets, suffix: str | None = None, skip_outputs: bool = False, exclude=None
+) -> list[Path]:
+    # skip_outputs leaves out pylock's own files (see is_pylock_output) and
+    # anything below the exclude directory, e.g. the output of a lock run.
+    exclude = os.path.abspath(exclude) if exclude is not None else None
+    paths = []
+    seen = set()
+    for target in targets:
+        target_path = Path(target)
+        if target_path.is_dir():
+            candidates = sorted(
+                p
+                for p in target_path.rglob("*")
+                if p.is_file() and (suffix is None or p.suffix == suffix)
+            )
+        elif target_path.exists():
+            candidates = [target_path]
+        else:
+            matches = sorted(glob.glob(str(target), recursive=True))
+            candidates = [Path(m) for m in matches if os.path.isfile(m)]
+            if not matches:
+                # Keep unmatched targets so they are reported as failures.
+                candidates = [target_path]
+
+        for candidate in candidates:
+            key = os.path.abspath(candidate)
+            if skip_outputs and (
+                is_pylock_output(candidate.name)
+                or (exclude is not None and _is_below(key, exclude))
+            ):
+                continue
+            if key not in seen:
+                seen.add(key)
+                paths.append(candidate)
+
+    return paths
+
+
+def _is_below(path: str, directory: str) -> bool:
+    try:
+        return os.path.commonpath([path, directory]) == directory
+    except ValueError:
+        # Different drives on Windows.
+        return False
+
+
+def _summarize(results: list, total_bytes: int, started: float) -> dict:
+    elapsed = time.perf_counter() - started
+    succeeded = sum(1 for r in results if r["ok"])
+    return {
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "total_bytes": total_bytes,
+        "elapsed": elapsed,
+        "throughput": total_bytes / elapsed / 1_000_000 if elapsed else 0.0,
+    }
+
+
+def _lock_one(
+    path: str,
+    password: str,
+    output_dir: str | None,
+    compression: str,
+    compresslevel: int | None,
+    backend: str,
+) -> dict:
+    return lock_file(
+        path,
+        password,
+        output_dir,
+        log=False,
+        compression=compression,
+        compresslevel=compresslevel,
+        backend=backend,
+    )
+
+
+def lock_files(
+    targets,
+    password: str,
+    output_dir: Path | str | None = None,
+    workers: int | None = None,
+    callback=None,
+    compression: str = "stored",
+    compresslevel: int | None = None,
+    backend: str = DEFAULT_BACKEND,
+    log_path: Path | str | None = None,
+    incremental: bool = False,
+    cache_path: Path | str | None = None,
+    cache_size: int | None = None,
+    rehash: bool = False,
+) -> dict:
+    # incremental skips files the cache says are already locked; see
+    # _lock_incremental.
+    paths = expand_targets(targets, skip_outputs=True, exclude=output_dir)
+    output_dir = str(output_dir) if output_dir is not None else None
+
+    if incremental:
+        return _lock_incremental(
+            paths,
+            password,
+            output_dir,
+            workers,
+            callback,
+            compression,
+            compresslevel,
+            backend,
+            log_path,
+            cache_path,
+            cache_size,
+            rehash,
+        )
+
+    started = time.perf_counter()
+    results = [None] * len(paths)
+    total_bytes = 0
+
+    work = (
+        (str(path), password, output_dir, compression, compresslevel, backend)
+        for path in paths
+    )
+    with CiphertextLog(log_path) as log:
+        for index, result, error in imap_unordered(_lock_one, work, workers):
+            if error is None:
+                log.append(result["original_name"], result["encrypted_name"])
+                total_bytes += result["size"]
+                entry = {"path": str(paths[index]), "ok": True, **result}
+            else:
+                entry = {"path": str(paths[index]), "ok": False, "error": str(error)}
+
+            results[index] = entry
+            if callback:
+                callback(entry)
+
+    return _summarize(results, total_bytes, started)
+
+
+def _lock_incremental(
+    paths: list[Path],
+    password: str,
+    output_dir: str | None,
+    workers: int | None,
+    callback,
+    compression: str,
+    compresslevel: int | None,
+    backend: str,
+    log_path: Path | str | None,
+    cache_path: Path | str | None,
+    cache_size: int | None,
+    rehash: bool,
+) -> dict:
+    # Three passes over the batch:
+    #   1. stat each file; one whose size and mtime match the cache and whose
+    #      archive still exists is "unchanged" and never read,
+    #   2. hash the rest in parallel; content that already has an archive
+    #      (a moved or copied file) is a "duplicate" and is not encrypted,
+    #   3. lock what is left, once per distinct content.
+    # Entries carry a "status" of locked, unchanged or duplicate. rehash
+    # ignores the stat shortcut and hashes every file again.
+    from .cache import DEFAULT_MAX_ENTRIES, LockCache, hash_file
+
+    started = time.perf_counter()
+    results = [None] * len(paths)
+    total_bytes = 0
+    keys = [os.path.abspath(path) for path in paths]
+
+    def finish(index: int, entry: dict):
+        results[index] = entry
+        if callback:
+            callback(entry)
+
+    def fail(index: int, error: Exception):
+        finish(index, {"path": str(paths[index]), "ok": False, "error": str(error)})
+
+    def reuse(index: int, status: str, archive: dict):
+        finish(
+            index,
+            {
+                "path": str(paths[index]),
+                "ok": True,
+                "status": status,
+                "original_name": archive["original_name"],
+                "encrypted_name": archive["encrypted_name"],
+                "tar_path": archive["tar_path"],
+            },
+        )
+
+    with (
+        LockCache(cache_path, cache_size or DEFAULT_MAX_ENTRIES) as cache,
+        CiphertextLog(log_path) as log,
+    ):
+        key = cache.key_for(password)
+
+        to_hash = []
+        known = {}
+        # digest -> indexes of the files with that content still to lock
+        to_lock = {}
+        for index, path in enumerate(keys):
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                fail(index, e)
+                continue
+            digest = cache.lookup(path, st.st_size, st.st_mtime_ns)
+            if digest is None or rehash:
+                known[index] = digest
+                to_hash.append(index)
+                continue
+            archive = cache.archive(digest, key)
+            if archive is None:
+                to_lock.setdefault(digest, []).append(index)
+            else:
+                reuse(index, "unchanged", archive)
+        cache.commit()
+
+        work = ((keys[index],) for index in to_hash)
+        for position, hashed, error in imap_unordered(hash_file, work, workers):
+            index = to_hash[position]
+            if error is not None:
+                fail(index, error)
+                continue
+            digest, size, mtime_ns = hashed
+            cache.remember_file(keys[index], size, mtime_ns, digest)
+            archive = cache.archive(digest, key)
+            if archive is None:
+                to_lock.setdefault(digest, []).append(index)
+            else:
+                if known.get(index) == digest:
+                    reuse(index, "unchanged", archive)
+                else:
+                    log.append(
+                        paths[index].name,
+                        archive["encrypted_name"],
+                        duplicate_of=archive["original_name"],
+                    )
+                    reuse(index, "duplicate", archive)
+        cache.commit()
+
+        digests = list(to_lock)
+        work = (
+            (
+                keys[to_lock[digest][0]],
+                password,
+                output_dir,
+                compression,
+                compresslevel,
+                backend,
+            )
+            for digest in digests
+        )
+        for position, result, error in imap_unordered(_lock_one, work, workers):
+            digest = digests[position]
+            first, *copies = to_lock[digest]
+            if error is not None:
+                for index in (first, *copies):
+                    fail(index, error)
+                continue
+            cache.remember_archive(digest, key, result)
+            cache.commit()
+            log.append(result["original_name"], result["encrypted_name"])
+            total_bytes += result["size"]
+            finish(
+                first,
+                {"path": str(paths[first]), "ok": True, "status": "locked", **result},
+            )
+            for index in copies:
+                log.append(
+                    paths[index].name,
+                    result["encrypted_name"],
+                    duplicate_of=result["original_name"],
+                )
+                reuse(index, "duplicate", result)
+
+        cache.evict()
+
+    return _summarize(results, total_bytes, started)
+
+
+def _verify_one(path: str, password: str) -> dict:
+    started = time.perf_counter()
+    result = verify_file(path, password)
+    result["elapsed"] = time.perf_counter() - started
+    return result
+
+
+def verify_files(
+    targets,
+    password: str,
+    workers: int | None = None,
+    report=None,
+    callback=None,
+) -> dict:
+    paths = expand_targets(targets, suffix=".tar")
+
+    started = time.perf_counter()
+    results = [None] * len(paths)
+    total_bytes = 0
+
+    work = ((str(path), password) for path in paths)
+    for index, result, error in imap_unordered(_verify_one, work, workers):
+        if error is None:
+            total_bytes += result["size"]
+            entry = {
+                "path": str(paths[index]),
+                "ok": True,
+                "original_name": result["original_name"],
+                "size": result["size"],
+                "elapsed": result["elapsed"],
+                "throughput": (
+                    result["size"] / result["elapsed"] / 1_000_000
+                    if result["elapsed"]
+                    else 0.0
+                ),
+            }
+        else:
+            entry = {
+                "path": str(paths[index]),
+                "ok": False,
+                "error": f"{type(error).__name__}: {error}",
+            }
+
+        results[index] = entry
+        if report is not None:
+            report.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            report.flush()
+        if callback:
+            callback(entry)
+
+    return _summarize(results, total_bytes, started)
+
+
+def inspect_files(
+    targets,
+    password: str,
+    workers: int | None = None,
+    report=None,
+    callback=None,
+    update_log: bool = False,
+    log_path: Path | str | None = None,
+    list_files: bool = False,
+) -> dict:
+    # With update_log, archives missing from the ciphertext log are added
+    # under their current tar name, which rebuilds the name index from the
+    # archives themselves.
+    paths = expand_targets(targets, suffix=".tar")
+
+    started = time.perf_counter()
+    results = [None] * len(paths)
+    total_bytes = 0
+
+    log = CiphertextLog(log_path) if update_log else None
+    try:
+        work = ((str(path), password, list_files) for path in paths)
+        for index, result, error in imap_unordered(inspect_file, work, workers):
+            if error is None:
+                # Archives locked from a pipe do not record their size.
+                total_bytes += result["size"] or 0
+                entry = {"path": str(paths[index]), "ok": True, **result}
+                if log is not None:
+                    encrypted_name = paths[index].stem
+                    entry["logged"] = not log.find(encrypted_name=encrypted_name)
+                    if entry["logged"]:
+                        log.append(result["original_name"], encrypted_name)
+            else:
+                entry = {
+                    "path": str(paths[index]),
+                    "ok": False,
+                    "error": f"{type(error).__name__}: {error}",
+                }
+
+            results[index] = entry
+            if report is not None:
+                report.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                report.flush()
+            if callback:
+                callback(entry)
+    finally:
+        if log is not None:
+            log.close()
+
+    return _summarize(results, total_bytes, started)
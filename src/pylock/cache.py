@@ -0,0 +1,168 @@
+import hashlib
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from .config import get_data_dir
+
+
+DEFAULT_CACHE_NAME = "lockcache.db"
+# Files remembered at most; beyond this the least recently seen ones are
+# dropped (and with them archives no file points to any more).
+DEFAULT_MAX_ENTRIES = 1_000_000
+# Password fingerprints are PBKDF2 so the cache does not make the password
+# any cheaper to guess than the archives themselves.
+KEY_ITERATIONS = 200_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_used ON files (used);
+CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+CREATE TABLE IF NOT EXISTS archives (
+    hash TEXT NOT NULL,
+    key TEXT NOT NULL,
+    tar_path TEXT NOT NULL,
+    original_name TEXT NOT NULL,
+    encrypted_name TEXT NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (hash, key)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def default_cache_path() -> Path:
+    return get_data_dir() / DEFAULT_CACHE_NAME
+
+
+def hash_file(path: str) -> tuple[str, int, int]:
+    # Returns (sha256, size, mtime_ns), with the stat taken before reading:
+    # a file changed while it is hashed then looks modified on the next run.
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        digest = hashlib.file_digest(f, "sha256").hexdigest()
+    return digest, st.st_size, st.st_mtime_ns
+
+
+class LockCache:
+    # Maps (path, size, mtime) to a content hash, and (hash, password) to
+    # the archive holding that content. Changes are batched; call commit()
+    # to make them durable.
+
+    def __init__(
+        self, path: str | Path | None = None, max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        self.path = Path(path) if path is not None else default_cache_path()
+        self.max_entries = max_entries
+        self.started = time.time()
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def key_for(self, password: str) -> str:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'salt'").fetchone()
+        if row is None:
+            salt = os.urandom(16).hex()
+            self.conn.execute("INSERT INTO meta VALUES ('salt', ?)", (salt,))
+            self.conn.commit()
+        else:
+            salt = row["value"]
+        key = hashlib.pbkdf2_hmac(
+            "sha256", password.encode("utf-8"), bytes.fromhex(salt), KEY_ITERATIONS
+        )
+        return key[:16].hex()
+
+    def lookup(self, path: str, size: int, mtime_ns: int) -> str | None:
+        # The hash recorded for path, if the file still has the same size
+        # and modification time.
+        row = self.conn.execute(
+            "SELECT hash FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, size, mtime_ns),
+        ).fetchone()
+        if row is None:
+            return None
+        self.conn.execute(
+            "UPDATE files SET used = ? WHERE path = ?", (self.started, path)
+        )
+        return row["hash"]
+
+    def remember_file(self, path: str, size: int, mtime_ns: int, digest: str):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+            (path, size, mtime_ns, digest, self.started),
+        )
+
+    def archive(self, digest: str, key: str) -> dict | None:
+        # The archive holding this content under this password, as long as
+        # it is still on disk.
+        row = self.conn.execute(
+            "SELECT * FROM archives WHERE hash = ? AND key = ?", (digest, key)
+        ).fetchone()
+        if row is None:
+            return None
+        if not os.path.exists(row["tar_path"]):
+            self.conn.execute(
+                "DELETE FROM archives WHERE hash = ? AND key = ?", (digest, key)
+            )
+            return None
+        self.conn.execute(
+            "UPDATE archives SET used = ? WHERE hash = ? AND key = ?",
+            (self.started, digest, key),
+        )
+        return dict(row)
+
+    def remember_archive(self, digest: str, key: str, result: dict):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO archives VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                digest,
+                key,
+                os.path.abspath(result["tar_path"]),
+                result["original_name"],
+                result["encrypted_name"],
+                self.started,
+            ),
+        )
+
+    def evict(self) -> int:
+        # Drops the least recently seen files beyond max_entries, then the
+        # archives no remaining file has as its content.
+        total = self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        excess = total - self.max_entries
+        if excess <= 0:
+            return 0
+        self.conn.execute(
+            "DELETE FROM files WHERE path IN "
+            "(SELECT path FROM files ORDER BY used LIMIT ?)",
+            (excess,),
+        )
+        self.conn.execute(
+            "DELETE FROM archives WHERE hash NOT IN (SELECT hash FROM files)"
+        )
+        self.conn.commit()
+        return excess
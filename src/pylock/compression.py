@@ -0,0 +1,123 @@
+import math
+import os
+import time
+from collections import Counter
+from pathlib import Path
+
+
+# Zip compression method ids (the zipfile.ZIP_* values), spelled out so the
+# CLI can list the choices without importing zipfile or pyzipper.
+COMPRESSION_METHODS = {
+    "stored": 0,
+    "deflate": 8,
+    "bzip2": 12,
+    "lzma": 14,
+}
+COMPRESSION_CHOICES = [*COMPRESSION_METHODS, "auto"]
+
+SAMPLE_BLOCKS = 4
+SAMPLE_BLOCK_SIZE = 64 * 1024
+
+# Bits per byte. Already-compressed media and ciphertext sit just under
+# 8.0; logs, CSV and source code are usually between 4 and 6.
+STORED_ENTROPY = 7.5
+LZMA_ENTROPY = 6.0
+# lzma compresses at a few MB/s, so it is only picked where that is cheap.
+LZMA_MAX_SIZE = 1024 * 1024
+
+
+def estimate_entropy(
+    path: str | Path,
+    blocks: int = SAMPLE_BLOCKS,
+    block_size: int = SAMPLE_BLOCK_SIZE,
+) -> float:
+    size = os.path.getsize(path)
+    sample = bytearray()
+    with open(path, "rb") as f:
+        for i in range(blocks):
+            f.seek(max(0, size - block_size) * i // max(1, blocks - 1))
+            sample += f.read(block_size)
+
+    if not sample:
+        return 0.0
+
+    total = len(sample)
+    return -sum(
+        count / total * math.log2(count / total) for count in Counter(sample).values()
+    )
+
+
+def choose_compression(path: str | Path) -> str:
+    entropy = estimate_entropy(path)
+    if entropy >= STORED_ENTROPY:
+        return "stored"
+    if entropy < LZMA_ENTROPY and os.path.getsize(path) <= LZMA_MAX_SIZE:
+        return "lzma"
+    return "deflate"
+
+
+def resolve_compression(compression: str, path: str | Path) -> str:
+    if compression == "auto":
+        return choose_compression(path)
+    if compression not in COMPRESSION_METHODS:
+        raise ValueError(
+            f"Unknown compression {compression!r}, "
+            f"expected one of {', '.join(COMPRESSION_CHOICES)}"
+        )
+    return compression
+
+
+def stream_compressor(compression: str, compresslevel: int | None = None):
+    # Plain compressor objects for backends that do not store zip members;
+    # deflate is raw (no zlib header), the same stream zipfile writes.
+    import bz2
+    import lzma
+    import zlib
+
+    if compression == "stored":
+        return None
+    if compression == "deflate":
+        level = zlib.Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel
+        return zlib.compressobj(level, zlib.DEFLATED, -15)
+    if compression == "bzip2":
+        return bz2.BZ2Compressor(9 if compresslevel is None else compresslevel)
+    if compression == "lzma":
+        return lzma.LZMACompressor()
+    raise ValueError(f"Unknown compression {compression!r}")
+
+
+def stream_decompressor(compression: str):
+    import bz2
+    import lzma
+    import zlib
+
+    if compression == "stored":
+        return None
+    if compression == "deflate":
+        return zlib.decompressobj(-15)
+    if compression == "bzip2":
+        return bz2.BZ2Decompressor()
+    if compression == "lzma":
+        return lzma.LZMADecompressor()
+    raise ValueError(f"Unknown compression {compression!r}")
+
+
+class TimedCompressor:
+    # Wraps a zipfile compressor to measure the time spent compressing,
+    # which is the extra cost a method adds over storing.
+
+    def __init__(self, compressor):
+        self.compressor = compressor
+        self.seconds = 0.0
+
+    def compress(self, data):
+        started = time.perf_counter()
+        data = self.compressor.compress(data)
+        self.seconds += time.perf_counter() - started
+        return data
+
+    def flush(self):
+        started = time.perf_counter()
+        data = self.compressor.flush()
+        self.seconds += time.perf_counter() - started
+        return data
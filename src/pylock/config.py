@@ -13,6 +13,20 @@ def get_program_dir() -> Path:
     return Path(__file__).parent.parent
 
 
+def get_data_dir() -> Path:
+    # Per-user directory for the history log and caches. Running from a
+    # source checkout must not write these into the tree.
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Application Support"
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or Path.home() / ".local" / "share"
+    path = Path(base) / "pylock"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
 def ensure_config_exists(config_path: str | Path = DEFAULT_CONFIG_PATH) -> Path:
     config_path = Path(config_path)
     program_dir = get_program_dir()
@@ -0,0 +1,10 @@
+class WrongPasswordError(ValueError):
+    # The password does not match the archive. Raised while opening it, from
+    # the small metadata entry alone, before any payload byte is read.
+    pass
+
+
+class RandomAccessError(ValueError):
+    # The archive cannot be read at random offsets (e.g. it is compressed);
+    # it can still be unlocked or streamed from the start.
+    pass
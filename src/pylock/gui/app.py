@@ -1,48 +1,96 @@
 import os
-import threading
+import queue
 from pathlib import Path
 from tkinter import filedialog
 
 import customtkinter as ctk
 
 from ..config import load_password, load_config
-from ..locker import lock_file, unlock_file
+from ..progress import format_duration
 from .history import HistoryWindow
+from .jobs import DEFAULT_WORKERS, DONE, FAILED, RUNNING, JobQueue, expand_paths
+from .table import ListSource, VirtualTable
+
+
+COMPRESSION_OPTIONS = {
+    "不压缩": "stored",
+    "自动": "auto",
+    "deflate": "deflate",
+    "bzip2": "bzip2",
+    "lzma": "lzma",
+}
+
+STAGE_NAMES = {
+    "encrypt": "加密",
+    "tar": "打包",
+    "decrypt": "解密",
+}
+
+MODE_NAMES = {"lock": "加密", "unlock": "解密"}
+
+STATE_NAMES = {
+    "pending": "等待中",
+    "running": "进行中",
+    "done": "完成",
+    "failed": "失败",
+    "cancelled": "已取消",
+}
+
+WORKER_OPTIONS = [str(n) for n in range(1, max(8, DEFAULT_WORKERS) + 1)]
+
+# The job table is refreshed from one after() loop that drains at most
+# MAX_EVENTS_PER_POLL worker events per tick, so a burst of progress
+# updates from hundreds of jobs cannot starve the Tk event loop.
+POLL_MS = 100
+MAX_EVENTS_PER_POLL = 500
 
 
 class DropZone(ctk.CTkFrame):
     def __init__(self, master, **kwargs):
         super().__init__(master, **kwargs)
 
-        self.file_path = None
+        self.file_paths = []
         self.callback = None
 
         self.label = ctk.CTkLabel(
             self,
-            text="点击选择文件",
+            text="点击选择文件（可多选）",
             font=ctk.CTkFont(size=16),
             text_color="gray",
         )
-        self.label.pack(expand=True, fill="both", padx=20, pady=40)
+        self.label.pack(expand=True, fill="both", padx=20, pady=(25, 5))
+
+        self.folder_button = ctk.CTkButton(
+            self, text="添加文件夹", command=self.on_folder, width=100, height=24
+        )
+        self.folder_button.pack(pady=(0, 10))
 
         self.label.bind("<Button-1>", self.on_click)
         self.bind("<Button-1>", self.on_click)
 
     def on_click(self, event=None):
-        file_path = filedialog.askopenfilename()
-        if file_path:
-            self.set_file(file_path)
-
-    def set_file(self, file_path):
-        self.file_path = file_path
-        file_name = os.path.basename(file_path)
-        self.label.configure(text=file_name, text_color=("gray10", "gray90"))
+        file_paths = filedialog.askopenfilenames()
+        if file_paths:
+            self.add_files(file_paths)
+
+    def on_folder(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.add_files([folder])
+
+    def add_files(self, file_paths):
+        self.file_paths.extend(file_paths)
+        if len(self.file_paths) == 1:
+            text = os.path.basename(self.file_paths[0]) or self.file_paths[0]
+        else:
+            text = f"已选择 {len(self.file_paths)} 项"
+        self.label.configure(text=text, text_color=("gray10", "gray90"))
         if self.callback:
-            self.callback(file_path)
+            self.callback(list(self.file_paths))
 
     def clear(self):
-        self.file_path = None
-        self.label.configure(text="点击选择文件", text_color="gray")
+        self.file_paths = []
+        self.label.configure(text="点击选择文件（可多选）", text_color="gray")
 
 
 class PylockApp(ctk.CTk):
@@ -50,15 +98,23 @@ class PylockApp(ctk.CTk):
         super().__init__()
 
         self.title("Pylock - 文件加密工具")
-        self.geometry("700x600")
+        self.geometry("760x880")
         self.resizable(False, False)
 
-        self.selected_file = None
+        self.selected_files = []
         self.config = None
+        self.history_window = None
+
+        self.jobs = JobQueue()
+        self.job_rows = {}
+        self.selected_job = None
 
         self.setup_ui()
         self.load_config()
 
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(POLL_MS, self.poll_jobs)
+
     def setup_ui(self):
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(0, weight=1)
@@ -72,16 +128,16 @@ class PylockApp(ctk.CTk):
             text="Pylock 文件加密工具",
             font=ctk.CTkFont(size=24, weight="bold"),
         )
-        title.grid(row=0, column=0, pady=(0, 20))
+        title.grid(row=0, column=0, pady=(0, 15))
 
         self.drop_zone = DropZone(
-            main_frame, height=120, corner_radius=10, fg_color=("gray93", "gray17")
+            main_frame, height=110, corner_radius=10, fg_color=("gray93", "gray17")
         )
-        self.drop_zone.grid(row=1, column=0, pady=(0, 20), sticky="ew", padx=40)
+        self.drop_zone.grid(row=1, column=0, pady=(0, 15), sticky="ew", padx=40)
         self.drop_zone.callback = self.on_file_selected
 
         input_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
-        input_frame.grid(row=2, column=0, pady=(0, 20), sticky="ew", padx=40)
+        input_frame.grid(row=2, column=0, pady=(0, 15), sticky="ew", padx=40)
         input_frame.grid_columnconfigure(0, weight=1)
 
         password_label = ctk.CTkLabel(input_frame, text="密码:")
@@ -101,8 +157,36 @@ class PylockApp(ctk.CTk):
         )
         show_password_checkbox.grid(row=2, column=0, sticky="w", pady=(5, 0))
 
+        compression_frame = ctk.CTkFrame(input_frame, fg_color="transparent")
+        compression_frame.grid(row=3, column=0, sticky="w", pady=(10, 0))
+
+        compression_label = ctk.CTkLabel(compression_frame, text="压缩:")
+        compression_label.grid(row=0, column=0, padx=(0, 10))
+
+        self.compression_var = ctk.StringVar(value="不压缩")
+        compression_menu = ctk.CTkOptionMenu(
+            compression_frame,
+            values=list(COMPRESSION_OPTIONS),
+            variable=self.compression_var,
+            width=120,
+        )
+        compression_menu.grid(row=0, column=1)
+
+        workers_label = ctk.CTkLabel(compression_frame, text="并发:")
+        workers_label.grid(row=0, column=2, padx=(20, 10))
+
+        self.workers_var = ctk.StringVar(value=str(DEFAULT_WORKERS))
+        workers_menu = ctk.CTkOptionMenu(
+            compression_frame,
+            values=WORKER_OPTIONS,
+            variable=self.workers_var,
+            command=self.on_workers_changed,
+            width=70,
+        )
+        workers_menu.grid(row=0, column=3)
+
         mode_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
-        mode_frame.grid(row=3, column=0, pady=(0, 20))
+        mode_frame.grid(row=3, column=0, pady=(0, 15))
 
         self.mode_var = ctk.StringVar(value="lock")
 
@@ -125,7 +209,7 @@ class PylockApp(ctk.CTk):
         decrypt_radio.grid(row=0, column=1, padx=10)
 
         button_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
-        button_frame.grid(row=4, column=0, pady=(0, 20))
+        button_frame.grid(row=4, column=0, pady=(0, 15))
 
         self.execute_button = ctk.CTkButton(
             button_frame,
@@ -147,11 +231,44 @@ class PylockApp(ctk.CTk):
         history_button.grid(row=0, column=1, padx=5)
 
         self.progress = ctk.CTkProgressBar(main_frame, width=400)
-        self.progress.grid(row=5, column=0, pady=(0, 10))
+        self.progress.grid(row=5, column=0, pady=(0, 5))
         self.progress.set(0)
 
-        self.result_text = ctk.CTkTextbox(main_frame, height=120, width=500)
-        self.result_text.grid(row=6, column=0, pady=(0, 10))
+        self.progress_label = ctk.CTkLabel(main_frame, text="", text_color="gray")
+        self.progress_label.grid(row=6, column=0, pady=(0, 5))
+
+        self.job_table = VirtualTable(
+            main_frame,
+            columns=[
+                ("name", "文件"),
+                ("mode", "操作"),
+                ("state", "状态"),
+                ("detail", "进度"),
+            ],
+            height=200,
+        )
+        self.job_table.grid(row=7, column=0, pady=(0, 5), sticky="ew", padx=20)
+        self.job_table.on_select = self.on_job_selected
+        self.job_source = ListSource([])
+        self.job_table.set_source(self.job_source, empty_text="暂无任务")
+
+        job_button_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        job_button_frame.grid(row=8, column=0, pady=(0, 10))
+        for column, (text, command) in enumerate(
+            [
+                ("取消所选", self.cancel_selected),
+                ("重试所选", self.retry_selected),
+                ("全部取消", self.jobs.cancel_all),
+                ("重试失败", self.jobs.retry_failed),
+                ("清除已完成", self.clear_finished),
+            ]
+        ):
+            ctk.CTkButton(job_button_frame, text=text, command=command, width=100).grid(
+                row=0, column=column, padx=4
+            )
+
+        self.result_text = ctk.CTkTextbox(main_frame, height=90, width=500)
+        self.result_text.grid(row=9, column=0, pady=(0, 10))
         self.result_text.configure(state="disabled")
 
     def load_config(self):
@@ -162,14 +279,17 @@ class PylockApp(ctk.CTk):
         except Exception:
             pass
 
-    def on_file_selected(self, file_path):
-        self.selected_file = file_path
+    def on_file_selected(self, file_paths):
+        self.selected_files = file_paths
         self.clear_result()
 
     def on_mode_changed(self):
         self.clear_result()
         self.drop_zone.clear()
-        self.selected_file = None
+        self.selected_files = []
+
+    def on_workers_changed(self, value):
+        self.jobs.set_workers(int(value))
 
     def toggle_password_visibility(self):
         if self.show_password_var.get():
@@ -184,101 +304,174 @@ class PylockApp(ctk.CTk):
             self.show_error("请输入密码")
             return
 
-        if self.mode_var.get() == "lock":
-            self.execute_lock(password)
-        else:
-            self.execute_unlock(password)
-
-    def execute_lock(self, password):
-        if not self.selected_file:
-            self.show_error("请选择要加密的文件")
+        mode = self.mode_var.get()
+        if not self.selected_files:
+            self.show_error(f"请选择要{MODE_NAMES[mode]}的文件")
             return
 
-        self.set_progress(0.1)
-        self.execute_button.configure(state="disabled", text="加密中...")
-        self.clear_result()
+        paths = expand_paths(self.selected_files, mode)
+        skipped = 0
+        if mode == "unlock":
+            skipped = sum(1 for path in paths if not path.endswith(".tar"))
+            paths = [path for path in paths if path.endswith(".tar")]
+        if not paths:
+            self.show_error(
+                "请选择 .tar 文件进行解密" if mode == "unlock" else "所选文件夹为空"
+            )
+            return
 
-        thread = threading.Thread(target=self._lock_thread, args=(password,))
-        thread.start()
+        options = {"password": password}
+        if mode == "lock":
+            options["compression"] = COMPRESSION_OPTIONS[self.compression_var.get()]
+        self.jobs.add(mode, paths, options)
 
-    def _lock_thread(self, password):
+        self.drop_zone.clear()
+        self.selected_files = []
+        message = f"已加入 {len(paths)} 个任务"
+        if skipped:
+            message += f"，跳过 {skipped} 个非 .tar 文件"
+        self.show_result(message)
+
+    def poll_jobs(self):
+        changed = {}
+        finished_lock = False
         try:
-            self.after(0, lambda: self.set_progress(0.3))
-            result = lock_file(self.selected_file, password)
-
-            self.after(0, lambda: self.set_progress(0.9))
-            self.after(
-                0,
-                lambda: self.show_result(
-                    f"加密成功！\n\n"
-                    f"原始文件名: {result['original_name']}\n"
-                    f"加密后文件名: {result['encrypted_name']}\n"
-                    f"输出文件: {result['tar_path']}\n\n"
-                    f"提示: {result['tar_path']} 已生成"
-                ),
-            )
-            self.after(0, lambda: self.set_progress(1.0))
-        except Exception as e:
-            self.after(0, lambda: self.show_error(f"加密失败: {str(e)}"))
-        finally:
-            self.after(
-                0,
-                lambda: self.execute_button.configure(state="normal", text="开始执行"),
-            )
+            for _ in range(MAX_EVENTS_PER_POLL):
+                kind, job = self.jobs.events.get_nowait()
+                changed[job.id] = job
+                if kind == "finished" and job.mode == "lock" and job.state == DONE:
+                    finished_lock = True
+        except queue.Empty:
+            pass
 
-    def execute_unlock(self, password):
-        if not self.selected_file:
-            self.show_error("请选择要解密的文件")
-            return
+        if changed:
+            for job in changed.values():
+                self.update_job_row(job)
+            self.job_source.data = [
+                self.job_rows[job.id]
+                for job in self.jobs.jobs
+                if job.id in self.job_rows
+            ]
+            self.job_table.render()
+            self.update_summary()
+            if self.selected_job is not None and self.selected_job.id in changed:
+                self.show_job(self.selected_job)
+        if finished_lock:
+            self.notify_history()
+
+        self.after(POLL_MS, self.poll_jobs)
+
+    def update_job_row(self, job):
+        row = self.job_rows.get(job.id)
+        if row is None:
+            row = self.job_rows[job.id] = {
+                "id": job.id,
+                "name": job.name,
+                "mode": MODE_NAMES[job.mode],
+            }
+        row["state"] = STATE_NAMES[job.state]
+        if job.state == RUNNING and job.stage is not None:
+            row["detail"] = (
+                f"{STAGE_NAMES.get(job.stage, job.stage)} {job.fraction * 100:.1f}%  ·  "
+                f"{job.rate / 1_000_000:.1f} MB/s  ·  剩余 {format_duration(job.eta)}"
+            )
+        elif job.state == FAILED:
+            row["detail"] = job.error
+        elif job.state == DONE:
+            row["detail"] = "100%"
+        else:
+            row["detail"] = ""
 
-        if not self.selected_file.endswith(".tar"):
-            self.show_error("请选择 .tar 文件进行解密")
+    def update_summary(self):
+        jobs = self.jobs.jobs
+        if not jobs:
+            self.set_progress(0)
             return
+        self.progress.set(sum(job.fraction for job in jobs) / len(jobs))
+        counts = self.jobs.counts()
+        self.progress_label.configure(
+            text=f"完成 {counts['done']}/{len(jobs)}  ·  进行中 {counts['running']}  ·  "
+            f"等待 {counts['pending']}  ·  失败 {counts['failed']}  ·  "
+            f"已取消 {counts['cancelled']}"
+        )
 
-        self.set_progress(0.1)
-        self.execute_button.configure(state="disabled", text="解密中...")
-        self.clear_result()
-
-        thread = threading.Thread(target=self._unlock_thread, args=(password,))
-        thread.start()
-
-    def _unlock_thread(self, password):
-        try:
-            self.after(0, lambda: self.set_progress(0.3))
-            result = unlock_file(self.selected_file, password)
-
-            self.after(0, lambda: self.set_progress(0.9))
-            self.after(
-                0,
-                lambda: self.show_result(
-                    f"解密成功！\n\n"
-                    f"原始文件名: {result['original_name']}\n"
-                    f"解密后文件名: {result['decrypted_name']}\n"
-                    f"输出文件: {result['decrypted_path']}\n\n"
-                    f"提示: {result['decrypted_path']} 已生成"
-                ),
+    def on_job_selected(self, row):
+        self.selected_job = next(
+            (job for job in self.jobs.jobs if job.id == row["id"]), None
+        )
+        if self.selected_job is not None:
+            self.show_job(self.selected_job)
+
+    def show_job(self, job):
+        result = job.result
+        if job.state == FAILED:
+            self.show_error(f"{MODE_NAMES[job.mode]}失败: {job.error}")
+        elif job.state == DONE and job.mode == "lock":
+            size = result["size"]
+            saved = result["saved_bytes"]
+            ratio = saved / size * 100 if size else 0.0
+            self.show_result(
+                f"加密成功！\n\n"
+                f"原始文件名: {result['original_name']}\n"
+                f"加密后文件名: {result['encrypted_name']}\n"
+                f"输出文件: {result['tar_path']}\n"
+                f"压缩方式: {result['compression']}，节省 "
+                f"{saved / 1_000_000:.1f} MB ({ratio:.1f}%)，"
+                f"耗时 {result['compress_seconds']:.2f} 秒"
             )
-            self.after(0, lambda: self.set_progress(1.0))
-        except Exception as e:
-            self.after(0, lambda: self.show_error(f"解密失败: {str(e)}"))
-        finally:
-            self.after(
-                0,
-                lambda: self.execute_button.configure(state="normal", text="开始执行"),
+        elif job.state == DONE:
+            self.show_result(
+                f"解密成功！\n\n"
+                f"原始文件名: {result['original_name']}\n"
+                f"解密后文件名: {result['decrypted_name']}\n"
+                f"输出文件: {result['decrypted_path']}"
             )
+        else:
+            self.show_result(f"{job.path}\n\n状态: {STATE_NAMES[job.state]}")
+
+    def cancel_selected(self):
+        if self.selected_job is not None:
+            self.jobs.cancel(self.selected_job)
+
+    def retry_selected(self):
+        if self.selected_job is not None:
+            self.jobs.retry(self.selected_job)
+
+    def clear_finished(self):
+        self.jobs.clear_finished()
+        ids = {job.id for job in self.jobs.jobs}
+        self.job_rows = {k: v for k, v in self.job_rows.items() if k in ids}
+        self.job_source.data = [self.job_rows[job.id] for job in self.jobs.jobs]
+        if self.selected_job is not None and self.selected_job.id not in ids:
+            self.selected_job = None
+            self.job_table.selected_id = None
+            self.clear_result()
+        self.job_table.scroll_to(self.job_table.first, force=True)
+        self.update_summary()
+
+    def on_close(self):
+        self.jobs.shutdown()
+        self.destroy()
 
     def open_history(self):
-        history_window = HistoryWindow(self)
-        history_window.focus()
+        if self.history_window is None or not self.history_window.winfo_exists():
+            self.history_window = HistoryWindow(self)
+        self.history_window.focus()
+
+    def notify_history(self):
+        if self.history_window is not None and self.history_window.winfo_exists():
+            self.history_window.refresh()
 
     def set_progress(self, value):
         self.progress.set(value)
+        if value == 0:
+            self.progress_label.configure(text="")
 
     def show_result(self, message):
         self.result_text.configure(state="normal")
         self.result_text.delete("1.0", "end")
         self.result_text.insert("1.0", message)
-        self.result_text.configure(state="disabled")
+        self.result_text.configure(state="disabled", text_color=("gray10", "gray90"))
 
     def show_error(self, message):
         self.result_text.configure(state="normal")
@@ -1,15 +1,20 @@
-import json
-import os
-import sys
-from pathlib import Path
+import threading
 
 import customtkinter as ctk
 
+from ..config import get_data_dir
+from ..search import RESULT_LIMIT, SearchIndex, is_searchable, record_key
+from ..store import CiphertextLog
+from .table import IndexSource, ListSource, LogSource, VirtualTable
 
-def get_program_dir() -> Path:
-    if getattr(sys, "frozen", False):
-        return Path(sys.executable).parent
-    return Path(__file__).parent.parent.parent
+
+SEARCH_DELAY_MS = 150
+INDEX_POLL_MS = 100
+INDEX_BATCH_SIZE = 50000
+# The search index is saved here after a build that indexed at least
+# INDEX_SAVE_MIN records, so reopening the window only indexes new ones.
+INDEX_NAME = "historyindex.bin"
+INDEX_SAVE_MIN = INDEX_BATCH_SIZE
 
 
 class HistoryWindow(ctk.CTkToplevel):
@@ -20,14 +25,23 @@ class HistoryWindow(ctk.CTkToplevel):
         self.geometry("600x500")
         self.resizable(True, True)
 
-        self.history_file = get_program_dir() / "cipertext.json"
+        self.log = CiphertextLog()
+        self.bind("<Destroy>", self.on_destroy, add="+")
+
+        self.source = None
+        self.index = None
+        self.index_thread = None
+        self.built_index = None
+        self.last_id = 0
+        self.search_job = None
+        self.closed = False
 
         self.setup_ui()
         self.load_history()
 
     def setup_ui(self):
         self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure(1, weight=1)
+        self.grid_rowconfigure(3, weight=1)
 
         title = ctk.CTkLabel(
             self, text="加密历史记录", font=ctk.CTkFont(size=20, weight="bold")
@@ -47,6 +61,11 @@ class HistoryWindow(ctk.CTkToplevel):
         self.search_entry.grid(row=0, column=1, sticky="ew")
         self.search_entry.bind("<KeyRelease>", self.on_search)
 
+        self.hint_label = ctk.CTkLabel(
+            search_frame, text="", text_color="gray", font=ctk.CTkFont(size=12)
+        )
+        self.hint_label.grid(row=1, column=1, sticky="w")
+
         button_frame = ctk.CTkFrame(self, fg_color="transparent")
         button_frame.grid(row=2, column=0, padx=20, pady=(0, 10), sticky="ew")
         button_frame.grid_columnconfigure(0, weight=1)
@@ -62,97 +81,146 @@ class HistoryWindow(ctk.CTkToplevel):
         )
         close_button.grid(row=0, column=1, sticky="e")
 
-        self.table_frame = ctk.CTkScrollableFrame(
-            self, label_text="记录列表", label_font=ctk.CTkFont(size=14, weight="bold")
+        self.table = VirtualTable(
+            self,
+            columns=[
+                ("original_name", "原始文件名"),
+                ("encrypted_name", "加密文件名"),
+            ],
         )
-        self.table_frame.grid(row=3, column=0, padx=20, pady=(0, 20), sticky="nsew")
-        self.table_frame.grid_columnconfigure(0, weight=1)
-        self.table_frame.grid_columnconfigure(1, weight=1)
-
-        header_frame = ctk.CTkFrame(self.table_frame, fg_color="transparent")
-        header_frame.grid(row=0, column=0, columnspan=2, sticky="ew")
-        header_frame.grid_columnconfigure(0, weight=1)
-        header_frame.grid_columnconfigure(1, weight=1)
-
-        ctk.CTkLabel(
-            header_frame, text="原始文件名", font=ctk.CTkFont(weight="bold"), anchor="w"
-        ).grid(row=0, column=0, sticky="ew", padx=5, pady=5)
-
-        ctk.CTkLabel(
-            header_frame, text="加密文件名", font=ctk.CTkFont(weight="bold"), anchor="w"
-        ).grid(row=0, column=1, sticky="ew", padx=5, pady=5)
-
-        self.content_frame = ctk.CTkFrame(self.table_frame, fg_color="transparent")
-        self.content_frame.grid(row=1, column=0, columnspan=2, sticky="nsew")
-        self.content_frame.grid_columnconfigure(0, weight=1)
-        self.content_frame.grid_columnconfigure(1, weight=1)
-
-        self.all_data = []
+        self.table.grid(row=3, column=0, padx=20, pady=(0, 20), sticky="nsew")
 
     def load_history(self):
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
-
-        if not os.path.exists(self.history_file):
-            ctk.CTkLabel(
-                self.content_frame, text="暂无历史记录", text_color="gray"
-            ).grid(row=0, column=0, columnspan=2, pady=20)
-            return
-
         try:
-            with open(self.history_file, "r", encoding="utf-8") as f:
-                self.all_data = json.load(f)
+            self.source = LogSource(self.log)
+        except Exception:
+            self.source = ListSource([])
+
+        if self.index is None and self.index_thread is None:
+            self.index_thread = threading.Thread(target=self._build_index, daemon=True)
+            self.index_thread.start()
+            self.after(INDEX_POLL_MS, self.poll_index)
+        elif self.index is not None:
+            self.sync_index()
+
+        self.run_search()
+
+    def _build_index(self):
+        # Runs off the Tk thread; the finished index is handed over through
+        # poll_index so no widget is touched from here.
+        path = get_data_dir() / INDEX_NAME
+        index, last_id = self._load_index(path)
+        added = 0
+        try:
+            while batch := self.log.since(last_id, INDEX_BATCH_SIZE):
+                index.add_many(batch)
+                last_id = batch[-1]["id"]
+                added += len(batch)
         except Exception:
-            self.all_data = []
-
-        if not self.all_data:
-            ctk.CTkLabel(
-                self.content_frame, text="暂无历史记录", text_color="gray"
-            ).grid(row=0, column=0, columnspan=2, pady=20)
+            return
+        if added >= INDEX_SAVE_MIN:
+            try:
+                index.save(
+                    path, {"log": str(self.log.path.resolve()), "last_id": last_id}
+                )
+            except OSError:
+                pass
+        self.built_index = (index, last_id)
+
+    def _load_index(self, path) -> tuple[SearchIndex, int]:
+        # A saved index is reused if it was built from this log and the last
+        # record it covers is still there unchanged; the log only grows, so
+        # everything after that record is new.
+        loaded = SearchIndex.load(path)
+        if loaded is not None:
+            index, meta = loaded
+            last_id = meta.get("last_id", 0)
+            try:
+                records = self.log.by_ids([last_id])
+            except Exception:
+                records = []
+            if (
+                meta.get("log") == str(self.log.path.resolve())
+                and len(index) > 0
+                and index.ids[-1] == last_id
+                and records
+                and index.keys[-1] == record_key(records[0])
+            ):
+                return index, last_id
+        return SearchIndex(), 0
+
+    def poll_index(self):
+        if self.closed:
+            return
+        if self.built_index is None:
+            if self.index_thread.is_alive():
+                self.after(INDEX_POLL_MS, self.poll_index)
             return
 
-        self.display_data(self.all_data)
-
-    def display_data(self, data):
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
-
-        for i, item in enumerate(data):
-            original = item.get("original_name", "")
-            encrypted = item.get("encrypted_name", "")
-
-            bg_color = ("gray85", "gray17") if i % 2 == 0 else ("gray90", "gray14")
-
-            row_frame = ctk.CTkFrame(self.content_frame, fg_color=bg_color)
-            row_frame.grid(row=i, column=0, columnspan=2, sticky="ew", pady=1)
-            row_frame.grid_columnconfigure(0, weight=1)
-            row_frame.grid_columnconfigure(1, weight=1)
-
-            ctk.CTkLabel(row_frame, text=original, anchor="w").grid(
-                row=0, column=0, sticky="ew", padx=10, pady=5
-            )
-
-            ctk.CTkLabel(row_frame, text=encrypted, anchor="w").grid(
-                row=0, column=1, sticky="ew", padx=10, pady=5
-            )
-
-        if not data:
-            ctk.CTkLabel(
-                self.content_frame, text="没有匹配的记录", text_color="gray"
-            ).grid(row=0, column=0, columnspan=2, pady=20)
+        self.index, self.last_id = self.built_index
+        self.built_index = None
+        self.sync_index()
+        self.run_search()
 
-    def on_search(self, event):
-        search_text = self.search_entry.get().strip().lower()
+    def sync_index(self):
+        # Picks up records appended since the index was built, e.g. by a
+        # lock that finished while this window was open.
+        try:
+            new_records = self.log.since(self.last_id)
+        except Exception:
+            return
+        if new_records:
+            self.index.add_many(new_records)
+            self.last_id = new_records[-1]["id"]
 
-        if not search_text:
-            self.display_data(self.all_data)
+    def refresh(self):
+        if self.index is not None:
+            self.sync_index()
+        try:
+            self.source = LogSource(self.log)
+        except Exception:
             return
+        self.run_search(keep_position=True)
 
-        filtered = [
-            item
-            for item in self.all_data
-            if search_text in item.get("original_name", "").lower()
-            or search_text in item.get("encrypted_name", "").lower()
-        ]
+    def on_search(self, event=None):
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(SEARCH_DELAY_MS, self.run_search)
 
-        self.display_data(filtered)
+    def run_search(self, keep_position: bool = False):
+        self.search_job = None
+        search_text = self.search_entry.get().strip().lower()
+        first = self.table.first
+
+        hint = ""
+        if not is_searchable(search_text):
+            # One or two characters match most names; show everything.
+            if search_text:
+                hint = "输入至少 3 个字符（中文 2 个）开始搜索"
+            self.table.set_source(self.source, empty_text="暂无历史记录")
+        elif self.index is not None:
+            positions = self.index.search(search_text, RESULT_LIMIT)
+            if self.index.truncated:
+                hint = f"仅显示最近的 {RESULT_LIMIT} 条匹配，输入更多字符以缩小范围"
+            self.table.set_source(
+                IndexSource(self.log, self.index, positions),
+                empty_text="没有匹配的记录",
+            )
+        else:
+            # The index is still being built; fall back to a database scan.
+            try:
+                filtered = self.log.search(search_text)
+            except Exception:
+                filtered = []
+            self.table.set_source(ListSource(filtered), empty_text="没有匹配的记录")
+        self.hint_label.configure(text=hint)
+
+        if keep_position:
+            self.table.scroll_to(first, force=True)
+
+    def on_destroy(self, event):
+        if event.widget is self:
+            self.closed = True
+            if self.search_job is not None:
+                self.after_cancel(self.search_job)
+            self.log.close()
@@ -0,0 +1,187 @@
+import itertools
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from ..errors import WrongPasswordError
+from ..locker import lock_file, unlock_file
+
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id: int, mode: str, path: str, options: dict):
+        self.id = job_id
+        self.mode = mode
+        self.path = path
+        self.name = os.path.basename(path)
+        # Everything the worker needs is copied here when the job is queued,
+        # so later changes in the window never reach a running job.
+        self.options = options
+        self.state = PENDING
+        self.stage = None
+        self.fraction = 0.0
+        self.rate = 0.0
+        self.eta = None
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+
+def expand_paths(paths, mode: str) -> list[str]:
+    # Folders are walked recursively; when unlocking, only .tar files are
+    # picked up from them.
+    files = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if mode == "unlock" and not name.endswith(".tar"):
+                        continue
+                    files.append(os.path.join(root, name))
+        elif path.is_file():
+            files.append(str(path))
+    return files
+
+
+class JobQueue:
+    # Runs lock/unlock jobs on a bounded thread pool. Workers never touch
+    # widgets: every state change is put on `events` as (kind, job) and the
+    # window drains it from a single after() loop.
+
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        self.jobs = []
+        self.events = queue.Queue()
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._ids = itertools.count(1)
+
+    def set_workers(self, workers: int):
+        # Running jobs finish on the old pool; queued ones move over.
+        if workers == self.workers:
+            return
+        old = self.executor
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        for job in self.jobs:
+            if job.state == PENDING and job.future is not None:
+                if job.future.cancel():
+                    job.future = self.executor.submit(self._run, job)
+        old.shutdown(wait=False)
+
+    def add(self, mode: str, paths, options: dict) -> list[Job]:
+        added = []
+        for path in paths:
+            job = Job(next(self._ids), mode, path, dict(options))
+            self.jobs.append(job)
+            self._submit(job)
+            added.append(job)
+        return added
+
+    def _submit(self, job: Job):
+        job.state = PENDING
+        job.cancel_event.clear()
+        job.future = self.executor.submit(self._run, job)
+        self.events.put(("queued", job))
+
+    def cancel(self, job: Job):
+        if job.state in FINISHED:
+            return
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.state = CANCELLED
+            self.events.put(("finished", job))
+
+    def cancel_all(self):
+        for job in self.jobs:
+            self.cancel(job)
+
+    def retry(self, job: Job):
+        if job.state not in (FAILED, CANCELLED):
+            return
+        job.stage = None
+        job.fraction = 0.0
+        job.rate = 0.0
+        job.eta = None
+        job.result = None
+        job.error = None
+        self._submit(job)
+
+    def retry_failed(self):
+        for job in self.jobs:
+            self.retry(job)
+
+    def clear_finished(self):
+        self.jobs = [job for job in self.jobs if job.state not in FINISHED]
+
+    def counts(self) -> dict:
+        counts = dict.fromkeys((PENDING, RUNNING, DONE, FAILED, CANCELLED), 0)
+        for job in self.jobs:
+            counts[job.state] += 1
+        return counts
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False)
+
+    def _run(self, job: Job):
+        if job.cancel_event.is_set():
+            job.state = CANCELLED
+            self.events.put(("finished", job))
+            return
+
+        job.state = RUNNING
+        self.events.put(("started", job))
+
+        def report(info):
+            # Called at most every PROGRESS_INTERVAL; raising here unwinds
+            # lock_file/unlock_file, which remove their partial output.
+            if job.cancel_event.is_set():
+                raise JobCancelled()
+            total = info["total"]
+            job.stage = info["stage"]
+            job.fraction = info["done"] / total if total else 1.0
+            job.rate = info["rate"]
+            job.eta = info["eta"]
+            self.events.put(("progress", job))
+
+        try:
+            if job.mode == "lock":
+                job.result = lock_file(
+                    job.path,
+                    job.options["password"],
+                    compression=job.options["compression"],
+                    progress=report,
+                )
+            else:
+                job.result = unlock_file(
+                    job.path, job.options["password"], progress=report
+                )
+            job.state = DONE
+            job.fraction = 1.0
+        except JobCancelled:
+            job.state = CANCELLED
+        except WrongPasswordError:
+            job.state = FAILED
+            job.error = "密码错误"
+        except Exception as e:
+            job.state = FAILED
+            job.error = str(e)
+        self.events.put(("finished", job))
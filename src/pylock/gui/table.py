@@ -0,0 +1,222 @@
+from collections import OrderedDict
+
+import customtkinter as ctk
+
+
+ROW_HEIGHT = 32
+PAGE_SIZE = 200
+MAX_CACHED_PAGES = 16
+
+ROW_COLORS = (("gray85", "gray17"), ("gray90", "gray14"))
+SELECTED_COLOR = ("#aecbeb", "#1f4a73")
+
+
+class ListSource:
+    def __init__(self, data: list):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def rows(self, start: int, count: int) -> list:
+        return self.data[start : start + count]
+
+
+class IndexSource:
+    # Search results held as positions in a SearchIndex; only the rows on
+    # screen are resolved to records.
+
+    def __init__(self, log, index, positions):
+        self.log = log
+        self.index = index
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def rows(self, start: int, count: int) -> list:
+        positions = self.positions[start : start + count]
+        return self.log.by_ids(self.index.record_ids(positions))
+
+
+class LogSource:
+    # Reads the ciphertext log lazily in fixed-size pages and keeps only
+    # the most recently used pages, so memory does not grow with history.
+
+    def __init__(self, log):
+        self.log = log
+        self.total = log.count()
+        self.pages = OrderedDict()
+
+    def __len__(self):
+        return self.total
+
+    def rows(self, start: int, count: int) -> list:
+        end = min(start + count, self.total)
+        result = []
+        index = start
+        while index < end:
+            page_index, offset = divmod(index, PAGE_SIZE)
+            page = self._page(page_index)[offset : offset + end - index]
+            if not page:
+                break
+            result.extend(page)
+            index += len(page)
+        return result
+
+    def _page(self, page_index: int) -> list:
+        page = self.pages.get(page_index)
+        if page is None:
+            page = self.log.page(page_index * PAGE_SIZE, PAGE_SIZE)
+            self.pages[page_index] = page
+            if len(self.pages) > MAX_CACHED_PAGES:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(page_index)
+        return page
+
+
+class VirtualTable(ctk.CTkFrame):
+    # Only creates widgets for the rows that fit in the viewport and
+    # rebinds them to new records when scrolling, so rendering cost is
+    # independent of how many records the source holds.
+
+    def __init__(self, master, columns, row_height: int = ROW_HEIGHT, **kwargs):
+        super().__init__(master, **kwargs)
+
+        self.columns = columns
+        self.row_height = row_height
+        self.source = ListSource([])
+        self.first = 0
+        self.rows = []
+        # Selection is tracked by the record's "id" so it survives scrolling
+        # and refreshed sources; on_select is called with the clicked record.
+        self.selected_id = None
+        self.on_select = None
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        header_frame = ctk.CTkFrame(self, fg_color="transparent")
+        header_frame.grid(row=0, column=0, sticky="ew")
+        for column, (_, title) in enumerate(columns):
+            header_frame.grid_columnconfigure(column, weight=1, uniform="column")
+            ctk.CTkLabel(
+                header_frame, text=title, font=ctk.CTkFont(weight="bold"), anchor="w"
+            ).grid(row=0, column=column, sticky="ew", padx=10, pady=5)
+
+        self.body = ctk.CTkFrame(self, fg_color="transparent")
+        self.body.grid(row=1, column=0, sticky="nsew")
+        self.body.grid_columnconfigure(0, weight=1)
+        self.body.grid_propagate(False)
+        self.body.bind("<Configure>", self.on_resize)
+        self.bind_scroll(self.body)
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.grid(row=1, column=1, sticky="ns")
+
+        self.empty_label = ctk.CTkLabel(self.body, text="", text_color="gray")
+
+    def bind_scroll(self, widget):
+        widget.bind("<MouseWheel>", self.on_mouse_wheel, add="+")
+        widget.bind("<Button-4>", lambda e: self.scroll_to(self.first - 3), add="+")
+        widget.bind("<Button-5>", lambda e: self.scroll_to(self.first + 3), add="+")
+
+    def set_source(self, source, empty_text: str = ""):
+        self.source = source
+        self.first = 0
+        self.empty_label.configure(text=empty_text)
+        self.render()
+
+    def on_resize(self, event):
+        pitch = self._apply_widget_scaling(self.row_height + 1)
+        visible = max(1, int(event.height // pitch))
+        while len(self.rows) < visible:
+            self.rows.append(self.create_row(len(self.rows)))
+        while len(self.rows) > visible:
+            frame, _, _ = self.rows.pop()
+            frame.destroy()
+        self.scroll_to(self.first, force=True)
+
+    def create_row(self, position: int):
+        frame = ctk.CTkFrame(self.body, height=self.row_height, corner_radius=0)
+        frame.grid(row=position, column=0, sticky="ew", pady=(0, 1))
+        frame.grid_propagate(False)
+        frame.grid_rowconfigure(0, weight=1)
+        self.bind_scroll(frame)
+
+        labels = []
+        for column in range(len(self.columns)):
+            frame.grid_columnconfigure(column, weight=1, uniform="column")
+            label = ctk.CTkLabel(frame, text="", anchor="w")
+            label.grid(row=0, column=column, sticky="ew", padx=10)
+            self.bind_scroll(label)
+            label.bind("<Button-1>", lambda e: self.select_row(position), add="+")
+            labels.append(label)
+        frame.bind("<Button-1>", lambda e: self.select_row(position), add="+")
+
+        # [frame, labels, (color, texts) currently shown]
+        return [frame, labels, None]
+
+    def select_row(self, position: int):
+        records = self.source.rows(self.first + position, 1)
+        if not records:
+            return
+        self.selected_id = records[0].get("id")
+        self.render()
+        if self.on_select:
+            self.on_select(records[0])
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * len(self.source)))
+        elif action == "scroll":
+            step = len(self.rows) if unit == "pages" else 1
+            self.scroll_to(self.first + int(value) * step)
+
+    def on_mouse_wheel(self, event):
+        # Windows reports multiples of 120 per notch, macOS small deltas.
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        self.scroll_to(self.first - delta * 3)
+
+    def scroll_to(self, first: int, force: bool = False):
+        first = max(0, min(first, len(self.source) - len(self.rows)))
+        if first != self.first or force:
+            self.first = first
+            self.render()
+
+    def render(self):
+        records = self.source.rows(self.first, len(self.rows))
+
+        for position, row in enumerate(self.rows):
+            frame, labels, shown = row
+            if position < len(records):
+                record = records[position]
+                if (
+                    self.selected_id is not None
+                    and record.get("id") == self.selected_id
+                ):
+                    color = SELECTED_COLOR
+                else:
+                    color = ROW_COLORS[(self.first + position) % 2]
+                texts = tuple(str(record.get(key, "")) for key, _ in self.columns)
+            else:
+                color = "transparent"
+                texts = ("",) * len(self.columns)
+
+            if shown is None or shown[0] != color:
+                frame.configure(fg_color=color)
+            for column, label in enumerate(labels):
+                if shown is None or shown[1][column] != texts[column]:
+                    label.configure(text=texts[column])
+            row[2] = (color, texts)
+
+        total = len(self.source)
+        if total:
+            self.empty_label.place_forget()
+            self.scrollbar.set(
+                self.first / total, min(1.0, (self.first + len(self.rows)) / total)
+            )
+        else:
+            self.empty_label.place(relx=0.5, y=20, anchor="n")
+            self.scrollbar.set(0.0, 1.0)
@@ -1,166 +1,931 @@
+import io
 import json
 import os
-import random
 import shutil
-import string
-import sys
 import tarfile
-import tempfile
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
-import pyzipper
-
-
-def get_program_dir() -> Path:
-    if getattr(sys, "frozen", False):
-        return Path(sys.executable).parent
-    return Path(__file__).parent.parent
-
-
-def generate_random_string(length: int = 20) -> str:
-    chars = string.ascii_letters + string.digits
-    return "".join(random.choice(chars) for _ in range(length))
+from .backends import (
+    CHUNK_SIZE,
+    DEFAULT_BACKEND,
+    backend_for_member,
+    generate_random_string,
+    get_backend,
+)
+from .compression import resolve_compression
+from .pool import default_workers, imap_ordered
+from .profiling import count, stage
+from .progress import Progress
+from .store import CiphertextLog
+
+
+# Resumable locks make their partial output durable (fsync plus an updated
+# checkpoint) after about this many bytes; an interrupted run redoes at most
+# this much work.
+RESUME_CHECKPOINT_BYTES = 64 * 1024 * 1024
+CHECKPOINT_VERSION = 1
+# A tar member's size goes in its header, which cannot be patched on a
+# pipe; streamed archives therefore split the encrypted payload into
+# members of this size, buffered in memory one at a time.
+PIPE_SEGMENT_SIZE = 8 * 1024 * 1024
 
 
 def update_ciphertext_log(
-    original_name: str, encrypted_name: str, log_path: str | Path
+    original_name: str, encrypted_name: str, log_path: str | Path | None = None
 ):
-    log_path = Path(log_path)
-
-    if not log_path.exists():
-        with open(log_path, "w", encoding="utf-8") as f:
-            json.dump([], f, ensure_ascii=False, indent=4)
+    with CiphertextLog(log_path) as log:
+        log.append(original_name, encrypted_name)
+
+
+class _OffsetFile:
+    def __init__(self, fp, base: int):
+        self.fp = fp
+        self.base = base
+        self.name = getattr(fp, "name", None)
+
+    def write(self, data) -> int:
+        return self.fp.write(data)
+
+    def tell(self) -> int:
+        return self.fp.tell() - self.base
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 0:
+            offset += self.base
+        return self.fp.seek(offset, whence) - self.base
+
+    def flush(self):
+        self.fp.flush()
+
+
+# Streams a tar member of unknown size: a placeholder header is written
+# first and patched with the real size on close, so the payload never has
+# to be staged on disk.
+class _TarMemberWriter:
+    def __init__(self, fp, name: str):
+        self.fp = fp
+        self.info = tarfile.TarInfo(name)
+        self.info.mtime = int(time.time())
+        self.header_offset = fp.tell()
+        fp.write(self._header())
+        self.data_offset = fp.tell()
+
+    def _header(self) -> bytes:
+        # GNU format keeps the header at one block even for sizes >= 8 GiB,
+        # which lets the placeholder be overwritten in place.
+        return self.info.tobuf(tarfile.GNU_FORMAT, "utf-8", "surrogateescape")
+
+    def open(self) -> _OffsetFile:
+        return _OffsetFile(self.fp, self.data_offset)
+
+    def close(self):
+        end = self.fp.tell()
+        self.info.size = end - self.data_offset
+        _, remainder = divmod(self.info.size, tarfile.BLOCKSIZE)
+        if remainder:
+            self.fp.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            end = self.fp.tell()
+        self.fp.seek(self.header_offset)
+        self.fp.write(self._header())
+        self.fp.seek(end)
+
+
+class _TarSegmentWriter:
+    # Forward-only counterpart of _TarMemberWriter: writes go to a buffer
+    # that is emitted as <name>.<n><suffix> members of PIPE_SEGMENT_SIZE,
+    # which readers join back together in order.
+    def __init__(self, tf: tarfile.TarFile, name: str, suffix: str):
+        self.tf = tf
+        self.name = name
+        self.suffix = suffix
+        self.buffer = bytearray()
+        self.index = 0
+
+    def write(self, data) -> int:
+        self.buffer += data
+        while len(self.buffer) >= PIPE_SEGMENT_SIZE:
+            self._emit(PIPE_SEGMENT_SIZE)
+        return len(data)
+
+    def _emit(self, size: int):
+        info = tarfile.TarInfo(f"{self.name}.{self.index:06d}{self.suffix}")
+        info.size = size
+        info.mtime = int(time.time())
+        with memoryview(self.buffer) as view:
+            self.tf.addfile(info, io.BytesIO(view[:size]))
+        del self.buffer[:size]
+        self.index += 1
+
+    def close(self):
+        if self.buffer or not self.index:
+            self._emit(len(self.buffer))
+
+
+class _SegmentReader:
+    # Reads consecutive tar members as one stream.
+    def __init__(self, tf: tarfile.TarFile, members):
+        self.tf = tf
+        self.members = iter(members)
+        self.fp = None
+        self._advance()
+
+    def _advance(self):
+        if self.fp is not None:
+            self.fp.close()
+        member = next(self.members, None)
+        self.fp = self.tf.extractfile(member) if member is not None else None
+
+    def read(self, size: int = -1) -> bytes:
+        parts = []
+        while self.fp is not None and size != 0:
+            data = self.fp.read(size)
+            if not data:
+                self._advance()
+                continue
+            parts.append(data)
+            if size > 0:
+                size -= len(data)
+        return b"".join(parts)
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+
+def _finish_tar(out, member: _TarMemberWriter, original_name: str, progress):
+    if progress is not None:
+        progress.finish()
+        progress.start("tar", out.tell())
+
+    with stage("tar") as s:
+        payload_end = out.tell()
+        member.close()
+        decoy = tarfile.TarInfo(f"{original_name}.txt")
+        decoy.mtime = int(time.time())
+        with tarfile.open(fileobj=out, mode="w") as tf:
+            tf.addfile(decoy)
+        s.bytes = out.tell() - payload_end
+
+    if progress is not None:
+        progress.update(progress.total)
+        progress.finish()
+
+
+def _list_directory(directory: Path) -> list[tuple[Path, str]]:
+    # (path, archive path) for every file below directory, with "/"
+    # separators so archives unpack the same on any platform.
+    return [
+        (path, path.relative_to(directory).as_posix())
+        for path in sorted(directory.rglob("*"))
+        if path.is_file()
+    ]
+
+
+def resume_paths(target_path: str | Path, output_dir: Path | str | None = None):
+    # The partial archive and checkpoint of a resumable lock. Unlike the
+    # final .tar they are named after the target, so a rerun finds them.
+    target_path = Path(target_path)
+    output_dir = target_path.parent if output_dir is None else Path(output_dir)
+    return (
+        output_dir / f"{target_path.name}.pylock-part",
+        output_dir / f"{target_path.name}.pylock-checkpoint",
+    )
 
-    if log_path.exists():
-        with open(log_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    else:
-        data = []
 
-    data.append(
-        {
-            "original_name": original_name,
-            "encrypted_name": encrypted_name,
+def _load_checkpoint(checkpoint_path: Path, partial_path: Path, source, backend):
+    # Returns the saved checkpoint if it still describes the same input and
+    # its partial output, otherwise None (start over).
+    try:
+        saved = json.loads(checkpoint_path.read_text(encoding="utf-8"))
+        partial_size = partial_path.stat().st_size
+    except Exception:
+        return None
+    if (
+        saved.get("version") != CHECKPOINT_VERSION
+        or saved.get("backend") != backend
+        or saved.get("source_size") != source.st_size
+        or saved.get("source_mtime_ns") != source.st_mtime_ns
+        or saved.get("offset") is None
+        or partial_size < saved["offset"]
+    ):
+        return None
+    return saved
+
+
+def _save_checkpoint(checkpoint_path: Path, saved: dict):
+    temp_path = checkpoint_path.with_name(f"{checkpoint_path.name}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(saved, f)
+        f.flush()
+        os.fsync(f.fileno())
+    count("fsync")
+    os.replace(temp_path, checkpoint_path)
+    count("rename")
+
+
+def _lock_resumable(
+    target_path: Path, password: str, output_dir: Path, engine, progress
+):
+    original_name = target_path.name
+    partial_path, checkpoint_path = resume_paths(target_path, output_dir)
+    source = target_path.stat()
+
+    saved = _load_checkpoint(checkpoint_path, partial_path, source, engine.name)
+    resuming = saved is not None
+    if not resuming:
+        saved = {
+            "version": CHECKPOINT_VERSION,
+            "backend": engine.name,
+            "source_size": source.st_size,
+            "source_mtime_ns": source.st_mtime_ns,
+            "encrypted_name": generate_random_string(20),
+            "member_name": f"{generate_random_string(20)}{engine.member_suffix}",
+            "offset": None,
+            "stream": None,
         }
-    )
-
-    with open(log_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    tar_path = output_dir / f"{saved['encrypted_name']}.tar"
+
+    if progress is not None:
+        done = saved["stream"]["read"] if resuming else 0
+        progress.start("encrypt", source.st_size - done)
+
+    last_saved = saved["offset"] or 0
+
+    def checkpoint(state):
+        nonlocal last_saved
+        offset = out.tell()
+        if offset - last_saved < RESUME_CHECKPOINT_BYTES:
+            return
+        out.flush()
+        os.fsync(out.fileno())
+        count("fsync")
+        saved.update(offset=offset, stream=state)
+        _save_checkpoint(checkpoint_path, saved)
+        last_saved = offset
+
+    try:
+        with open(partial_path, "r+b" if resuming else "wb") as out:
+            # Rewrites the same placeholder header; the real size is
+            # patched in by member.close() as usual.
+            member = _TarMemberWriter(out, saved["member_name"])
+            if resuming:
+                out.seek(saved["offset"])
+                out.truncate()
+            with stage("encrypt", backend=engine.name, compression="stored") as s:
+                stats = engine.write_resumable(
+                    member.open(),
+                    target_path,
+                    password,
+                    original_name,
+                    saved["stream"],
+                    checkpoint,
+                    progress,
+                )
+                s.bytes = stats["size"] - stats["resumed_from"]
+            _finish_tar(out, member, original_name, progress)
+            out.flush()
+            os.fsync(out.fileno())
+            count("fsync")
+        os.replace(partial_path, tar_path)
+        count("rename")
+    except BaseException as e:
+        # Interruptions (Ctrl-C, I/O errors) keep the partial output for the
+        # next run. Anything else aborts the lock: a partial output this run
+        # created is removed, one being resumed is kept, e.g. for a retry
+        # with the right password.
+        interrupted = isinstance(e, (KeyboardInterrupt, SystemExit, OSError))
+        if not interrupted and not resuming:
+            with stage("cleanup"):
+                partial_path.unlink(missing_ok=True)
+                checkpoint_path.unlink(missing_ok=True)
+                count("unlink", 2)
+        raise
+
+    checkpoint_path.unlink(missing_ok=True)
+    count("unlink")
+    return saved["encrypted_name"], tar_path, stats
 
 
 def lock_file(
-    target_path: str | Path, password: str, output_dir: Path | str | None = None
+    target_path: str | Path,
+    password: str,
+    output_dir: Path | str | None = None,
+    log: bool = True,
+    compression: str = "stored",
+    compresslevel: int | None = None,
+    chunk_size: int | None = None,
+    workers: int | None = None,
+    backend: str = DEFAULT_BACKEND,
+    progress=None,
+    resume: bool = False,
 ):
+    # progress, if given, is called with a dict (stage, done, total, elapsed,
+    # rate, eta) for the "encrypt" and "tar" stages, at most every
+    # PROGRESS_INTERVAL seconds.
+    #
+    # resume writes to resume_paths() instead and checkpoints as it goes;
+    # after an interruption, calling lock_file again with resume=True picks
+    # up from the last checkpoint. Needs a backend that supports it
+    # (aes-gcm) and an uncompressed payload.
+    #
+    # A directory is packed into a single multi-file archive (winzip-aes);
+    # chunk_size then sets how large files are split.
     target_path = Path(target_path)
     if not target_path.exists():
         raise FileNotFoundError(f"Target file not found: {target_path}")
 
+    engine = get_backend(backend)
+
+    files = None
+    if target_path.is_dir():
+        if resume:
+            raise ValueError("Resumable locking does not support directories")
+        files = _list_directory(target_path)
+
+    sampling_started = time.perf_counter()
+    with stage("sample"):
+        if files:
+            # One method for the whole archive, picked for the file that
+            # dominates its size.
+            sample = max((path for path, _ in files), key=lambda p: p.stat().st_size)
+        else:
+            sample = target_path
+        compression = resolve_compression(compression, sample)
+    sampling_seconds = time.perf_counter() - sampling_started
+
     if output_dir is None:
         output_dir = target_path.parent
     else:
         output_dir = Path(output_dir)
 
-    original_name = target_path.name
+    # Path(".").name is empty; a directory given that way goes by its own name.
+    original_name = Path(os.path.abspath(target_path)).name
 
-    encrypted_name = generate_random_string(20)
-    zip_random_name = generate_random_string(20)
-    cipher_random_name = generate_random_string(20)
-    cipher_file_name = f"{cipher_random_name}.ciper"
-
-    cipher_content = original_name.encode("utf-8")
-    cipher_temp_path = output_dir / cipher_file_name
-    with open(cipher_temp_path, "wb") as f:
-        f.write(cipher_content)
-
-    zip_path = output_dir / f"{zip_random_name}.zip"
-    with pyzipper.AESZipFile(zip_path, "w") as zf:
-        zf.setpassword(password.encode("utf-8"))
-        zf.setencryption(pyzipper.WZ_AES)
-        zf.write(target_path, encrypted_name)
-        zf.write(cipher_temp_path, cipher_file_name)
-
-    txt_file_path = output_dir / f"{original_name}.txt"
-    with open(txt_file_path, "w", encoding="utf-8") as f:
-        pass
-
-    os.remove(cipher_temp_path)
-
-    tar_path = output_dir / f"{encrypted_name}.tar"
-    with tarfile.open(tar_path, "w") as tf:
-        tf.add(zip_path, arcname=f"{zip_random_name}.zip")
-        tf.add(txt_file_path, arcname=f"{original_name}.txt")
-
-    os.remove(zip_path)
-    os.remove(txt_file_path)
+    if progress is not None:
+        progress = Progress(progress)
 
-    ciphertext_log_path = get_program_dir() / "cipertext.json"
-    update_ciphertext_log(original_name, encrypted_name, ciphertext_log_path)
+    if resume:
+        if compression != "stored" or chunk_size:
+            raise ValueError(
+                "Resumable locking does not support compression or chunking"
+            )
+        encrypted_name, tar_path, stats = _lock_resumable(
+            target_path, password, output_dir, engine, progress
+        )
+    else:
+        encrypted_name = generate_random_string(20)
+        member_random_name = generate_random_string(20)
+
+        if progress is not None:
+            if files is None:
+                total = target_path.stat().st_size
+            else:
+                total = sum(path.stat().st_size for path, _ in files)
+            progress.start("encrypt", total)
+
+        tar_path = output_dir / f"{encrypted_name}.tar"
+        try:
+            with open(tar_path, "wb") as out:
+                member = _TarMemberWriter(
+                    out, f"{member_random_name}{engine.member_suffix}"
+                )
+                with stage(
+                    "encrypt", backend=engine.name, compression=compression
+                ) as s:
+                    if files is None:
+                        stats = engine.write(
+                            member.open(),
+                            target_path,
+                            password,
+                            original_name,
+                            encrypted_name,
+                            compression,
+                            compresslevel,
+                            chunk_size,
+                            workers,
+                            progress,
+                        )
+                    else:
+                        stats = engine.write_files(
+                            member.open(),
+                            files,
+                            password,
+                            original_name,
+                            compression,
+                            compresslevel,
+                            chunk_size,
+                            workers,
+                            progress,
+                        )
+                    s.bytes = stats["size"]
+                _finish_tar(out, member, original_name, progress)
+        except BaseException:
+            with stage("cleanup"):
+                tar_path.unlink(missing_ok=True)
+                count("unlink")
+            raise
+
+    if log:
+        with stage("log"):
+            update_ciphertext_log(original_name, encrypted_name)
 
     return {
         "original_name": original_name,
         "encrypted_name": encrypted_name,
         "tar_path": str(tar_path),
+        "backend": engine.name,
+        "compression": compression,
+        "size": stats["size"],
+        "compressed_size": stats["compressed_size"],
+        "saved_bytes": stats["size"] - stats["compressed_size"],
+        "compress_seconds": sampling_seconds + stats["compress_seconds"],
+        "resumed_from": stats.get("resumed_from", 0),
     }
 
 
-def unlock_file(tar_path: str | Path, password: str) -> dict:
+@contextmanager
+def _partial_output(final_path: Path):
+    # Yields a sibling .part path that replaces final_path only once it has
+    # been written completely; it is removed again on any failure.
+    partial_path = final_path.with_name(f"{final_path.name}.part")
+    try:
+        yield partial_path
+        os.replace(partial_path, final_path)
+        count("rename")
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        count("unlink")
+        raise
+
+
+def _extract_to_path(blocks, final_path: Path, progress: Progress | None = None) -> int:
+    written = 0
+    with _partial_output(final_path) as partial_path:
+        with open(partial_path, "wb") as dst:
+            for block in blocks:
+                dst.write(block)
+                written += len(block)
+                if progress is not None:
+                    progress.update(len(block))
+    return written
+
+
+def _find_encrypted_members(tf: tarfile.TarFile):
+    # One member normally; the segments of a streamed archive otherwise.
+    members = []
+    backend = None
+    for member in tf.getmembers():
+        if member.isfile():
+            found = backend_for_member(member.name)
+            if found is not None and backend in (None, found):
+                members.append(member)
+                backend = found
+    if not members:
+        raise FileNotFoundError("Encrypted archive not found in TAR")
+    return members, backend
+
+
+class _LockedArchive:
+    # Opens the encrypted member in place inside the tar and hands it to the
+    # backend matching its suffix, which decodes the metadata.
+
+    def __init__(self, tar_path: str | Path, password: str):
+        self.tf = tarfile.open(tar_path, "r")
+        self.member_fp = None
+        self.reader = None
+        try:
+            self.members, self.backend = _find_encrypted_members(self.tf)
+            self.member = self.members[0]
+            if len(self.members) == 1:
+                self.member_fp = self.tf.extractfile(self.member)
+            else:
+                self.member_fp = _SegmentReader(self.tf, self.members)
+            self.reader = self.backend.open(self.member_fp, password)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+        if self.member_fp is not None:
+            self.member_fp.close()
+        self.tf.close()
+
+    @property
+    def manifest(self) -> dict:
+        return self.reader.manifest
+
+    @property
+    def original_name(self) -> str:
+        return self.manifest["name"]
+
+
+def _decrypt_chunk(
+    tar_path: str, password: str, name: str, offset: int, output_path: str
+) -> int:
+    # Runs in a worker process: decrypts one chunk straight into its slot of
+    # the pre-sized output file.
+    with (
+        _LockedArchive(tar_path, password) as archive,
+        archive.reader.open_member(name) as src,
+        open(output_path, "r+b") as dst,
+    ):
+        dst.seek(offset)
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        return dst.tell() - offset
+
+
+def _extract_chunks(
+    tar_path: Path,
+    password: str,
+    archive: _LockedArchive,
+    final_path: Path,
+    workers: int | None = None,
+    progress: Progress | None = None,
+):
+    manifest = archive.manifest
+    chunk_size = manifest["chunk_size"]
+    for index, info in enumerate(archive.reader.payload_members()):
+        expected = min(chunk_size, manifest["size"] - index * chunk_size)
+        if info.file_size != expected:
+            raise ValueError(f"Chunk {info.filename} has an unexpected size")
+
+    jobs = (
+        (str(tar_path), password, name, index * chunk_size)
+        for index, name in enumerate(manifest["chunks"])
+    )
+    with _partial_output(final_path) as partial_path:
+        with open(partial_path, "wb") as f:
+            f.truncate(manifest["size"])
+        jobs = (job + (str(partial_path),) for job in jobs)
+        written = 0
+        for chunk_written in imap_ordered(_decrypt_chunk, jobs, workers):
+            written += chunk_written
+            if progress is not None:
+                progress.update(chunk_written)
+        if written != manifest["size"]:
+            raise ValueError(f"Decrypted {written} bytes, expected {manifest['size']}")
+
+
+def _contained_path(directory: Path, path: Path, name: str) -> Path:
+    # Names stored in an archive are not trusted: whatever they hold, the
+    # path must resolve (symlinks included) to somewhere below directory.
+    base = directory.resolve()
+    resolved = path.resolve()
+    if resolved == base or not resolved.is_relative_to(base):
+        raise ValueError(f"Unsafe path in archive: {name!r}")
+    return path
+
+
+def _output_path(output_dir: Path, original_name: str) -> Path:
+    # original_name is a bare file name on lock; anything with a directory
+    # or drive part was not written by pylock.
+    if original_name in ("", ".", "..") or (
+        os.path.basename(original_name) != original_name
+    ):
+        raise ValueError(f"Unsafe path in archive: {original_name!r}")
+    return _contained_path(output_dir, output_dir / original_name, original_name)
+
+
+def _archive_file_path(root: Path, archive_path: str) -> Path:
+    parts = archive_path.split("/")
+    if archive_path.startswith("/") or any(p in ("", ".", "..") for p in parts):
+        raise ValueError(f"Unsafe path in archive: {archive_path!r}")
+    return _contained_path(root, root.joinpath(*parts), archive_path)
+
+
+def _extract_files(tar_path: str, password: str, entries: list, root: str) -> int:
+    # Runs in a worker process for a batch of files, so each worker opens the
+    # archive (and reads its manifest) once per batch rather than per file.
+    written = 0
+    with _LockedArchive(tar_path, password) as archive:
+        for entry in entries:
+            final_path = _archive_file_path(Path(root), entry["path"])
+            final_path.parent.mkdir(parents=True, exist_ok=True)
+            _extract_to_path(archive.reader.iter_file(entry), final_path)
+            written += entry["size"]
+    return written
+
+
+def _unlock_multi(
+    tar_path: Path,
+    password: str,
+    archive: _LockedArchive,
+    root: Path,
+    member: str | None,
+    workers: int | None,
+    progress: Progress | None,
+) -> tuple[Path, int]:
+    entries = archive.reader.files
+    if member is not None:
+        member = member.replace("\\", "/").strip("/")
+        entries = [entry for entry in entries if entry["path"] == member]
+        if not entries:
+            raise FileNotFoundError(f"{member} not found in {tar_path.name}")
+
+    total = sum(entry["size"] for entry in entries)
+    if progress is not None:
+        progress.start("decrypt", total)
+
+    for entry in entries:
+        _archive_file_path(root, entry["path"])
+
+    if member is not None or (workers or default_workers()) == 1:
+        for entry in entries:
+            final_path = _archive_file_path(root, entry["path"])
+            final_path.parent.mkdir(parents=True, exist_ok=True)
+            _extract_to_path(archive.reader.iter_file(entry), final_path, progress)
+    else:
+        workers = workers or default_workers()
+        size = max(1, -(-len(entries) // (workers * 4)))
+        jobs = (
+            (str(tar_path), password, entries[i : i + size], str(root))
+            for i in range(0, len(entries), size)
+        )
+        for written in imap_ordered(_extract_files, jobs, workers):
+            if progress is not None:
+                progress.update(written)
+
+    if progress is not None:
+        progress.finish()
+    root.mkdir(parents=True, exist_ok=True)
+    if member is not None:
+        return _archive_file_path(root, member), total
+    return root, total
+
+
+def unlock_file(
+    tar_path: str | Path,
+    password: str,
+    workers: int | None = None,
+    progress=None,
+    member: str | None = None,
+) -> dict:
+    # progress works as in lock_file, with a single "decrypt" stage: the
+    # plaintext is written out as it is decrypted.
+    #
+    # Multi-file archives unpack into a directory named after the original
+    # one; member picks a single file by its path inside the archive, and
+    # only that file's members are read.
     tar_path = Path(tar_path)
     if not tar_path.exists():
         raise FileNotFoundError(f"TAR file not found: {tar_path}")
 
     output_dir = tar_path.parent
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        with tarfile.open(tar_path, "r") as tf:
-            tf.extractall(temp_dir)
+    with stage("open"):
+        archive = _LockedArchive(tar_path, password)
+    with archive:
+        original_name = archive.original_name
+        decrypted_name = original_name
+        final_path = _output_path(output_dir, decrypted_name)
+
+        if archive.manifest["layout"] == "multi":
+            with stage("decrypt", backend=archive.backend.name) as s:
+                final_path, s.bytes = _unlock_multi(
+                    tar_path,
+                    password,
+                    archive,
+                    final_path,
+                    member,
+                    workers,
+                    Progress(progress) if progress is not None else None,
+                )
+            return {
+                "original_name": original_name,
+                "decrypted_name": decrypted_name,
+                "decrypted_path": str(final_path),
+            }
+        if member is not None:
+            raise ValueError(f"{tar_path.name} holds a single file")
+
+        if progress is not None:
+            progress = Progress(progress)
+            # Streamed archives do not know their size; the encrypted size
+            # is close enough for progress.
+            progress.start(
+                "decrypt",
+                archive.reader.payload_size or sum(m.size for m in archive.members),
+            )
+
+        with stage("decrypt", backend=archive.backend.name) as s:
+            if archive.reader.chunked:
+                _extract_chunks(
+                    tar_path, password, archive, final_path, workers, progress
+                )
+                s.bytes = archive.reader.payload_size
+            else:
+                s.bytes = _extract_to_path(
+                    archive.reader.iter_payload(), final_path, progress
+                )
+
+        if progress is not None:
+            progress.finish()
 
-        extracted_files = list(Path(temp_dir).iterdir())
+    return {
+        "original_name": original_name,
+        "decrypted_name": decrypted_name,
+        "decrypted_path": str(final_path),
+    }
 
-        zip_file = None
-        for f in extracted_files:
-            if f.suffix == ".zip":
-                zip_file = f
-                break
 
-        if zip_file is None:
-            raise FileNotFoundError("ZIP file not found in TAR")
-
-        zip_temp = Path(temp_dir) / "temp.zip"
-        shutil.copy(zip_file, zip_temp)
-        os.remove(zip_file)
-
-        extract_dir = Path(temp_dir) / "extracted"
-        extract_dir.mkdir()
-        with pyzipper.AESZipFile(zip_temp, "r") as zf:
-            zf.setpassword(password.encode("utf-8"))
-            zf.extractall(extract_dir)
-
-        cipher_file = None
-        original_name = None
-        for f in extract_dir.iterdir():
-            if f.suffix == ".ciper":
-                cipher_file = f
-                original_name = f.read_text(encoding="utf-8")
-                break
+def verify_file(tar_path: str | Path, password: str) -> dict:
+    tar_path = Path(tar_path)
+    if not tar_path.exists():
+        raise FileNotFoundError(f"TAR file not found: {tar_path}")
 
-        if original_name is None:
-            raise FileNotFoundError(".ciper file not found in ZIP")
+    with stage("open"):
+        archive = _LockedArchive(tar_path, password)
+    with archive:
+        tar_members = archive.tf.getmembers()
+        others = [m for m in tar_members if m not in archive.members]
+        if len(others) != 1 or not others[0].isfile():
+            raise ValueError(f"Unexpected TAR layout: {[m.name for m in tar_members]}")
+        decoy = others[0]
+        archive.reader.check_layout()
+
+        original_name = archive.original_name
+        if decoy.name != f"{original_name}.txt" or decoy.size != 0:
+            raise ValueError(
+                f"Decoy {decoy.name!r} does not match original name {original_name!r}"
+            )
+
+        # The plaintext is decrypted and discarded; every backend checks its
+        # authentication tags while the payload is read to the end.
+        with stage("verify", backend=archive.backend.name) as s:
+            size = s.bytes = sum(len(b) for b in archive.reader.iter_payload())
+
+        if (
+            archive.manifest.get("size") is not None
+            and size != archive.manifest["size"]
+        ):
+            raise ValueError(
+                f"Payload is {size} bytes, manifest says {archive.manifest['size']}"
+            )
 
-        decrypted_file = None
-        for f in extract_dir.iterdir():
-            if f.suffix != ".ciper":
-                decrypted_file = f
-                break
+    return {
+        "original_name": original_name,
+        "size": size,
+        "tar_path": str(tar_path),
+    }
 
-        if decrypted_file is None:
-            raise FileNotFoundError("Encrypted file not found in ZIP")
 
-        decrypted_name = original_name
-        final_path = output_dir / decrypted_name
-        shutil.copy(decrypted_file, final_path)
+def inspect_file(tar_path: str | Path, password: str, list_files: bool = False) -> dict:
+    # Reads the tar headers and the encrypted metadata only (the .ciper
+    # entry or the first AES-GCM record), never the payload, so it takes
+    # about as long for a huge archive as for a small one. list_files adds
+    # the path and size of every file in a multi-file archive.
+    tar_path = Path(tar_path)
+    if not tar_path.exists():
+        raise FileNotFoundError(f"TAR file not found: {tar_path}")
 
-        return {
-            "original_name": original_name,
-            "decrypted_name": decrypted_name,
-            "decrypted_path": str(final_path),
+    with stage("open"):
+        archive = _LockedArchive(tar_path, password)
+    with archive:
+        result = {
+            "original_name": archive.original_name,
+            "size": archive.reader.payload_size,
+            "tar_path": str(tar_path),
+            "archive_size": tar_path.stat().st_size,
+            "backend": archive.backend.name,
+            **archive.reader.describe(),
         }
+        if list_files and archive.manifest["layout"] == "multi":
+            result["file_list"] = [
+                {"path": entry["path"], "size": entry["size"]}
+                for entry in archive.reader.files
+            ]
+    return result
+
+
+def lock_stream(
+    src,
+    dst,
+    password: str,
+    original_name: str,
+    log: bool = True,
+    compression: str = "stored",
+    compresslevel: int | None = None,
+    backend: str = "aes-gcm",
+    progress=None,
+) -> dict:
+    # Reads plaintext from the binary file object src until EOF and writes
+    # the tar to dst strictly front to back, so both can be pipes. Memory
+    # stays at about one segment plus one record. Needs a backend that can
+    # stream (aes-gcm).
+    engine = get_backend(backend)
+    if compression == "auto":
+        raise ValueError("Compression 'auto' needs a file to sample")
+
+    encrypted_name = generate_random_string(20)
+    member_random_name = generate_random_string(20)
+    if progress is not None:
+        # The total is unknown, so only bytes and rate are meaningful.
+        progress = Progress(progress)
+        progress.start("encrypt", 0)
+
+    with tarfile.open(fileobj=dst, mode="w|", format=tarfile.GNU_FORMAT) as tf:
+        segments = _TarSegmentWriter(tf, member_random_name, engine.member_suffix)
+        with stage("encrypt", backend=engine.name, compression=compression) as s:
+            stats = engine.write_stream(
+                segments,
+                src,
+                password,
+                original_name,
+                compression,
+                compresslevel,
+                progress,
+            )
+            segments.close()
+            s.bytes = stats["size"]
+        decoy = tarfile.TarInfo(f"{original_name}.txt")
+        decoy.mtime = int(time.time())
+        tf.addfile(decoy)
+    dst.flush()
+
+    if progress is not None:
+        progress.finish()
+
+    if log:
+        with stage("log"):
+            update_ciphertext_log(original_name, encrypted_name)
+
+    return {
+        "original_name": original_name,
+        "encrypted_name": encrypted_name,
+        "backend": engine.name,
+        "compression": compression,
+        "size": stats["size"],
+        "compressed_size": stats["compressed_size"],
+        "saved_bytes": stats["size"] - stats["compressed_size"],
+        "compress_seconds": stats["compress_seconds"],
+    }
+
+
+def unlock_stream(src, dst, password: str, progress=None) -> dict:
+    # Reads a tar from src front to back (no seeking) and writes the
+    # plaintext to dst as each record is authenticated. Only archives with
+    # a stream layout (aes-gcm) can be read this way; ZIP-based ones need
+    # their central directory at the end. A corrupted or truncated archive
+    # raises, but whatever was decrypted before that has been written.
+    with tarfile.open(fileobj=src, mode="r|") as tf:
+        first = None
+        for member in tf:
+            if member.isfile() and backend_for_member(member.name) is not None:
+                first = member
+                break
+        if first is None:
+            raise FileNotFoundError("Encrypted archive not found in TAR")
+        backend = backend_for_member(first.name)
+        if not backend.can_stream:
+            raise ValueError(
+                f"{backend.name} archives cannot be read from a stream; "
+                "unlock the file instead"
+            )
+
+        def segments():
+            yield first
+            # tf.next() skips whatever is left of the previous member.
+            while (member := tf.next()) is not None:
+                if backend_for_member(member.name) is not backend:
+                    return
+                yield member
+
+        payload = _SegmentReader(tf, segments())
+        with stage("open"):
+            reader = backend.open(payload, password)
+        try:
+            if reader.manifest["layout"] != "stream":
+                raise ValueError(
+                    f"{backend.name} archives with a {reader.manifest['layout']} "
+                    "layout cannot be read from a stream"
+                )
+            if progress is not None:
+                progress = Progress(progress)
+                progress.start("decrypt", reader.payload_size or 0)
+            size = 0
+            with stage("decrypt", backend=backend.name) as s:
+                for block in reader.iter_payload():
+                    dst.write(block)
+                    size += len(block)
+                    if progress is not None:
+                        progress.update(len(block))
+                s.bytes = size
+            dst.flush()
+            if progress is not None:
+                progress.finish()
+        finally:
+            reader.close()
+            payload.close()
+
+    return {"original_name": reader.manifest["name"], "size": size}
@@ -0,0 +1,76 @@
+import os
+from collections import deque
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def imap_unordered(func, items, workers: int | None = None):
+    # Yields (index, result, error) as work completes, keeping at most
+    # 2 * workers items in flight so huge batches stay memory bounded.
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    workers = workers or default_workers()
+    items = enumerate(items)
+
+    if workers == 1:
+        for index, args in items:
+            try:
+                yield index, func(*args), None
+            except Exception as e:
+                yield index, None, e
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+
+        def submit_next():
+            for index, args in items:
+                pending[pool.submit(func, *args)] = index
+                return
+
+        for _ in range(workers * 2):
+            submit_next()
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    yield index, future.result(), None
+                except Exception as e:
+                    yield index, None, e
+                submit_next()
+
+
+def imap_ordered(func, items, workers: int | None = None):
+    # Yields results in input order with at most 2 * workers items in
+    # flight; the first error is raised and the remaining work cancelled.
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or default_workers()
+
+    if workers == 1:
+        for args in items:
+            yield func(*args)
+        return
+
+    items = iter(items)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        try:
+            for args in items:
+                pending.append(pool.submit(func, *args))
+                if len(pending) >= workers * 2:
+                    break
+
+            while pending:
+                result = pending.popleft().result()
+                for args in items:
+                    pending.append(pool.submit(func, *args))
+                    break
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
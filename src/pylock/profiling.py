@@ -0,0 +1,203 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+# Registered hooks are called with one event dict per finished stage
+# ({"type": "stage", ...}) or counter increment ({"type": "counter", ...}).
+# With no hooks registered, stage() hands out a shared no-op object and
+# count() returns immediately, so instrumented code pays one function call
+# per stage and nothing per block.
+_hooks = []
+
+
+def add_hook(hook):
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def _emit(event: dict):
+    for hook in list(_hooks):
+        hook(event)
+
+
+class _NullStage:
+    bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+        self.bytes = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _emit(
+            {
+                "type": "stage",
+                "name": self.name,
+                "start": self.start,
+                "wall": time.perf_counter() - self.start,
+                # CPU time of the calling thread; work done in worker
+                # processes (chunked archives) only shows up as wall time.
+                "cpu": time.thread_time() - self.cpu_start,
+                "bytes": self.bytes,
+                "error": exc_type.__name__ if exc_type else None,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": self.args,
+            }
+        )
+        return False
+
+
+def stage(name: str, **args):
+    if not _hooks:
+        return _NULL_STAGE
+    return _Stage(name, args)
+
+
+def count(name: str, value: int = 1):
+    if _hooks:
+        _emit(
+            {
+                "type": "counter",
+                "name": name,
+                "value": value,
+                "time": time.perf_counter(),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+            }
+        )
+
+
+class Profiler:
+    # Hook that records every event while active:
+    #
+    #     with Profiler() as profiler:
+    #         lock_file(...)
+    #     print(profiler.format_breakdown())
+
+    COUNTERS = ("fsync", "unlink", "rename")
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def __call__(self, event: dict):
+        with self._lock:
+            self.events.append(event)
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        remove_hook(self)
+        return False
+
+    def stages(self) -> list[dict]:
+        totals = {}
+        for event in self.events:
+            if event["type"] != "stage":
+                continue
+            total = totals.setdefault(
+                event["name"], {"name": event["name"], "wall": 0.0, "cpu": 0.0}
+            )
+            total["wall"] += event["wall"]
+            total["cpu"] += event["cpu"]
+            total["bytes"] = total.get("bytes", 0) + event["bytes"]
+            total["calls"] = total.get("calls", 0) + 1
+        return list(totals.values())
+
+    def counters(self) -> dict:
+        counters = dict.fromkeys(self.COUNTERS, 0)
+        for event in self.events:
+            if event["type"] == "counter":
+                counters[event["name"]] = (
+                    counters.get(event["name"], 0) + event["value"]
+                )
+        return counters
+
+    def format_breakdown(self) -> str:
+        stages = self.stages()
+        wall = sum(s["wall"] for s in stages) or 1.0
+        lines = [
+            f"{'stage':<10} {'wall ms':>10} {'cpu ms':>10} {'share':>6} "
+            f"{'MB':>9} {'MB/s':>9} {'calls':>6}"
+        ]
+        for s in stages:
+            mb = s["bytes"] / 1_000_000
+            if s["bytes"]:
+                size = f"{mb:9.1f} {mb / s['wall'] if s['wall'] else 0.0:9.1f}"
+            else:
+                size = f"{'-':>9} {'-':>9}"
+            lines.append(
+                f"{s['name']:<10} {s['wall'] * 1000:10.2f} {s['cpu'] * 1000:10.2f} "
+                f"{s['wall'] / wall * 100:5.1f}% {size} {s['calls']:6d}"
+            )
+        counters = " ".join(f"{k}={v}" for k, v in self.counters().items())
+        lines.append(f"counters: {counters}")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict:
+        # Trace Event Format, viewable in chrome://tracing or Perfetto.
+        events = []
+        origin = min(
+            (e["start"] if e["type"] == "stage" else e["time"] for e in self.events),
+            default=0.0,
+        )
+        totals = {}
+        for event in self.events:
+            if event["type"] == "stage":
+                events.append(
+                    {
+                        "name": event["name"],
+                        "ph": "X",
+                        "ts": (event["start"] - origin) * 1_000_000,
+                        "dur": event["wall"] * 1_000_000,
+                        "pid": event["pid"],
+                        "tid": event["tid"],
+                        "args": {
+                            "cpu_ms": event["cpu"] * 1000,
+                            "bytes": event["bytes"],
+                            "error": event["error"],
+                            **event["args"],
+                        },
+                    }
+                )
+            else:
+                totals[event["name"]] = totals.get(event["name"], 0) + event["value"]
+                events.append(
+                    {
+                        "name": event["name"],
+                        "ph": "C",
+                        "ts": (event["time"] - origin) * 1_000_000,
+                        "pid": event["pid"],
+                        "args": {event["name"]: totals[event["name"]]},
+                    }
+                )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str | Path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
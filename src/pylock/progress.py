@@ -0,0 +1,75 @@
+import time
+
+
+PROGRESS_INTERVAL = 0.2
+
+
+class Progress:
+    # Byte progress for one operation, split into named stages. update() is
+    # called once per block on the hot path and only does an addition and a
+    # clock read; the callback runs at most every `interval` seconds, plus
+    # once at the start and end of each stage.
+
+    def __init__(self, callback, interval: float = PROGRESS_INTERVAL):
+        self.callback = callback
+        self.interval = interval
+        self.stage = None
+        self.total = 0
+        self.done = 0
+        self.started = 0.0
+        self.next_report = 0.0
+
+    def start(self, stage: str, total: int):
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self.started = time.monotonic()
+        self._emit(self.started)
+
+    def update(self, count: int):
+        self.done += count
+        now = time.monotonic()
+        if now >= self.next_report:
+            self._emit(now)
+
+    def finish(self):
+        self._emit(time.monotonic())
+
+    def _emit(self, now: float):
+        self.next_report = now + self.interval
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - self.done)
+        self.callback(
+            {
+                "stage": self.stage,
+                "done": self.done,
+                "total": self.total,
+                "elapsed": elapsed,
+                "rate": rate,
+                "eta": remaining / rate if rate else None,
+            }
+        )
+
+
+class ProgressReader:
+    # File wrapper that reports every read to a Progress.
+
+    def __init__(self, fp, progress: Progress):
+        self.fp = fp
+        self.progress = progress
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fp.read(size)
+        self.progress.update(len(data))
+        return data
+
+
+def format_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
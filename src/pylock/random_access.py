@@ -0,0 +1,360 @@
+import bisect
+import hashlib
+import hmac
+import io
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from .backends import (
+    GCM_HEADER,
+    GCM_RECORD,
+    GCM_TAG_SIZE,
+    WinZipAESBackend,
+    _WZ_AES_KEY_LENGTHS,
+    _WZ_AES_MAC_SIZE,
+    _WZ_AES_SALT_LENGTHS,
+    _ZIP_LOCAL_HEADER,
+    _gcm_nonce,
+)
+from .errors import RandomAccessError, WrongPasswordError
+from .locker import _LockedArchive
+
+
+# WinZip AES members are decrypted in blocks of this size (a multiple of the
+# AES block); AES-GCM archives use their own records (4 MiB) as blocks.
+BLOCK_SIZE = 1024 * 1024
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+
+class _Span:
+    # The encrypted tar member(s) as one byte range of the tar file, read
+    # with os.pread so any number of threads can share the descriptor.
+    # Windows has no pread; there reads seek and read under a lock.
+    def __init__(self, fd: int, members):
+        self.fd = fd
+        self.lock = None if hasattr(os, "pread") else threading.Lock()
+        self.starts = []
+        self.ends = []
+        self.offsets = []
+        size = 0
+        for member in members:
+            self.starts.append(size)
+            self.offsets.append(member.offset_data)
+            size += member.size
+            self.ends.append(size)
+        self.size = size
+
+    def pread(self, pos: int, size: int) -> bytes:
+        parts = []
+        while size > 0:
+            index = bisect.bisect_right(self.starts, pos) - 1
+            count = min(size, self.ends[index] - pos)
+            data = self._read(count, self.offsets[index] + pos - self.starts[index])
+            if len(data) != count or count <= 0:
+                raise ValueError("Truncated archive")
+            parts.append(data)
+            pos += count
+            size -= count
+        return b"".join(parts)
+
+    def _read(self, size: int, offset: int) -> bytes:
+        if self.lock is None:
+            return os.pread(self.fd, size, offset)
+        with self.lock:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            return os.read(self.fd, size)
+
+
+class _ZipSource:
+    # Stored WinZip AES members: AES-CTR with a little-endian counter that
+    # starts at 1, so decryption can start at any 16-byte boundary. Each
+    # member has its own salt, hence its own key, derived on first use.
+    # The HMAC covers a whole member and cannot be checked here.
+    def __init__(self, span: _Span, infos, password: str):
+        self.span = span
+        self.password = password.encode("utf-8")
+        self.infos = []
+        self.starts = []
+        self.size = 0
+        for info in infos:
+            if info.compress_type != 0:
+                raise RandomAccessError("Random access needs an uncompressed archive")
+            if getattr(info, "wz_aes_strength", None) not in _WZ_AES_KEY_LENGTHS:
+                raise RandomAccessError(f"{info.filename} is not WinZip AES encrypted")
+            self.infos.append(info)
+            self.starts.append(self.size)
+            self.size += info.file_size
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def _key(self, index: int) -> tuple[bytes, int]:
+        # (AES key, position of the member's ciphertext in the span)
+        with self.lock:
+            if index in self.keys:
+                return self.keys[index]
+        info = self.infos[index]
+        # Offsets in the zip directory are relative to the tar member.
+        pos = info.header_offset
+        fields = _ZIP_LOCAL_HEADER.unpack(self.span.pread(pos, _ZIP_LOCAL_HEADER.size))
+        pos += _ZIP_LOCAL_HEADER.size + fields[-2] + fields[-1]
+
+        key_length = _WZ_AES_KEY_LENGTHS[info.wz_aes_strength]
+        salt_length = _WZ_AES_SALT_LENGTHS[info.wz_aes_strength]
+        header = self.span.pread(pos, salt_length + 2)
+        derived = hashlib.pbkdf2_hmac(
+            "sha1", self.password, header[:salt_length], 1000, 2 * key_length + 2
+        )
+        if not hmac.compare_digest(derived[-2:], header[salt_length:]):
+            raise WrongPasswordError("Wrong password")
+        if info.compress_size != info.file_size + salt_length + 2 + _WZ_AES_MAC_SIZE:
+            raise ValueError(f"Unexpected size for {info.filename}")
+
+        entry = (derived[:key_length], pos + salt_length + 2)
+        with self.lock:
+            self.keys[index] = entry
+        return entry
+
+    def block_of(self, offset: int) -> tuple:
+        # (cache key, start, length) of the block holding offset.
+        index = bisect.bisect_right(self.starts, offset) - 1
+        block = (offset - self.starts[index]) // BLOCK_SIZE
+        start = block * BLOCK_SIZE
+        length = min(BLOCK_SIZE, self.infos[index].file_size - start)
+        return (index, block), self.starts[index] + start, length
+
+    def decrypt(self, key: tuple, length: int) -> bytes:
+        from Cryptodome.Cipher import AES
+        from Cryptodome.Util import Counter
+
+        index, block = key
+        aes_key, data_pos = self._key(index)
+        start = block * BLOCK_SIZE
+        counter = Counter.new(128, initial_value=start // 16 + 1, little_endian=True)
+        cipher = AES.new(aes_key, AES.MODE_CTR, counter=counter)
+        return cipher.decrypt(self.span.pread(data_pos + start, length))
+
+
+class _GcmSource:
+    # An uncompressed AES-GCM stream. The record headers are scanned once
+    # (a few bytes per 4 MiB) to map plaintext offsets to records; every
+    # record read is authenticated, so tampered data is never returned.
+    def __init__(self, span: _Span, reader):
+        self.span = span
+        self.cipher = reader.cipher
+        self.header = reader.header
+        if reader.manifest.get("compression", "stored") != "stored":
+            raise RandomAccessError("Random access needs an uncompressed archive")
+
+        self.starts = []
+        self.positions = []
+        self.lengths = []
+        self.final = False
+        size = 0
+        pos = GCM_HEADER.size
+        index = 0
+        while pos < span.size:
+            length, final = GCM_RECORD.unpack(span.pread(pos, GCM_RECORD.size))
+            pos += GCM_RECORD.size
+            if index > 0:
+                # Record 0 holds the manifest.
+                self.starts.append(size)
+                self.positions.append(pos)
+                self.lengths.append(length)
+                size += length
+            pos += length + GCM_TAG_SIZE
+            index += 1
+            if final:
+                self.final = True
+                break
+        if not self.final or pos != span.size:
+            raise ValueError("Truncated AES-GCM stream")
+        expected = reader.manifest["size"]
+        if expected is not None and size != expected:
+            raise ValueError(f"Payload is {size} bytes, manifest says {expected}")
+        self.size = size
+
+    def block_of(self, offset: int) -> tuple:
+        index = bisect.bisect_right(self.starts, offset) - 1
+        return index, self.starts[index], self.lengths[index]
+
+    def decrypt(self, key: int, length: int) -> bytes:
+        data = self.span.pread(self.positions[key], length + GCM_TAG_SIZE)
+        final = key == len(self.starts) - 1
+        try:
+            return self.cipher.open(_gcm_nonce(key + 1, final), data, self.header)
+        except ValueError:
+            raise ValueError(f"Corrupted record {key + 1}") from None
+
+
+class LockedFile(io.RawIOBase):
+    # Read-only, seekable view of the plaintext of a locked archive. Blocks
+    # are decrypted on demand and kept in an LRU cache of cache_size bytes,
+    # so repeated reads of the same region cost a dictionary lookup.
+    #
+    # read()/seek() share one position like any file object; threads should
+    # use read_at(offset, size) instead, which is safe to call concurrently
+    # and shares the cache. Two threads missing the same block at once may
+    # both decrypt it.
+
+    def __init__(self, source, fd: int, name: str, cache_size: int):
+        super().__init__()
+        self._source = source
+        self._fd = fd
+        self.name = name
+        self.size = source.size
+        self._pos = 0
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+        if pos < 0:
+            raise ValueError(f"Negative seek position {pos}")
+        self._pos = pos
+        return pos
+
+    def readinto(self, buffer) -> int:
+        data = self.read_at(self._pos, len(buffer))
+        buffer[: len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def readall(self) -> bytes:
+        data = self.read_at(self._pos, max(0, self.size - self._pos))
+        self._pos += len(data)
+        return data
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        size = max(0, min(size, self.size - offset))
+        parts = []
+        while size > 0:
+            key, start, length = self._source.block_of(offset)
+            block = self._block(key, length)
+            skip = offset - start
+            part = block[skip : skip + size]
+            parts.append(part)
+            offset += len(part)
+            size -= len(part)
+        return b"".join(parts)
+
+    def _block(self, key, length: int) -> bytes:
+        with self._lock:
+            block = self._cache.get(key)
+            if block is not None:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return block
+            self._misses += 1
+
+        block = self._source.decrypt(key, length)
+
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = block
+                self._cache_bytes += len(block)
+                # The block just added always stays, even if it alone is
+                # larger than the cache.
+                while self._cache_bytes > self._cache_size and len(self._cache) > 1:
+                    _, old = self._cache.popitem(last=False)
+                    self._cache_bytes -= len(old)
+        return block
+
+    def cache_info(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "blocks": len(self._cache),
+                "bytes": self._cache_bytes,
+                "max_bytes": self._cache_size,
+            }
+
+    def close(self):
+        if not self.closed:
+            with self._lock:
+                self._cache.clear()
+                self._cache_bytes = 0
+            os.close(self._fd)
+        super().close()
+
+
+def open_locked(
+    tar_path: str | Path,
+    password: str,
+    member: str | None = None,
+    cache_size: int = DEFAULT_CACHE_SIZE,
+    allow_unauthenticated: bool = False,
+) -> LockedFile:
+    # Opens the plaintext of a locked archive for random access without
+    # writing anything to disk. Works for uncompressed archives: single or
+    # chunked winzip-aes ones, one file (member) of a multi-file archive,
+    # and aes-gcm streams. AES-GCM records are always authenticated.
+    # WinZip AES data read this way is decrypted but not authenticated (its
+    # HMAC covers whole members), so those archives are only opened with
+    # allow_unauthenticated=True; run verify_file when integrity matters.
+    tar_path = Path(tar_path)
+    if not tar_path.exists():
+        raise FileNotFoundError(f"TAR file not found: {tar_path}")
+
+    # Checks the password and decodes the manifest the usual way.
+    with _LockedArchive(tar_path, password) as archive:
+        manifest = archive.manifest
+        members = archive.members
+        backend = archive.backend
+        name = archive.original_name
+        if manifest["layout"] == "multi":
+            if member is None:
+                raise FileNotFoundError(
+                    f"{tar_path.name} holds several files, pick one with member"
+                )
+            entries = [e for e in archive.reader.files if e["path"] == member]
+            if not entries:
+                raise FileNotFoundError(f"{member} not found in {tar_path.name}")
+            infos = archive.reader._chunk_members(entries[0]["chunks"])
+            name = member
+        elif member is not None:
+            raise FileNotFoundError(f"{tar_path.name} holds a single file")
+        elif backend.name == WinZipAESBackend.name:
+            infos = archive.reader.payload_members()
+        if backend.name == WinZipAESBackend.name and not allow_unauthenticated:
+            raise RandomAccessError(
+                f"{tar_path.name} is WinZip AES encrypted, which cannot be "
+                "authenticated at random offsets; pass allow_unauthenticated=True"
+            )
+
+        fd = os.open(tar_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            span = _Span(fd, members)
+            if backend.name == WinZipAESBackend.name:
+                source = _ZipSource(span, infos, password)
+            else:
+                source = _GcmSource(span, archive.reader)
+        except BaseException:
+            os.close(fd)
+            raise
+
+    return LockedFile(source, fd, name, cache_size)
@@ -0,0 +1,189 @@
+import json
+import os
+import sys
+from array import array
+from collections import defaultdict
+from pathlib import Path
+
+
+GRAM_SIZE = 3
+# Shorter queries match too many names for an index to help and are not
+# filtered, except two characters that are not both ASCII: a Chinese word
+# such as 照片 is as selective as an ASCII trigram.
+SHORT_GRAM_SIZE = 2
+# Matches the history window shows at most. Verifying a candidate costs
+# ~0.2 us, so a query matching 100k+ names would take tens of ms per
+# keystroke; stopping at the newest RESULT_LIMIT keeps each one bounded.
+RESULT_LIMIT = 10000
+INDEX_MAGIC = b"PYLOCK-SEARCH-1\n"
+
+
+def _grams(text: str) -> set[str]:
+    grams = {text[i : i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+    if not text.isascii():
+        for i in range(len(text) - SHORT_GRAM_SIZE + 1):
+            gram = text[i : i + SHORT_GRAM_SIZE]
+            if not gram.isascii():
+                grams.add(gram)
+    return grams
+
+
+def record_key(record: dict) -> str:
+    # The newline keeps a query from matching across both names.
+    return f"{record['original_name']}\n{record['encrypted_name']}".lower()
+
+
+def is_searchable(query: str) -> bool:
+    return len(query) >= GRAM_SIZE or (
+        len(query) == SHORT_GRAM_SIZE and not query.isascii()
+    )
+
+
+class SearchIndex:
+    # Lowercase trigram index over original_name and encrypted_name.
+    # Posting lists hold positions into `keys`; a query of up to 3
+    # characters is answered by its own posting list, a longer one only
+    # verifies the candidates of its rarest trigram, and a query that
+    # extends the previous one only re-filters the previous result.
+    # `truncated` tells whether the last search stopped at its limit.
+
+    def __init__(self):
+        self.ids = array("q")
+        self.keys = []
+        self.grams = {}
+        self.last_query = ""
+        self.last_result = None
+        self.truncated = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add_many(self, records):
+        pending = defaultdict(list)
+        for record in records:
+            position = len(self.keys)
+            key = record_key(record)
+            self.ids.append(record["id"])
+            self.keys.append(key)
+            for gram in _grams(key):
+                pending[gram].append(position)
+
+        for gram, positions in pending.items():
+            postings = self.grams.get(gram)
+            if postings is None:
+                self.grams[gram] = array("I", positions)
+            else:
+                postings.extend(positions)
+
+        self.last_query = ""
+        self.last_result = None
+
+    def add(self, record: dict):
+        self.add_many([record])
+
+    def search(self, query: str, limit: int | None = None):
+        # Positions of the matching records in ascending order; with a
+        # limit, only the newest `limit` of them. Queries that are not
+        # is_searchable() return every position.
+        query = query.lower()
+        self.truncated = False
+        if not is_searchable(query):
+            return range(len(self.keys))
+
+        if len(query) <= GRAM_SIZE:
+            # The query is a gram itself; its posting list is exact.
+            result = self.grams.get(query, array("I"))
+            self.last_query, self.last_result = query, result
+            if limit is not None and len(result) > limit:
+                self.truncated = True
+                return result[-limit:]
+            return result
+
+        candidates = None
+        if self.last_result is not None and self.last_query in query:
+            candidates = self.last_result
+
+        postings = [self.grams.get(gram) for gram in _grams(query)]
+        if any(p is None for p in postings):
+            candidates = []
+        else:
+            rarest = min(postings, key=len)
+            if candidates is None or len(rarest) < len(candidates):
+                candidates = rarest
+
+        keys = self.keys
+        if limit is None:
+            result = [p for p in candidates if query in keys[p]]
+        else:
+            result = []
+            for p in reversed(candidates):
+                if query in keys[p]:
+                    result.append(p)
+                    if len(result) == limit:
+                        self.truncated = True
+                        break
+            result.reverse()
+        # A truncated result cannot narrow down the next keystroke.
+        if self.truncated:
+            self.last_query, self.last_result = "", None
+        else:
+            self.last_query, self.last_result = query, result
+        return result
+
+    def record_ids(self, positions) -> list[int]:
+        ids = self.ids
+        return [ids[p] for p in positions]
+
+    def save(self, path: str | Path, meta: dict):
+        # Writes the index with caller-defined meta (e.g. which log and up
+        # to which record it covers) so the next start can skip rebuilding.
+        # Arrays are stored raw in native byte order.
+        keys = "\0".join(self.keys).encode("utf-8")
+        grams = list(self.grams.items())
+        header = {
+            "meta": meta,
+            "byteorder": sys.byteorder,
+            "itemsizes": [self.ids.itemsize, array("I").itemsize],
+            "count": len(self.ids),
+            "keys_bytes": len(keys),
+            "grams": [[gram, len(postings)] for gram, postings in grams],
+        }
+        path = Path(path)
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, "wb") as f:
+            f.write(INDEX_MAGIC)
+            f.write(json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.ids.tofile(f)
+            f.write(keys)
+            for _, postings in grams:
+                postings.tofile(f)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> tuple["SearchIndex", dict] | None:
+        # (index, meta) from save(), or None if the file is missing or was
+        # written in another format or byte order.
+        try:
+            with open(path, "rb") as f:
+                if f.readline() != INDEX_MAGIC:
+                    return None
+                header = json.loads(f.readline())
+                index = cls()
+                if header["byteorder"] != sys.byteorder or header["itemsizes"] != [
+                    index.ids.itemsize,
+                    array("I").itemsize,
+                ]:
+                    return None
+                index.ids.fromfile(f, header["count"])
+                keys = f.read(header["keys_bytes"]).decode("utf-8")
+                index.keys = keys.split("\0") if header["count"] else []
+                for gram, length in header["grams"]:
+                    postings = array("I")
+                    postings.fromfile(f, length)
+                    index.grams[gram] = postings
+        except Exception:
+            # Missing, truncated or damaged: the caller rebuilds it.
+            return None
+        if len(index.keys) != len(index.ids):
+            return None
+        return index, header["meta"]
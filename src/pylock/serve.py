@@ -0,0 +1,488 @@
+import asyncio
+import json
+import mimetypes
+import os
+import tarfile
+import time
+from collections import OrderedDict
+from functools import partial
+from pathlib import Path
+from urllib.parse import quote, unquote, urlsplit
+
+from .batch import expand_targets
+from .errors import RandomAccessError, WrongPasswordError
+from .locker import _LockedArchive
+from .random_access import open_locked
+from .store import CiphertextLog
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+# Open archives kept around between requests; opening one costs a key
+# derivation (up to ~100 ms for aes-gcm), a cached one nothing.
+DEFAULT_HANDLES = 16
+SEND_SIZE = 256 * 1024
+# A missing name triggers a directory rescan at most this often.
+RESCAN_INTERVAL = 1.0
+MAX_HEADERS = 100
+
+REASONS = {
+    200: "OK",
+    206: "Partial Content",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    416: "Range Not Satisfiable",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+}
+
+
+class _HttpError(Exception):
+    def __init__(self, status: int, message: str, headers: dict | None = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    # Returns (start, end) with end exclusive for a single "bytes=" range,
+    # None to serve the whole body. Several ranges are answered with the
+    # whole body, which RFC 9110 allows; so are invalid ones such as
+    # bytes=5-3, which it says to ignore. Only a valid range that starts
+    # past the end (or asks for the last 0 bytes) gets a 416.
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash or not (first or last):
+        return None
+    if any(part and not (part.isascii() and part.isdigit()) for part in (first, last)):
+        return None
+    if first:
+        start = int(first)
+        end = size
+        if last:
+            end = int(last) + 1
+            if end <= start:
+                return None
+    else:
+        # bytes=-N: the last N bytes.
+        start = max(0, size - int(last))
+        end = size
+    end = min(end, size)
+    if start >= end:
+        raise _HttpError(
+            416, "Range not satisfiable", {"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+class _Handle:
+    def __init__(self, file):
+        self.file = file
+        self.users = 0
+        self.evicted = False
+
+
+class _HandleCache:
+    # LRU of open LockedFile objects, keyed by tar path, mtime and size (a
+    # replaced archive gets a fresh handle) plus the member. Handles in use
+    # are never closed; an evicted one closes when its last user is done.
+    # Only touched from the event loop thread.
+
+    def __init__(self, size: int):
+        self.size = size
+        self.handles = OrderedDict()
+        self.opening = {}
+
+    async def acquire(self, key, opener) -> _Handle:
+        handle = self.handles.get(key)
+        if handle is None:
+            if key in self.opening:
+                # Another request is opening the same archive right now.
+                await asyncio.shield(self.opening[key])
+                return await self.acquire(key, opener)
+            future = asyncio.get_running_loop().create_future()
+            self.opening[key] = future
+            try:
+                handle = _Handle(await opener())
+            finally:
+                del self.opening[key]
+                future.set_result(None)
+            self.handles[key] = handle
+            self._evict()
+        self.handles.move_to_end(key)
+        handle.users += 1
+        return handle
+
+    def release(self, handle: _Handle):
+        handle.users -= 1
+        if handle.evicted and not handle.users:
+            handle.file.close()
+
+    def _evict(self):
+        for key in list(self.handles):
+            if len(self.handles) <= self.size:
+                break
+            handle = self.handles[key]
+            if handle.users:
+                continue
+            del self.handles[key]
+            handle.evicted = True
+            handle.file.close()
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.evicted = True
+            if not handle.users:
+                handle.file.close()
+        self.handles.clear()
+
+
+class LockServer:
+    # Serves the plaintext of the archives in a directory over HTTP without
+    # writing it anywhere:
+    #
+    #     GET /                          JSON list of archives
+    #     GET /archives/<tar name>       content of an archive
+    #     GET /archives/<tar name>/<path>  one file of a multi-file archive
+    #     GET /files/<original name>     newest archive logged under that name
+    #
+    # Uncompressed archives are read through open_locked and support Range
+    # requests; compressed ones are streamed whole, and so are winzip-aes
+    # ones unless allow_unauthenticated is set, since random reads skip
+    # their HMAC. Decryption runs on a thread pool, so slow clients and
+    # large downloads never block others.
+
+    def __init__(
+        self,
+        directory: str | Path,
+        password: str,
+        handles: int = DEFAULT_HANDLES,
+        workers: int | None = None,
+        log_path: str | Path | None = None,
+        allow_unauthenticated: bool = False,
+    ):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.directory = Path(directory)
+        self.password = password
+        self.allow_unauthenticated = allow_unauthenticated
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.handles = _HandleCache(handles)
+        self.archives = {}
+        self.scanned = 0.0
+        # Queried from the thread pool; CiphertextLog serializes its users.
+        self.log = CiphertextLog(log_path)
+
+    def close(self):
+        self.handles.close()
+        self.executor.shutdown(wait=False)
+        self.log.close()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, func, *args
+        )
+
+    def _scan(self) -> dict:
+        return {path.stem: path for path in expand_targets([self.directory], ".tar")}
+
+    async def _archive(self, name: str) -> Path:
+        path = self.archives.get(name)
+        if path is None or not path.exists():
+            if time.monotonic() - self.scanned >= RESCAN_INTERVAL:
+                self.archives = await self._run(self._scan)
+                self.scanned = time.monotonic()
+            path = self.archives.get(name)
+        if path is None or not path.exists():
+            raise _HttpError(404, f"No archive named {name}")
+        return path
+
+    async def _listing(self) -> list[dict]:
+        self.archives = await self._run(self._scan)
+        self.scanned = time.monotonic()
+        listing = []
+        for name, path in sorted(self.archives.items()):
+            records = await self._run(lambda: self.log.find(encrypted_name=name))
+            listing.append(
+                {
+                    "name": name,
+                    "original_name": records[-1]["original_name"] if records else None,
+                    "archive_size": path.stat().st_size,
+                    "url": f"/archives/{quote(name)}",
+                }
+            )
+        return listing
+
+    async def _resolve(self, path: str) -> tuple[Path, str | None]:
+        # URL path -> (tar path, member of a multi-file archive)
+        kind, _, rest = path.lstrip("/").partition("/")
+        if kind == "archives" and rest:
+            name, _, member = rest.partition("/")
+            return await self._archive(name), member or None
+        if kind == "files" and rest:
+            records = await self._run(lambda: self.log.find(original_name=rest))
+            for record in reversed(records):
+                try:
+                    return await self._archive(record["encrypted_name"]), None
+                except _HttpError:
+                    continue
+            raise _HttpError(404, f"No archive for {rest}")
+        raise _HttpError(404, "Not found")
+
+    async def _open(self, tar_path: Path, member: str | None) -> _Handle:
+        st = tar_path.stat()
+        key = (str(tar_path), st.st_mtime_ns, st.st_size, member)
+        return await self.handles.acquire(
+            key,
+            lambda: self._run(
+                partial(
+                    open_locked,
+                    tar_path,
+                    self.password,
+                    member,
+                    allow_unauthenticated=self.allow_unauthenticated,
+                )
+            ),
+        )
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                if not await self._respond(writer, *request):
+                    break
+        except _HttpError as e:
+            # Malformed request; its remainder cannot be parsed, so answer
+            # and drop the connection.
+            try:
+                await self._send_error(writer, e, False)
+            except ConnectionError:
+                pass
+        except ConnectionError:
+            pass
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await self._read_line(reader, 400, "Request line too long")
+        if not line:
+            return None
+        parts = line.decode("latin-1").split()
+        headers = {}
+        for count in range(MAX_HEADERS + 1):
+            header = await self._read_line(reader, 431, "Header line too long")
+            if header in (b"\r\n", b"\n", b""):
+                break
+            if count == MAX_HEADERS:
+                raise _HttpError(431, "Too many headers")
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return parts, headers
+
+    async def _read_line(self, reader, status: int, message: str) -> bytes:
+        # StreamReader.readline raises ValueError past the stream limit.
+        try:
+            return await reader.readline()
+        except ValueError:
+            raise _HttpError(status, message) from None
+        except asyncio.LimitOverrunError:
+            raise _HttpError(status, message) from None
+
+    async def _respond(self, writer, parts, headers) -> bool:
+        # Returns whether the connection stays open.
+        if len(parts) != 3:
+            await self._send_error(writer, _HttpError(400, "Bad request"), False)
+            return False
+        method, target, version = parts
+        keep_alive = (
+            version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        )
+        try:
+            if method not in ("GET", "HEAD"):
+                raise _HttpError(
+                    405, "Only GET and HEAD are supported", {"Allow": "GET, HEAD"}
+                )
+            path = unquote(urlsplit(target).path)
+            if path == "/":
+                body = json.dumps(await self._listing(), ensure_ascii=False).encode()
+                await self._send(
+                    writer,
+                    200,
+                    {"Content-Type": "application/json; charset=utf-8"},
+                    body if method == "GET" else b"",
+                    len(body),
+                    keep_alive,
+                )
+                return keep_alive
+            tar_path, member = await self._resolve(path)
+            return await self._send_content(
+                writer, method, tar_path, member, headers.get("range"), keep_alive
+            )
+        except _HttpError as e:
+            await self._send_error(writer, e, keep_alive)
+            return keep_alive
+
+    async def _send_content(
+        self, writer, method, tar_path, member, range_header, keep_alive
+    ) -> bool:
+        try:
+            handle = await self._open(tar_path, member)
+        except WrongPasswordError:
+            raise _HttpError(403, "Wrong password for this archive") from None
+        except FileNotFoundError as e:
+            raise _HttpError(404, str(e)) from None
+        except RandomAccessError:
+            # Compressed archives cannot be read at random offsets, and
+            # WinZip AES ones only without authentication (when allowed).
+            return await self._send_sequential(
+                writer, method, tar_path, member, keep_alive
+            )
+        except ValueError as e:
+            # Truncated or corrupted archives.
+            raise _HttpError(500, str(e)) from None
+        except tarfile.TarError as e:
+            raise _HttpError(500, f"Damaged archive: {e}") from None
+
+        try:
+            f = handle.file
+            span = parse_range(range_header, f.size)
+            start, end = span or (0, f.size)
+            headers = {
+                "Content-Type": _content_type(f.name),
+                "Content-Disposition": _disposition(f.name),
+                "Accept-Ranges": "bytes",
+            }
+            if span:
+                headers["Content-Range"] = f"bytes {start}-{end - 1}/{f.size}"
+            self._head(writer, 206 if span else 200, headers, end - start, keep_alive)
+            if method == "GET":
+                pos = start
+                while pos < end:
+                    data = await self._run(f.read_at, pos, min(SEND_SIZE, end - pos))
+                    writer.write(data)
+                    await writer.drain()
+                    pos += len(data)
+            await writer.drain()
+        except _HttpError:
+            raise
+        except Exception:
+            # Headers are out already (e.g. a corrupted record); all that is
+            # left is to drop the connection.
+            writer.close()
+            return False
+        finally:
+            self.handles.release(handle)
+        return keep_alive
+
+    async def _send_sequential(self, writer, method, tar_path, member, keep_alive):
+        # Whole-body streaming for archives open_locked cannot handle.
+        def start():
+            archive = _LockedArchive(tar_path, self.password)
+            try:
+                reader = archive.reader
+                if archive.manifest["layout"] == "multi":
+                    entries = [e for e in reader.files if e["path"] == member]
+                    if not entries:
+                        raise FileNotFoundError(
+                            f"{member} not found"
+                            if member
+                            else "Multi-file archive, request one of its files"
+                        )
+                    return (
+                        archive,
+                        member,
+                        entries[0]["size"],
+                        reader.iter_file(entries[0]),
+                    )
+                if member is not None:
+                    raise FileNotFoundError(f"{tar_path.name} holds a single file")
+                return (
+                    archive,
+                    archive.original_name,
+                    reader.payload_size,
+                    reader.iter_payload(),
+                )
+            except BaseException:
+                archive.close()
+                raise
+
+        try:
+            archive, name, size, blocks = await self._run(start)
+        except WrongPasswordError:
+            raise _HttpError(403, "Wrong password for this archive") from None
+        except FileNotFoundError as e:
+            raise _HttpError(404, str(e)) from None
+        except ValueError as e:
+            raise _HttpError(500, str(e)) from None
+        except tarfile.TarError as e:
+            raise _HttpError(500, f"Damaged archive: {e}") from None
+
+        try:
+            headers = {
+                "Content-Type": _content_type(name),
+                "Content-Disposition": _disposition(name),
+                "Accept-Ranges": "none",
+            }
+            # Streams locked from a pipe do not know their size; the end of
+            # the body is then the end of the connection.
+            keep_alive = keep_alive and size is not None
+            self._head(writer, 200, headers, size, keep_alive)
+            if method == "GET":
+                while (data := await self._run(next, blocks, None)) is not None:
+                    writer.write(data)
+                    await writer.drain()
+        except Exception:
+            writer.close()
+            return False
+        finally:
+            await self._run(archive.close)
+        return keep_alive
+
+    def _head(self, writer, status, headers, length, keep_alive):
+        lines = [f"HTTP/1.1 {status} {REASONS[status]}"]
+        headers = dict(headers)
+        if length is not None:
+            headers["Content-Length"] = str(length)
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    async def _send(self, writer, status, headers, body, length, keep_alive):
+        self._head(writer, status, headers, length, keep_alive)
+        writer.write(body)
+        await writer.drain()
+
+    async def _send_error(self, writer, error: _HttpError, keep_alive: bool):
+        body = (str(error) + "\n").encode("utf-8")
+        headers = {"Content-Type": "text/plain; charset=utf-8", **error.headers}
+        await self._send(writer, error.status, headers, body, len(body), keep_alive)
+
+    async def serve(
+        self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, ready=None
+    ):
+        server = await asyncio.start_server(self.handle, host, port)
+        try:
+            if ready is not None:
+                ready(server)
+            await server.serve_forever()
+        finally:
+            server.close()
+            self.close()
+
+
+def _content_type(name: str) -> str:
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def _disposition(name: str) -> str:
+    return f"inline; filename*=UTF-8''{quote(os.path.basename(name))}"
@@ -0,0 +1,200 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+from .config import get_data_dir, get_program_dir
+
+
+DEFAULT_LOG_NAME = "cipertext.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    original_name TEXT NOT NULL,
+    encrypted_name TEXT NOT NULL,
+    duplicate_of TEXT
+);
+CREATE INDEX IF NOT EXISTS records_original_name ON records (original_name);
+CREATE INDEX IF NOT EXISTS records_encrypted_name ON records (encrypted_name);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def default_log_path() -> Path:
+    # Logs that older versions created next to the program stay in use;
+    # new ones go to the per-user data directory.
+    legacy = get_program_dir() / DEFAULT_LOG_NAME
+    if legacy.exists():
+        return legacy
+    return get_data_dir() / DEFAULT_LOG_NAME
+
+
+class CiphertextLog:
+    # Append-only history of locked files, kept in SQLite (WAL mode) so
+    # appends are O(1) and concurrent writers from several processes are
+    # serialized by SQLite's own file locking. The legacy cipertext.json
+    # array next to the database (or, for the default log, next to the
+    # program) is imported once on first open.
+
+    def __init__(self, path: str | Path | None = None):
+        if path is None:
+            self.path = default_log_path()
+            legacy_path = self.path.with_suffix(".json")
+            if not legacy_path.exists():
+                legacy_path = get_program_dir() / legacy_path.name
+        else:
+            self.path = Path(path)
+            legacy_path = self.path.with_suffix(".json")
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._add_duplicate_column()
+        self._migrate_legacy(legacy_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _add_duplicate_column(self):
+        # Logs created before duplicate_of existed.
+        columns = {
+            row["name"] for row in self.conn.execute("PRAGMA table_info(records)")
+        }
+        if "duplicate_of" not in columns:
+            try:
+                self.conn.execute("ALTER TABLE records ADD COLUMN duplicate_of TEXT")
+            except sqlite3.OperationalError:
+                # Another process added it first.
+                pass
+
+    def _migrate_legacy(self, legacy_path: Path):
+        if not legacy_path.exists() or self._get_meta("migrated_from"):
+            return
+
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-check under the write lock: another process may have
+                # finished the migration while we were waiting for it.
+                row = self.conn.execute(
+                    "SELECT value FROM meta WHERE key = 'migrated_from'"
+                ).fetchone()
+                if row is None:
+                    with open(legacy_path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    self.conn.executemany(
+                        "INSERT INTO records (original_name, encrypted_name) "
+                        "VALUES (?, ?)",
+                        (
+                            (
+                                item.get("original_name", ""),
+                                item.get("encrypted_name", ""),
+                            )
+                            for item in data
+                        ),
+                    )
+                    self.conn.execute(
+                        "INSERT INTO meta (key, value) VALUES ('migrated_from', ?)",
+                        (str(legacy_path),),
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _get_meta(self, key: str) -> str | None:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        return row["value"] if row else None
+
+    def append(
+        self, original_name: str, encrypted_name: str, duplicate_of: str | None = None
+    ) -> int:
+        # duplicate_of is set when the archive was locked from another file
+        # with the same content: unlocking it restores that file's name.
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO records (original_name, encrypted_name, duplicate_of) "
+                "VALUES (?, ?, ?)",
+                (original_name, encrypted_name, duplicate_of),
+            )
+        return cursor.lastrowid
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def page(self, offset: int, limit: int) -> list[dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM records ORDER BY id LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def records(self) -> list[dict]:
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM records ORDER BY id").fetchall()
+        return [dict(row) for row in rows]
+
+    def find(
+        self, original_name: str | None = None, encrypted_name: str | None = None
+    ) -> list[dict]:
+        if original_name is not None:
+            column, value = "original_name", original_name
+        elif encrypted_name is not None:
+            column, value = "encrypted_name", encrypted_name
+        else:
+            raise ValueError("original_name or encrypted_name is required")
+
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM records WHERE {column} = ? ORDER BY id", (value,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def search(self, text: str) -> list[dict]:
+        text = text.lower()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM records WHERE instr(lower(original_name), ?) > 0 "
+                "OR instr(lower(encrypted_name), ?) > 0 ORDER BY id",
+                (text, text),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def since(self, last_id: int = 0, limit: int | None = None) -> list[dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT * FROM records WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, -1 if limit is None else limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def by_ids(self, ids) -> list[dict]:
+        ids = list(ids)
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM records WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        by_id = {row["id"]: dict(row) for row in rows}
+        return [by_id[i] for i in ids if i in by_id]
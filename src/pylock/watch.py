@@ -0,0 +1,490 @@
+import ctypes
+import os
+import select
+import sqlite3
+import struct
+import sys
+import time
+from collections import deque
+from pathlib import Path
+
+from .backends import DEFAULT_BACKEND
+from .batch import is_pylock_output
+from .locker import lock_file
+from .pool import default_workers
+from .store import CiphertextLog
+
+
+JOURNAL_NAME = ".pylock-watch.db"
+STAGING_NAME = ".pylock-staging"
+
+SETTLE_SECONDS = 2.0
+POLL_INTERVAL = 5.0
+# With inotify a full rescan only happens at start, after an event queue
+# overflow and at this interval as a safety net.
+RESCAN_INTERVAL = 3600.0
+# Files waiting to settle. Beyond this, new files are left for a later
+# scan, which keeps memory flat on directories with millions of entries.
+MAX_PENDING = 10000
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    tar_name TEXT,
+    error TEXT,
+    updated REAL NOT NULL
+);
+"""
+
+# Journal states. A file is claimed before it is handed to a worker, so a
+# crash can never make it run twice: claimed rows found at start become
+# "interrupted" and are not retried unless the file changes.
+CLAIMED = "claimed"
+LOCKED = "locked"
+DONE = "done"
+FAILED = "failed"
+INTERRUPTED = "interrupted"
+
+
+class WatchJournal:
+    def __init__(self, path: str | Path):
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Claims must survive a power cut, or a file could be locked twice.
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.executescript(JOURNAL_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, path: str) -> dict | None:
+        row = self.conn.execute(
+            "SELECT * FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def set(
+        self,
+        path: str,
+        size: int,
+        mtime_ns: int,
+        state: str,
+        tar_name: str | None = None,
+        error: str | None = None,
+    ):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, size, mtime_ns, state, tar_name, error, time.time()),
+        )
+
+    def update(self, path: str, state: str, **fields):
+        columns = ", ".join(f"{name} = ?" for name in ("state", "updated", *fields))
+        self.conn.execute(
+            f"UPDATE files SET {columns} WHERE path = ?",
+            (state, time.time(), *fields.values(), path),
+        )
+
+    def with_state(self, state: str) -> list[dict]:
+        rows = self.conn.execute("SELECT * FROM files WHERE state = ?", (state,))
+        return [dict(row) for row in rows]
+
+    def counts(self) -> dict:
+        rows = self.conn.execute("SELECT state, COUNT(*) FROM files GROUP BY state")
+        return {state: count for state, count in rows}
+
+
+class _Inotify:
+    # Minimal inotify binding through ctypes: one watch per directory,
+    # reporting files that were closed after writing or moved in.
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.paths = {}
+
+    def close(self):
+        os.close(self.fd)
+
+    def add(self, path: str):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self.paths[wd] = path
+
+    def read(self, timeout: float) -> tuple[list, list, bool]:
+        # Returns (files, new directories, overflowed).
+        files, directories, overflow = [], [], False
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return files, directories, overflow
+        try:
+            data = os.read(self.fd, 1024 * 1024)
+        except BlockingIOError:
+            return files, directories, overflow
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            if mask & self.IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+            parent = self.paths.get(wd)
+            if parent is None or not name:
+                continue
+            path = os.path.join(parent, os.fsdecode(name))
+            if mask & self.IN_ISDIR:
+                directories.append(path)
+            elif mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+                files.append(path)
+        return files, directories, overflow
+
+
+def _scan(root: str, skip: set):
+    # Streams (path, stat) for every file below root without building a
+    # list, using an explicit stack instead of recursion.
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if is_pylock_output(entry.name) or entry.path in skip:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry.path, entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+
+
+def _worker_init():
+    # Ctrl-C reaches the whole process group; only the watcher reacts to it.
+    import signal
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _directories(root: str, skip: set):
+    yield root
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if (
+                    entry.is_dir(follow_symlinks=False)
+                    and not is_pylock_output(entry.name)
+                    and entry.path not in skip
+                ):
+                    stack.append(entry.path)
+                    yield entry.path
+
+
+class Watcher:
+    # Locks files that appear under `directory`: detected through inotify
+    # (or periodic scans), debounced until their size and mtime stop
+    # changing for `settle` seconds, and locked on a bounded process pool.
+    # Every decision is recorded in a journal so restarts pick up cleanly.
+
+    def __init__(
+        self,
+        directory: str | Path,
+        password: str,
+        output_dir: str | Path | None = None,
+        workers: int | None = None,
+        settle: float = SETTLE_SECONDS,
+        interval: float = POLL_INTERVAL,
+        poll: bool = False,
+        journal_path: str | Path | None = None,
+        compression: str = "stored",
+        compresslevel: int | None = None,
+        backend: str = DEFAULT_BACKEND,
+        remove_source: bool = False,
+        log_path: str | Path | None = None,
+        callback=None,
+    ):
+        self.directory = os.path.abspath(directory)
+        if not os.path.isdir(self.directory):
+            raise FileNotFoundError(f"Directory not found: {directory}")
+        self.password = password
+        self.output_dir = os.path.abspath(output_dir or self.directory)
+        self.staging_dir = os.path.join(self.output_dir, STAGING_NAME)
+        self.workers = workers or default_workers()
+        self.settle = settle
+        self.interval = interval
+        self.poll = poll
+        self.journal_path = journal_path or os.path.join(self.directory, JOURNAL_NAME)
+        self.options = {
+            "compression": compression,
+            "compresslevel": compresslevel,
+            "backend": backend,
+        }
+        self.remove_source = remove_source
+        self.log_path = log_path
+        self.callback = callback
+
+        # path -> (size, mtime_ns, deadline)
+        self.pending = {}
+        self.ready = deque()
+        self.running = {}
+        self.rescan_at = 0.0
+        self.stopping = False
+
+    def stop(self):
+        self.stopping = True
+
+    def _emit(self, entry: dict):
+        if self.callback:
+            self.callback(entry)
+
+    def _recover(self):
+        # Finishes what a previous run left between "locked" and "done",
+        # and turns unfinished claims into "interrupted".
+        for row in self.journal.with_state(LOCKED):
+            staged = os.path.join(self.staging_dir, f"{row['tar_name']}.tar")
+            final = os.path.join(self.output_dir, f"{row['tar_name']}.tar")
+            if os.path.exists(staged):
+                os.replace(staged, final)
+            if os.path.exists(final):
+                self._finish(row["path"], row["tar_name"])
+            else:
+                self.journal.update(row["path"], INTERRUPTED)
+        for row in self.journal.with_state(CLAIMED):
+            self.journal.update(row["path"], INTERRUPTED)
+            self._emit({"path": row["path"], "ok": False, "error": "interrupted"})
+        for name in os.listdir(self.staging_dir):
+            os.unlink(os.path.join(self.staging_dir, name))
+
+    def _finish(self, path: str, tar_name: str):
+        original_name = os.path.basename(path)
+        if not self.log.find(encrypted_name=tar_name):
+            self.log.append(original_name, tar_name)
+        self.journal.update(path, DONE)
+        if self.remove_source:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _skip(self) -> set:
+        skip = {self.staging_dir}
+        if self.output_dir != self.directory:
+            skip.add(self.output_dir)
+        return skip
+
+    def _touch(self, path: str, st=None):
+        # (Re)starts the settle timer for a file unless it was already
+        # handled in this exact version.
+        if path in self.running:
+            return
+        if st is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return
+        known = self.pending.get(path)
+        if known is None:
+            if len(self.pending) >= MAX_PENDING:
+                self.rescan_at = min(self.rescan_at, time.monotonic() + self.interval)
+                return
+            row = self.journal.get(path)
+            if row and (row["size"], row["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+                return
+        self.pending[path] = (
+            st.st_size,
+            st.st_mtime_ns,
+            time.monotonic() + self.settle,
+        )
+
+    def _scan_all(self):
+        for path, st in _scan(self.directory, self._skip()):
+            if len(self.pending) >= MAX_PENDING:
+                self.rescan_at = time.monotonic() + self.interval
+                return
+            known = self.pending.get(path)
+            if known is not None and known[:2] == (st.st_size, st.st_mtime_ns):
+                continue
+            self._touch(path, st)
+
+    def _settled(self):
+        now = time.monotonic()
+        for path, (size, mtime_ns, deadline) in list(self.pending.items()):
+            if deadline > now:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self.pending[path] = (st.st_size, st.st_mtime_ns, now + self.settle)
+                continue
+            del self.pending[path]
+            self.ready.append((path, size, mtime_ns))
+
+    def _submit(self, pool):
+        while self.ready and len(self.running) < self.workers * 2:
+            path, size, mtime_ns = self.ready.popleft()
+            # The claim is committed before any work starts (at-most-once).
+            self.journal.set(path, size, mtime_ns, CLAIMED)
+            future = pool.submit(
+                lock_file,
+                path,
+                self.password,
+                self.staging_dir,
+                log=False,
+                **self.options,
+            )
+            self.running[path] = future
+
+    def _collect(self):
+        for path, future in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[path]
+            try:
+                result = future.result()
+            except BaseException as e:
+                # A worker killed by Ctrl-C or a shutdown was interrupted,
+                # not failed; either way the file is not tried again.
+                interrupted = self.stopping or not isinstance(e, Exception)
+                error = "interrupted" if interrupted else str(e)
+                self.journal.update(
+                    path, INTERRUPTED if interrupted else FAILED, error=error
+                )
+                self._emit({"path": path, "ok": False, "error": error})
+                continue
+
+            tar_name = result["encrypted_name"]
+            self.journal.update(path, LOCKED, tar_name=tar_name)
+            tar_path = os.path.join(self.output_dir, f"{tar_name}.tar")
+            os.replace(result["tar_path"], tar_path)
+            self._finish(path, tar_name)
+            self._emit({"path": path, "ok": True, **result, "tar_path": tar_path})
+
+    def _next_timeout(self) -> float:
+        now = time.monotonic()
+        deadlines = [self.rescan_at - now]
+        if self.pending:
+            deadlines.append(min(d for _, _, d in self.pending.values()) - now)
+        if self.running or self.ready:
+            deadlines.append(0.1)
+        return min(max(0.0, min(deadlines)), 1.0)
+
+    def _start_inotify(self):
+        if self.poll or not sys.platform.startswith("linux"):
+            return None
+        try:
+            inotify = _Inotify()
+        except Exception:
+            # No inotify in this libc, or the instance limit is reached.
+            return None
+        try:
+            for directory in _directories(self.directory, self._skip()):
+                inotify.add(directory)
+        except OSError:
+            # Usually the inotify watch limit; scanning still works.
+            inotify.close()
+            return None
+        return inotify
+
+    def run(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        os.makedirs(self.staging_dir, exist_ok=True)
+        with (
+            WatchJournal(self.journal_path) as self.journal,
+            CiphertextLog(self.log_path) as self.log,
+            ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_worker_init
+            ) as pool,
+        ):
+            self._recover()
+            inotify = self._start_inotify()
+            self._emit(
+                {"watching": self.directory, "mode": "inotify" if inotify else "poll"}
+            )
+            rescan_every = RESCAN_INTERVAL if inotify else self.interval
+            try:
+                while not self.stopping:
+                    now = time.monotonic()
+                    if now >= self.rescan_at:
+                        self.rescan_at = now + rescan_every
+                        self._scan_all()
+
+                    timeout = self._next_timeout()
+                    if inotify:
+                        files, directories, overflow = inotify.read(timeout)
+                        for path in files:
+                            if not is_pylock_output(os.path.basename(path)):
+                                self._touch(path)
+                        for directory in directories:
+                            if is_pylock_output(os.path.basename(directory)):
+                                continue
+                            try:
+                                inotify.add(directory)
+                            except OSError:
+                                overflow = True
+                            # Files may have landed before the watch existed.
+                            for path, st in _scan(directory, self._skip()):
+                                self._touch(path, st)
+                        if overflow:
+                            self.rescan_at = time.monotonic()
+                    else:
+                        time.sleep(timeout)
+
+                    self._settled()
+                    self._submit(pool)
+                    self._collect()
+            except KeyboardInterrupt:
+                self.stopping = True
+                raise
+            finally:
+                if inotify:
+                    inotify.close()
+                # Let running locks finish; anything still claimed when the
+                # pool is gone shows up as interrupted on the next start.
+                for future in self.running.values():
+                    try:
+                        future.result()
+                    except BaseException:
+                        pass
+                self._collect()